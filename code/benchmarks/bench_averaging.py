@@ -0,0 +1,73 @@
+# Cost and memory of averaging a window of samples in the averaging measurement modules - running accumulators
+# (gen_sample.Averager) against keeping every sample and averaging with statistics.mean / statistics.mode as before.
+#
+# Samples are sized like the HOBUT meter (17 numeric variables) with a timestamp string.
+#
+# run from the code directory:
+#   python -m benchmarks.bench_averaging
+import statistics
+import timeit
+import tracemalloc
+
+from core.measurement_modules import gen_sample
+
+
+def make_samples(n_samples, n_variables=17):
+    return [{**{f"var_{v}": 230.0 + (i * 7 + v) % 13 * 0.1 for v in range(n_variables)}, "timestamp": "on"}
+            for i in range(n_samples)]
+
+
+def list_average(samples):
+    # the previous modules - samples kept in a list until the window closes, then averaged by __average_variables
+    kept = []
+    for sample in samples:
+        kept.append(sample)
+    aggregated_dict = {}
+    for entry in kept:
+        for k, v in entry.items():
+            aggregated_dict.setdefault(k, []).append(v)
+    out = {}
+    for k, v in aggregated_dict.items():
+        try:
+            out[k] = statistics.mean(v)
+        except TypeError:
+            out[k] = statistics.mode(v)
+    return out
+
+
+def running_average(samples):
+    averager = gen_sample.Averager()
+    for sample in samples:
+        averager.add(sample)
+    return averager.result()
+
+
+def measure(function, samples, repeat=5):
+    elapsed = min(timeit.repeat(lambda: function(samples), number=1, repeat=repeat))
+
+    # samples are made one at a time, as they are by the sensing stacks, so only what is kept counts towards the peak
+    tracemalloc.start()
+    function(dict(sample) for sample in samples)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def run(n_samples):
+    samples = make_samples(n_samples)
+    old, new = list_average(samples), running_average(samples)
+    assert old["timestamp"] == new["timestamp"]
+    assert all(abs(old[k] - new[k]) < 1e-9 for k in old if k != "timestamp")
+
+    old_time, old_memory = measure(list_average, samples)
+    new_time, new_memory = measure(running_average, samples)
+    return old_time, new_time, old_memory, new_memory
+
+
+if __name__ == "__main__":
+    print(f"{'n_samples':>9} {'lists (ms)':>11} {'running (ms)':>13} {'speedup':>8} {'lists (kB)':>11} "
+          f"{'running (kB)':>13}")
+    for n_samples in (10, 100, 1000, 10000):
+        old_time, new_time, old_memory, new_memory = run(n_samples)
+        print(f"{n_samples:>9} {old_time * 1e3:>11.2f} {new_time * 1e3:>13.2f} {old_time / new_time:>7.1f}x "
+              f"{old_memory / 1e3:>11.1f} {new_memory / 1e3:>13.1f}")
@@ -0,0 +1,82 @@
+# Cost of moving a sample through a sensing stack's pipeline, constants and prefix - the blackboard updated in place
+# (Pipeline.execute & SensingStack) against copying it after every step as before.
+#
+# Devices are sized like the SEN55 (8 variables) and HOBUT meter (17 variables), with a pipeline of 3 steps that are not
+# fused (see core.pipeline) and with / without constants and a prefix.
+#
+# run from the code directory:
+#   python -m benchmarks.bench_blackboard
+import logging
+import timeit
+
+import core.pipeline
+import core.sensing_stack
+import core.calculation_modules.gen_constants as gen_constants
+import core.calculation_modules.gen_pt_rtd as gen_pt_rtd
+
+logging.basicConfig(level=logging.ERROR)
+
+
+class Device:
+    def __init__(self, n_variables):
+        self.sample_dict = {f"var_{i}": 100.0 + i for i in range(n_variables)}
+
+    def initialise(self, interface):
+        pass
+
+    def sample(self):
+        return dict(self.sample_dict)
+
+
+def copying_execute(stack, sample_dict):
+    # the previous Pipeline.execute and SensingStack output handling
+    variables_dict = {**sample_dict}
+    for calc_module in stack.pipeline.contents:
+        output = calc_module.calculate(variables_dict)
+        variables_dict = {**variables_dict, **output}
+    if stack.constants is not None:
+        variables_dict = {**stack.constants, **variables_dict}
+    if stack.prefix is not None:
+        return {stack.prefix + key: value for key, value in variables_dict.items()}
+    return variables_dict
+
+
+def make_stack(n_variables, prefix, constants):
+    calculations = {
+        'default': gen_constants.DefaultConstant({'value': 0}, {'variable': 'status'}),
+        'rtd': gen_pt_rtd.PT_RTD({}, {'resistance': 'var_0', 'temperature': 'temperature'}),
+        'rename': gen_constants.RenameDefaultConstant({'value': 1}, {'original_variable': 'var_1',
+                                                                     'new_variable': 'flag'}),
+    }
+    pipeline = core.pipeline.Pipeline(['default', 'rtd', 'rename'])
+    pipeline.initialise(calculations)
+    config = {'device': 'device', 'pipeline': 'pipeline', 'offload': False, 'circuit_breaker': {'enabled': False}}
+    if prefix:
+        config['prefix'] = "line_1_"
+    if constants:
+        config['constants'] = {'machine': "Machine_1", 'phase': "three"}
+    stack = core.sensing_stack.SensingStack(config)
+    stack.initialise({'device': Device(n_variables)}, {'pipeline': pipeline})
+    return stack
+
+
+def run(n_variables, prefix, constants, repeat=5, number=20000):
+    stack = make_stack(n_variables, prefix, constants)
+    sample = stack.device.sample
+
+    def in_place_execute():
+        return stack.add_constants_and_prefix(stack.pipeline.execute(sample()))
+
+    assert in_place_execute() == copying_execute(stack, sample())
+    old = min(timeit.repeat(lambda: copying_execute(stack, sample()), number=number, repeat=repeat))
+    new = min(timeit.repeat(in_place_execute, number=number, repeat=repeat))
+    return old / number, new / number
+
+
+if __name__ == "__main__":
+    print(f"{'variables':>9} {'prefix':>7} {'constants':>10} {'copying (us)':>13} {'in place (us)':>14} {'speedup':>8}")
+    for n_variables in (8, 17):
+        for prefix, constants in ((False, False), (False, True), (True, True)):
+            old, new = run(n_variables, prefix, constants)
+            print(f"{n_variables:>9} {str(prefix):>7} {str(constants):>10} {old * 1e6:>13.2f} {new * 1e6:>14.2f} "
+                  f"{old / new:>7.1f}x")
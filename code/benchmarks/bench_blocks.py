@@ -0,0 +1,60 @@
+# Per reading cost of a current clamp pipeline (VoltageClamp > MultiplierOffset > TrueRMS) run once per reading on
+# single values against once per block on NumPy blocks of readings (core.blocks).
+#
+# run from the code directory:
+#   python -m benchmarks.bench_blocks
+import array
+import logging
+import math
+import timeit
+
+import core.pipeline
+import core.calculation_modules.gen_current_clamp as gen_current_clamp
+import core.calculation_modules.gen_calibrate as gen_calibrate
+import core.calculation_modules.gen_waveform as gen_waveform
+
+logging.basicConfig(level=logging.ERROR)
+
+
+def make_pipeline(reduce):
+    calculations = {
+        'clamp': gen_current_clamp.VoltageClamp({'nominal_voltage': 1, 'nominal_current': 20},
+                                                {'voltage_out': 'v_clamp', 'current_in': 'current'}),
+        'calibrate': gen_calibrate.MultiplierOffset({'multiplier': 1.02, 'offset': -0.01}, {'raw_value': 'current'}),
+        'rms': gen_waveform.TrueRMS({}, {'var_in': 'current', 'var_out': 'current_rms'}),
+    }
+    pipeline = core.pipeline.Pipeline(['clamp', 'calibrate', 'rms'] if reduce else ['clamp', 'calibrate'])
+    pipeline.initialise(calculations)
+    return pipeline
+
+
+def run(n_readings, repeat=5):
+    readings = array.array('d', (0.5 * math.sin(2 * math.pi * i / 17.2) for i in range(n_readings)))
+
+    scalar_pipeline = make_pipeline(reduce=False)
+
+    def per_reading():
+        # as the pipeline runs today - one pass per reading, RMS accumulated in Python
+        total = 0
+        for reading in readings:
+            current = scalar_pipeline.execute({'v_clamp': reading})['current']
+            total += current * current
+        return math.sqrt(total / n_readings)
+
+    block_pipeline = make_pipeline(reduce=True)
+
+    def per_block():
+        return block_pipeline.execute({'v_clamp': readings})['current_rms']
+
+    assert math.isclose(per_reading(), per_block(), rel_tol=1e-9)
+    number = max(1, 20000 // n_readings)
+    scalar = min(timeit.repeat(per_reading, number=number, repeat=repeat)) / number / n_readings
+    block = min(timeit.repeat(per_block, number=number * 20, repeat=repeat)) / (number * 20) / n_readings
+    return scalar, block
+
+
+if __name__ == "__main__":
+    print(f"{'readings':>9} {'single values (ns/reading)':>27} {'blocks (ns/reading)':>20} {'speedup':>8}")
+    for n_readings in (10, 172, 1000, 10000):
+        scalar, block = run(n_readings)
+        print(f"{n_readings:>9} {scalar * 1e9:>27.0f} {block * 1e9:>20.1f} {scalar / block:>7.0f}x")
@@ -0,0 +1,201 @@
+# End to end cost of the measure building block - full BuildingBlockFramework configs of 1 to 1000 sensing stacks built
+# from the mock devices, the Dummy interface and a calibrate + power calculation pipeline per stack, merged into one
+# measurement (MultiSampleMerged) and rendered into one output message.
+#
+# Cycles are run back to back (the scheduler's delay is ignored) and messages are dropped instead of sent to mqtt_out.
+# Stacks set offload = false so that the figures are the framework's own cost rather than the worker thread hand off.
+#
+# Reports for each size:
+#  - samples/s   - sensing stacks sampled per second
+#  - stage costs - mean time per cycle in sampling, pipelines and output (from core.metrics)
+#  - build       - time taken to load, build and initialise the framework
+#  - memory      - memory allocated per stack while building and initialising the framework (tracemalloc)
+#
+# Baselines are kept in benchmarks/baselines/end_to_end.json, keyed by machine and python version (e.g.
+# "aarch64 python 3.13") as the figures mean nothing on another platform. --check fails (exit code 1) when samples/s at
+# any size drops more than --threshold below the baseline for the platform it runs on, and exits with code 2 when there
+# is no baseline for that platform rather than comparing against another. --update records the baselines for the
+# platform it runs on - the committed x86_64 ones are a local example, record the target's on the target.
+#
+# run from the code directory:
+#   python -m benchmarks.bench_end_to_end [--sizes 1 10 100 1000] [--check | --update] [--threshold 0.2]
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import measure
+
+logging.basicConfig(level=logging.ERROR)
+
+SIZES = (1, 10, 100, 1000)
+MIN_TIME = 1  # seconds spent running cycles at each size
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baselines", "end_to_end.json")
+
+
+def make_config(n_stacks):
+    device, calculation, pipelines, stacks, message_spec = {}, {}, {}, [], {"timestamp": "$.timestamp"}
+    for i in range(n_stacks):
+        if i % 2:
+            device[f"meter_{i}"] = {'module': 'testing', 'class': 'MockDeviceRandom', 'interface': 'dummy',
+                                    'config': {'min': 0, 'max': 5}, 'variables': {'variable': f"raw_{i}"}}
+        else:
+            device[f"meter_{i}"] = {'module': 'testing', 'class': 'MockDeviceConstant', 'interface': 'dummy',
+                                    'config': {'value': 2.5}, 'variables': {'variable': f"raw_{i}"}}
+        calculation[f"calibrate_{i}"] = {'module': 'gen_calibrate', 'class': 'MultiplierOffset',
+                                         'config': {'multiplier': 4, 'offset': 0.1},
+                                         'variables': {'raw_value': f"raw_{i}", 'calibrated_value': f"current_{i}"}}
+        calculation[f"power_{i}"] = {'module': 'gen_electrical', 'class': 'PowerToCurrent',
+                                     'config': {'phase_voltage': 230},
+                                     'variables': {'rms_current_out': f"current_{i}", 'power_in': f"power_{i}"}}
+        pipelines[f"meter_{i}"] = [f"calibrate_{i}", f"power_{i}"]
+        stacks.append({'device': f"meter_{i}", 'pipeline': f"meter_{i}", 'offload': False})
+        message_spec[f"machine_{i}.current"] = f"$.current_{i}"
+        message_spec[f"machine_{i}.power"] = f"$.power_{i}"
+
+    return {
+        'interface': {'dummy': {'module': 'testing', 'class': 'Dummy'}},
+        'device': device,
+        'calculation': calculation,
+        'pipelines': pipelines,
+        'measurement': {'module': 'gen_sample', 'class': 'MultiSampleMerged', 'config': {'period': 3600},
+                        'sensing_stacks': stacks},
+        'output': {'power': {'topic': 'power_monitoring/site', 'message_spec': message_spec}},
+        'metrics': {'enabled': True, 'mqtt': False},
+    }
+
+
+async def build(config):
+    framework = measure.BuildingBlockFramework(config, {})
+    framework.send = lambda output: None
+    framework.load_modules()
+    framework.create_pipelines()
+    framework.create_sensing_stacks()
+    framework.create_output_templates()
+    await framework.initialise_interfaces()
+    framework.initialise_devices()
+    framework.initialise_pipelines()
+    framework.initialise_sensing_stacks()
+    framework.initialise_measurements()
+    return framework
+
+
+async def run_cycles(n_stacks):
+    config = make_config(n_stacks)
+    tracemalloc.start()
+    start = time.perf_counter()
+    framework = await build(config)
+    build_time = time.perf_counter() - start
+    allocated, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.collect()  # garbage left by building the framework is not counted against the cycles
+
+    name = measure.DEFAULT_MEASUREMENT
+    module = framework.measurement_modules[name]
+    await framework.measurement_cycle(name, module)  # warm up
+    for histogram in framework.metrics.histograms.values():
+        histogram.__init__()
+
+    cycles = 0
+    start = time.perf_counter()
+    while True:
+        await framework.measurement_cycle(name, module)
+        cycles += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_TIME and cycles >= 3:
+            break
+
+    stages = {}
+    for (stage, _label), histogram in framework.metrics.histograms.items():
+        stages[stage] = stages.get(stage, 0) + histogram.sum / cycles
+    return {
+        'samples_per_s': n_stacks * cycles / elapsed,
+        'cycle_ms': 1000 * elapsed / cycles,
+        'sample_ms': 1000 * stages.get('sample', 0),
+        'pipeline_ms': 1000 * stages.get('pipeline', 0),
+        'output_ms': 1000 * stages.get('output', 0),
+        'build_s': build_time,
+        'memory_per_stack_kb': allocated / n_stacks / 1024,
+    }
+
+
+def run(sizes):
+    results = {}
+    for n_stacks in sizes:
+        results[str(n_stacks)] = asyncio.run(run_cycles(n_stacks))
+    return results
+
+
+def platform_key():
+    return f"{platform.machine()} python {'.'.join(platform.python_version_tuple()[:2])}"
+
+
+def load_baselines():
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE) as f:
+        return json.load(f)
+
+
+def check(results, baselines, threshold):
+    """Returns a description of each size whose samples/s dropped more than threshold below its baseline"""
+    regressions = []
+    for size, result in results.items():
+        baseline = baselines.get(size)
+        if baseline is None:
+            continue
+        limit = baseline['samples_per_s'] * (1 - threshold)
+        if result['samples_per_s'] < limit:
+            regressions.append(f"{size} stacks: {result['samples_per_s']:.0f} samples/s - "
+                               f"baseline {baseline['samples_per_s']:.0f}, limit {limit:.0f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End to end benchmark of the measure building block")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="Numbers of sensing stacks")
+    parser.add_argument("--check", action="store_true", help="Compare samples/s against the stored baselines")
+    parser.add_argument("--update", action="store_true", help="Store the results as the new baselines")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed drop below the baseline (fraction)")
+    args = parser.parse_args()
+
+    results = run(args.sizes)
+    print(f"{'stacks':>7} {'samples/s':>11} {'cycle (ms)':>11} {'sample (ms)':>12} {'pipeline (ms)':>14} "
+          f"{'output (ms)':>12} {'build (s)':>10} {'memory/stack (kB)':>18}")
+    for size, result in results.items():
+        print(f"{size:>7} {result['samples_per_s']:>11.0f} {result['cycle_ms']:>11.3f} {result['sample_ms']:>12.3f} "
+              f"{result['pipeline_ms']:>14.3f} {result['output_ms']:>12.3f} {result['build_s']:>10.2f} "
+              f"{result['memory_per_stack_kb']:>18.1f}")
+
+    key = platform_key()
+    if args.update:
+        all_baselines = load_baselines()
+        all_baselines[key] = {'python': platform.python_version(), 'machine': platform.machine(), 'results': results}
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(all_baselines, f, indent=4)
+            f.write("\n")
+        print(f"Baselines for {key} written to {BASELINE_FILE}")
+
+    if args.check:
+        all_baselines = load_baselines()
+        if key not in all_baselines:
+            print(f"No baselines for {key} (have: {', '.join(sorted(all_baselines)) or 'none'}) - not compared, "
+                  f"record them with --update on this platform")
+            sys.exit(2)
+        regressions = check(results, all_baselines[key]['results'], args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {100 * args.threshold:.0f}% of the baselines")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Overhead of [metrics] on a measurement cycle - a mock device sampled through a short pipeline and rendered into two
+# outputs, run with metrics disabled and enabled.
+#
+# The mock device returns immediately, so the overhead is shown against the cycle here (the worst case) and against the
+# measurement period, which is what a real device's cycle is bound by.
+#
+# run from the code directory:
+#   python -m benchmarks.bench_metrics
+import asyncio
+import logging
+import time
+
+import measure
+
+logging.basicConfig(level=logging.ERROR)
+
+N_CYCLES = 20000
+PERIODS = (1, 0.1, 0.01)
+
+CONFIG = {
+    'interface': {'dummy': {'module': 'testing', 'class': 'Dummy'}},
+    'device': {
+        'meter': {'module': 'testing', 'class': 'MockDeviceConstant', 'interface': 'dummy',
+                  'config': {'value': 12.5}, 'variables': {'variable': 'current'}},
+    },
+    'calculation': {
+        'amplifier': {'module': 'gen_amplifier', 'class': 'GenAmplifier',
+                      'config': {'gain': 2}, 'variables': {'amp_input': 'current'}},
+    },
+    'pipelines': {'meter': ['amplifier']},
+    'measurement': {'module': 'gen_sample', 'class': 'SingleSample', 'config': {'period': 1},
+                    'sensing_stacks': [{'device': 'meter', 'pipeline': 'meter'}]},
+    'output': {
+        'power': {'topic': 'power/{{machine}}',
+                  'message_spec': {'timestamp': '$.timestamp', 'machine': '#Machine_1', 'current': '$.current'}},
+        'raw': {'topic': 'raw', 'message_spec': {'timestamp': '$.timestamp', 'current': '$.current'}},
+    },
+}
+
+
+def create_framework(metrics_enabled):
+    framework = measure.BuildingBlockFramework({**CONFIG, 'metrics': {'enabled': metrics_enabled, 'mqtt': False}}, {})
+    framework.send = lambda output: None
+    framework.load_modules()
+    framework.create_pipelines()
+    framework.create_sensing_stacks()
+    framework.create_output_templates()
+    framework.initialise_devices()
+    framework.initialise_pipelines()
+    framework.initialise_sensing_stacks()
+    framework.initialise_measurements()
+    return framework
+
+
+async def time_cycles(framework):
+    module = framework.measurement_modules[measure.DEFAULT_MEASUREMENT]
+    start = time.perf_counter()
+    for _ in range(N_CYCLES):
+        await framework.measurement_cycle(measure.DEFAULT_MEASUREMENT, module)
+    return (time.perf_counter() - start) / N_CYCLES
+
+
+async def run(repeat=7):
+    # rounds alternate between the two so that both see the same machine load
+    frameworks = {enabled: create_framework(enabled) for enabled in (False, True)}
+    best = {False: None, True: None}
+    for _ in range(repeat):
+        for enabled, framework in frameworks.items():
+            elapsed = await time_cycles(framework)
+            best[enabled] = elapsed if best[enabled] is None else min(best[enabled], elapsed)
+    return best[False], best[True]
+
+
+if __name__ == "__main__":
+    disabled, enabled = asyncio.run(run())
+    overhead = enabled - disabled
+    print(f"cycle without metrics: {disabled * 1e6:.1f}us  with metrics: {enabled * 1e6:.1f}us  "
+          f"overhead: {overhead * 1e6:.1f}us ({100 * overhead / disabled:.1f}% of the mock cycle)")
+    for period in PERIODS:
+        print(f"  overhead at period = {period}s: {100 * overhead / period:.4f}%")
@@ -0,0 +1,105 @@
+# Publish throughput of MQTTServiceWrapper against a local broker stand-in.
+#
+# The stand-in accepts a single MQTT 3.1.1 client, acknowledges CONNECT, PINGREQ and QoS 1 PUBLISH packets and counts
+# the messages it receives. Messages are pushed into the wrapper over zmq as measure would.
+#
+# run from the code directory:
+#   python -m benchmarks.bench_mqtt_publish
+import json
+import logging
+import socket
+import threading
+import time
+
+import zmq
+
+import mqtt_out
+
+N_MESSAGES = 20000
+PAYLOAD = {"timestamp": "2024-01-01T00:00:00+00:00", "machine": "Machine_1", "current": 12.345}
+
+logging.basicConfig(level=logging.WARNING)
+
+
+class BrokerStandIn(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        self.received = 0
+        self.done = threading.Event()
+        self.target = None
+
+    def run(self):
+        connection, _ = self.server.accept()
+        stream = connection.makefile('rb')
+        while True:
+            header = stream.read(1)
+            if not header:
+                return
+            length, multiplier = 0, 1
+            while True:
+                byte = stream.read(1)[0]
+                length += (byte & 0x7F) * multiplier
+                multiplier *= 128
+                if not byte & 0x80:
+                    break
+            body = stream.read(length)
+            packet_type = header[0] >> 4
+            if packet_type == 1:  # CONNECT
+                connection.sendall(b"\x20\x02\x00\x00")
+            elif packet_type == 3:  # PUBLISH
+                qos = (header[0] >> 1) & 0x03
+                if qos:
+                    topic_length = int.from_bytes(body[0:2], "big")
+                    mid = body[2 + topic_length:4 + topic_length]
+                    connection.sendall(b"\x40\x02" + mid)
+                self.received += 1
+                if self.received == self.target:
+                    self.done.set()
+            elif packet_type == 12:  # PINGREQ
+                connection.sendall(b"\xd0\x00")
+            elif packet_type == 14:  # DISCONNECT
+                connection.close()
+                return
+
+
+def run(qos, max_inflight=100):
+    broker = BrokerStandIn()
+    broker.target = N_MESSAGES
+    broker.start()
+
+    address = "tcp://127.0.0.1:4999"
+    config = {'mqtt': {'broker': "127.0.0.1", 'port': broker.port, 'qos': qos, 'max_inflight': max_inflight}}
+    wrapper = mqtt_out.MQTTServiceWrapper(config, {"type": zmq.PULL, "address": address, "bind": False})
+    wrapper.stats.interval = 3600
+
+    push = mqtt_out.context.socket(zmq.PUSH)
+    push.bind(address)
+    result = {}
+
+    def producer():
+        time.sleep(0.5)  # let the wrapper connect
+        message = json.dumps({'topic': "bench/{{machine}}", 'payload': PAYLOAD}).encode()
+        start = time.perf_counter()
+        for _ in range(N_MESSAGES):
+            push.send(message)
+        broker.done.wait(60)
+        result['elapsed'] = time.perf_counter() - start
+        mqtt_out.terminate_flag = True
+
+    mqtt_out.terminate_flag = False
+    threading.Thread(target=producer, daemon=True).start()
+    wrapper.run()
+    push.close(linger=0)
+
+    stats = wrapper.stats
+    mean_latency = stats.total / stats.count if stats.count else 0
+    return broker.received / result['elapsed'], mean_latency, stats.max
+
+
+if __name__ == "__main__":
+    print(f"{'qos':>4} {'publishes/s':>12} {'mean latency (ms)':>18} {'max latency (ms)':>17}")
+    for qos in (0, 1):
+        rate, mean_latency, max_latency = run(qos)
+        print(f"{qos:>4} {rate:>12.0f} {mean_latency * 1000:>18.2f} {max_latency * 1000:>17.2f}")
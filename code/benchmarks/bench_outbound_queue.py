@@ -0,0 +1,58 @@
+# Sustained enqueue / dequeue throughput of the persistent outbound queue used by mqtt_out for store and forward.
+#
+# run from the code directory:
+#   python -m benchmarks.bench_outbound_queue
+import json
+import os
+import tempfile
+import time
+
+import core.outbound_queue
+
+N_MESSAGES = 20000
+PAYLOAD = json.dumps({"timestamp": "2024-01-01T00:00:00+00:00", "machine": "Machine_1", "current": 12.345,
+                      "power": 2839.35, "phase": "single"})
+
+
+def rate(n, start):
+    return n / (time.perf_counter() - start)
+
+
+def run(directory, max_messages=N_MESSAGES * 2):
+    queue = core.outbound_queue.PersistentQueue(os.path.join(directory, "queue.sqlite"), max_messages)
+    results = {}
+
+    start = time.perf_counter()
+    for _ in range(N_MESSAGES):
+        queue.put("power_monitoring/Machine_1", PAYLOAD)
+    results["enqueue (one per transaction)"] = rate(N_MESSAGES, start)
+
+    start = time.perf_counter()
+    while len(queue):
+        batch = queue.peek(100)
+        queue.remove_up_to(batch[-1][0])
+    results["dequeue (batches of 100)"] = rate(N_MESSAGES, start)
+
+    start = time.perf_counter()
+    for _ in range(N_MESSAGES // 100):
+        queue.put_many([("power_monitoring/Machine_1", PAYLOAD)] * 100)
+    results["enqueue (batches of 100)"] = rate(N_MESSAGES, start)
+
+    # sustained mixed load - the queue at its bound, evicting on every insert, while draining
+    queue.max_messages = len(queue)
+    start = time.perf_counter()
+    for i in range(N_MESSAGES):
+        queue.put("power_monitoring/Machine_1", PAYLOAD)
+        if i % 10 == 0:
+            batch = queue.peek(5)
+            queue.remove_up_to(batch[-1][0])
+    results["mixed at bound (eviction + drain)"] = rate(N_MESSAGES, start)
+
+    queue.close()
+    return results
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        for name, messages_per_second in run(directory).items():
+            print(f"{name:>36}: {messages_per_second:>10.0f} msg/s")
@@ -0,0 +1,53 @@
+# Compares building output messages with generate_json_path_message (spec parsed per call)
+# against a MessageTemplate compiled once from the same spec, and checks that from_flat_tree scales linearly with the
+# depth of the paths.
+#
+# run from the code directory:
+#   python -m benchmarks.bench_output
+import timeit
+import logging
+
+import core.output
+
+logging.basicConfig(level=logging.ERROR)
+
+
+def make_spec_and_dataset(n_leaves):
+    spec = {"timestamp": "$.timestamp", "machine": "#Machine_1"}
+    dataset = {"timestamp": "2024-01-01T00:00:00+00:00"}
+    for i in range(n_leaves - 2):
+        spec[f"group_{i % 4}.value_{i}"] = f"$.var_{i}"
+        dataset[f"var_{i}"] = i * 1.5
+    return spec, dataset
+
+
+def run(n_leaves, repeat=5):
+    spec, dataset = make_spec_and_dataset(n_leaves)
+    template = core.output.compile_json_path_message(spec)
+    assert template.render(dataset) == core.output.generate_json_path_message(dataset, spec)
+
+    number = max(1, 5000 // n_leaves)
+    per_spec = min(timeit.repeat(lambda: core.output.generate_json_path_message(dataset, spec),
+                                 number=number, repeat=repeat)) / number
+    compiled = min(timeit.repeat(lambda: template.render(dataset), number=number, repeat=repeat)) / number
+    return per_spec, compiled
+
+
+def flat_tree_build_time(depth, repeat=5):
+    prefix = ".".join(f"l{d}" for d in range(depth))
+    flat = {f"{prefix}.ch.[{i}]": i for i in range(2000)}
+    return min(timeit.repeat(lambda: core.output.from_flat_tree(flat), number=1, repeat=repeat))
+
+
+if __name__ == "__main__":
+    print(f"{'leaves':>8} {'per call (us)':>15} {'compiled (us)':>15} {'speedup':>8}")
+    for n_leaves in (5, 50, 500):
+        per_spec, compiled = run(n_leaves)
+        print(f"{n_leaves:>8} {per_spec * 1e6:>15.1f} {compiled * 1e6:>15.1f} {per_spec / compiled:>7.1f}x")
+
+    # 8x the depth should cost ~8x - a quadratic implementation costs ~64x
+    print(f"\n{'depth':>8} {'from_flat_tree (ms)':>20}")
+    times = {depth: flat_tree_build_time(depth) for depth in (10, 80)}
+    for depth, build_time in times.items():
+        print(f"{depth:>8} {build_time * 1e3:>20.2f}")
+    print(f"80 / 10: {times[80] / times[10]:.1f}x")
@@ -0,0 +1,88 @@
+# Throughput of the PUSH/PULL hop between the measure and mqtt_out building blocks, from a payload dict in measure to
+# the (topic, payload) pair that mqtt_out hands to the MQTT client.
+#
+# json      - send_json in measure, json.loads + topic render + json.dumps in mqtt_out
+# multipart - topic rendered and payload serialised once in measure, published as received by mqtt_out
+#
+# The sender runs in its own process as it does in the service module, so the figure is the rate of the slower side.
+#
+# run from the code directory:
+#   python -m benchmarks.bench_transport
+import json
+import logging
+import multiprocessing
+import time
+
+import zmq
+
+import core.serialisation
+import core.topic_template
+
+logging.basicConfig(level=logging.ERROR)
+
+N_MESSAGES = 50000
+TOPIC = "power_monitoring/{{machine}}"
+PAYLOAD = {"timestamp": "2024-01-01T00:00:00+00:00", "machine": "Machine_1", "phase": "single",
+           "current": 12.345, "voltage": 230.1, "power": 2839.35, "power_factor": 0.98,
+           "harmonics": [1.0, 0.12, 0.05, 0.02, 0.01]}
+
+
+def sender(address, mode, serialiser):
+    context = zmq.Context()  # the parent's context is not usable after fork
+    socket = context.socket(zmq.PUSH)
+    socket.connect(address)
+    serialise = core.serialisation.get_serialiser(serialiser)
+    topics = core.topic_template.TopicCache()
+
+    socket.send(b"start")
+    for _ in range(N_MESSAGES):
+        payload = dict(PAYLOAD)
+        if mode == "multipart":
+            socket.send_multipart([topics.render(TOPIC, payload).encode(), serialise(payload)])
+        else:
+            socket.send_json({'topic': TOPIC, 'payload': payload})
+    socket.close(linger=-1)
+    context.term()
+
+
+def receive(socket, topics):
+    # mirrors MQTTServiceWrapper.receive
+    frames = socket.recv_multipart()
+    if len(frames) == 2:
+        return topics.prefix(frames[0].decode()), frames[1]
+    msg_json = json.loads(frames[0])
+    return topics.render(msg_json['topic'], msg_json['payload']), json.dumps(msg_json['payload'])
+
+
+def run(mode, serialiser):
+    socket = zmq.Context.instance().socket(zmq.PULL)
+    port = socket.bind_to_random_port("tcp://127.0.0.1")
+    topics = core.topic_template.TopicCache("site/")
+
+    process = multiprocessing.Process(target=sender, args=(f"tcp://127.0.0.1:{port}", mode, serialiser))
+    process.start()
+    socket.recv()
+    start = time.perf_counter()
+    size = 0
+    for _ in range(N_MESSAGES):
+        _topic, payload = receive(socket, topics)
+        size += len(payload)
+    elapsed = time.perf_counter() - start
+    process.join()
+    socket.close()
+    return N_MESSAGES / elapsed, size / N_MESSAGES
+
+
+if __name__ == "__main__":
+    cases = [("json", "json"), ("multipart", "json")]
+    if core.serialisation.orjson is not None:
+        cases.append(("multipart", "orjson"))
+    if core.serialisation.msgpack is not None:
+        cases.append(("multipart", "msgpack"))
+
+    baseline = None
+    for mode, serialiser in cases:
+        messages_per_second, payload_size = run(mode, serialiser)
+        baseline = baseline or messages_per_second
+        print(f"{mode:>9} / {serialiser:<7}: {messages_per_second:>9.0f} msg/s ({messages_per_second / baseline:.1f}x)"
+              f"  payload {payload_size:.0f} bytes")
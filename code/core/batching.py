@@ -0,0 +1,106 @@
+import logging
+import time
+
+import core.output
+import core.topic_template
+
+logger = logging.getLogger(__name__)
+
+
+# Output batching
+# Collects the payloads generated for an output into a single message per topic, reducing the number of messages
+# passed to mqtt_out and published to the broker.
+# As the topic template is usually filled in from the payload, it is rendered here so that payloads bound for
+# different topics are kept in separate batches. The batched message is sent on the rendered topic.
+#
+# A batch is flushed when it holds <size> payloads, when <period> seconds have passed since its first payload,
+# or when the service module shuts down.
+#
+# layout = "row"     - payload is a list of the individual payloads
+#                      [{"timestamp":"t0","current":1.0},{"timestamp":"t1","current":1.1}]
+# layout = "column"  - payload has the structure of the individual payloads with a list of values at each leaf,
+#                      plus a shared timestamp vector (if the payload does not already have a top level timestamp)
+#                      {"timestamp":["t0","t1"],"current":[1.0,1.1]}
+
+class OutputBatcher:
+    LAYOUTS = ("row", "column")
+
+    def __init__(self, config, clock=time.monotonic):
+        self.size = config.get('size')
+        self.period = config.get('period')
+        self.layout = config.get('layout', 'row')
+        if self.layout not in self.LAYOUTS:
+            logger.warning(f"Unknown batch layout '{self.layout}' - using row")
+            self.layout = 'row'
+        if self.size is None and self.period is None:
+            logger.warning("Batch has neither size nor period set - batches will contain a single payload")
+
+        self.clock = clock
+        self.batches = {}
+        self.topics = core.topic_template.TopicCache()
+
+    def add(self, topic_template, payload, timestamp):
+        topic = self.topics.render(topic_template, payload) if payload is not None else topic_template
+        batch = self.batches.get(topic)
+        if batch is None:
+            batch = self.batches[topic] = Batch(self.clock())
+        batch.add(payload, timestamp)
+
+        if (self.size is None and self.period is None) or (self.size is not None and len(batch) >= self.size):
+            return [self.__flush(topic)]
+        return []
+
+    def flush_due(self):
+        now = self.clock()
+        return [self.__flush(topic) for topic, batch in list(self.batches.items())
+                if self.period is not None and now - batch.started >= self.period]
+
+    def flush_all(self):
+        return [self.__flush(topic) for topic in list(self.batches.keys())]
+
+    def next_due(self):
+        if self.period is None or not self.batches:
+            return None
+        return min(batch.started for batch in self.batches.values()) + self.period
+
+    def __flush(self, topic):
+        batch = self.batches.pop(topic)
+        if self.layout == 'column':
+            payload = batch.as_columns()
+        else:
+            payload = batch.payloads
+        return {'topic': topic, 'payload': payload}
+
+
+class Batch:
+    def __init__(self, started):
+        self.started = started
+        self.payloads = []
+        self.timestamps = []
+
+    def __len__(self):
+        return len(self.payloads)
+
+    def add(self, payload, timestamp):
+        self.payloads.append(payload)
+        self.timestamps.append(timestamp)
+
+    def as_columns(self):
+        columns = {}
+        for index, payload in enumerate(self.payloads):
+            leaves = core.output.to_flat_tree(payload) if payload is not None else {}
+            for path, value in leaves.items():
+                column = columns.get(path)
+                if column is None:
+                    column = columns[path] = [None] * index
+                column.append(value)
+            for column in columns.values():
+                if len(column) <= index:
+                    column.append(None)
+
+        output = core.output.from_flat_tree(columns)
+        if output is None:
+            output = {}
+        if isinstance(output, dict) and 'timestamp' not in output:
+            output['timestamp'] = self.timestamps
+        return output
@@ -0,0 +1,29 @@
+import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Blocks
+# A blackboard variable can hold a block of readings (e.g. an ADS1115 burst) instead of a single value.
+# Blocks are NumPy arrays - the standard calculation modules pass their inputs through as_block and then apply the same
+# arithmetic to a block as to a single value, so one calculate() call processes the whole block element by element.
+# The reductions in calculation_modules/gen_waveform (true RMS, mean, peak, crest factor) turn a block into single
+# values, which must happen before the variables reach an output or an averaging measurement.
+#
+# array.array('d') blocks (as returned by devices) are viewed as NumPy arrays without copying, other array.arrays,
+# lists and tuples are converted. Single values are returned as they are.
+# NumPy is optional here (it is required by gen_waveform) - without it blocks are not converted and the calculations
+# only work on single values.
+
+
+def as_block(value):
+    """Returns value as a NumPy array if it is a block of readings, otherwise value unchanged"""
+    if numpy is None or not isinstance(value, (array.array, list, tuple)):
+        return value
+    if isinstance(value, array.array) and value.typecode == 'd':
+        return numpy.frombuffer(value, dtype=numpy.float64)
+    return numpy.asarray(value, dtype=numpy.float64)
+
@@ -1,5 +1,6 @@
 import traceback
 import logging
+import core.blocks
 
 logger = logging.getLogger(__name__)
 
@@ -10,10 +11,14 @@ class GenAmplifier:
         self.amp_input = variables.get('amp_input')
         self.amp_output = variables.get('amp_output', self.amp_input)
 
+    def affine(self):
+        # (input, output, a, b) for output = a * input + b - lets core.pipeline fuse this with neighbouring steps
+        return self.amp_output, self.amp_input, 1 / self.gain, 0
+
     def calculate(self, var_dict):
         try:
             # Get variable containing output value
-            value = var_dict[self.amp_output]
+            value = core.blocks.as_block(var_dict[self.amp_output])
             if value is not None:
                 # Divide by gain to get input value
                 value = value / self.gain
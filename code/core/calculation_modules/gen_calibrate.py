@@ -1,5 +1,6 @@
 import traceback
 import logging
+import core.blocks
 
 logger = logging.getLogger(__name__)
 
@@ -12,10 +13,13 @@ class MultiplierOffset:
         self.raw_value = variables.get('raw_value')
         self.calibrated_value = variables.get('calibrated_value', self.raw_value)
 
+    def affine(self):
+        return self.raw_value, self.calibrated_value, self.multiplier, self.offset
+
     def calculate(self, var_dict):
         try:
             # Get variable containing output value
-            value = var_dict[self.raw_value]
+            value = core.blocks.as_block(var_dict[self.raw_value])
             if value is not None:
                 # Divide by gain to get input value
                 out = value * self.multiplier + self.offset
@@ -36,10 +40,13 @@ class OffsetMultiplier:
         self.raw_value = variables.get('raw_value')
         self.calibrated_value = variables.get('calibrated_value', self.raw_value)
 
+    def affine(self):
+        return self.raw_value, self.calibrated_value, self.multiplier, self.offset * self.multiplier
+
     def calculate(self, var_dict):
         try:
             # Get variable containing output value
-            value = var_dict[self.raw_value]
+            value = core.blocks.as_block(var_dict[self.raw_value])
             if value is not None:
                 # Divide by gain to get input value
                 out = (value + self.offset) * self.multiplier
@@ -9,6 +9,9 @@ class DefaultConstant:
         self.value = config.get('value')
         self.variable = variables.get('variable')
 
+    def dependencies(self):
+        return [], [self.variable]
+
     def calculate(self, var_dict):
         try:
             var_dict.setdefault(self.variable, self.value)
@@ -23,6 +26,9 @@ class RenameDefaultConstant:
         self.original = variables.get('original_variable')
         self.new = variables.get('new_variable')
 
+    def dependencies(self):
+        return [self.original], [self.new]
+
     def calculate(self, var_dict):
         try:
             if self.original in var_dict:
@@ -37,6 +43,9 @@ class ConstantSet:
         self.config = config
         # self.variable = variables.get('variable')
 
+    def dependencies(self):
+        return [], list(self.config)
+
     def calculate(self, var_dict):
         for key, value in self.config.items():
             try:
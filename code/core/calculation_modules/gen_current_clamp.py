@@ -1,5 +1,6 @@
 import traceback
 import logging
+import core.blocks
 
 logger = logging.getLogger(__name__)
 
@@ -12,10 +13,13 @@ class VoltageClamp:
         self.output_voltage_variable = variables.get('voltage_out')
         self.input_current_variable = variables.get('current_in', 'current')
 
+    def affine(self):
+        return self.output_voltage_variable, self.input_current_variable, self.nominal_current / self.nominal_voltage, 0
+
     def calculate(self, var_dict):
         try:
             # Get clamp output voltage
-            v_clamp = var_dict[self.output_voltage_variable]
+            v_clamp = core.blocks.as_block(var_dict[self.output_voltage_variable])
             if v_clamp is not None:
                 # Multiply clamp output voltage by nominal ratio to get input current
                 current = (v_clamp / self.nominal_voltage) * self.nominal_current
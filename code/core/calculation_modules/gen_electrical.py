@@ -1,6 +1,7 @@
 import math
 import traceback
 import logging
+import core.blocks
 
 logger = logging.getLogger(__name__)
 
@@ -11,10 +12,13 @@ class RMSToPeak:
         self.var_in = variables.get('var_in')
         self.var_out = variables.get('var_out')
 
+    def affine(self):
+        return self.var_out, self.var_in, self.one_over_sqrt_2, 0
+
     def calculate(self, var_dict):
         try:
             # Get variable containing output value
-            value = var_dict[self.var_out]
+            value = core.blocks.as_block(var_dict[self.var_out])
             if value is not None:
                 # Divide by sqrt 2 to get RMS
                 value = value * self.one_over_sqrt_2
@@ -43,10 +47,13 @@ class PowerToCurrent:
         self.power_in = variables.get('power_in')
         self.rms_current_out = variables.get('rms_current_out')
 
+    def affine(self):
+        return self.rms_current_out, self.power_in, self.phases * self.phase_voltage, 0
+
     def calculate(self, var_dict):
         try:
             # Get variable containing output value
-            rms_line_current = var_dict[self.rms_current_out]
+            rms_line_current = core.blocks.as_block(var_dict[self.rms_current_out])
             if rms_line_current is not None:
                 # 3 Phase:
                 # Power = sqrt(3) * V_line * I_line
@@ -75,11 +82,14 @@ class PowerToVoltageCurrent:
         self.rms_current_out = variables.get('rms_current_out')
         self.rms_phase_voltage_out = variables.get('rms_phase_voltage_out')
 
+    def dependencies(self):
+        return [self.rms_current_out, self.rms_phase_voltage_out], [self.power_in]
+
     def calculate(self, var_dict):
         try:
             # Get variable containing output value
-            rms_line_current = var_dict[self.rms_current_out]
-            rms_phase_voltage = var_dict[self.rms_phase_voltage_out]
+            rms_line_current = core.blocks.as_block(var_dict[self.rms_current_out])
+            rms_phase_voltage = core.blocks.as_block(var_dict[self.rms_phase_voltage_out])
 
             if rms_line_current is not None:
                 if rms_phase_voltage is not None:
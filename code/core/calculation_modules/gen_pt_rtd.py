@@ -1,6 +1,7 @@
 
 import traceback
 import logging
+import core.blocks
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +28,9 @@ class PT_RTD:
         self.output_variable = variables.get('resistance', 'resistance')  # Output of physical hardware that this is modeling
 
 
+    def dependencies(self):
+        return [self.output_variable], [self.input_variable]
+
     def calculate(self, var_dict):
         """Calculate the temperature of an RTD from its resistance.
         
@@ -38,10 +42,10 @@ class PT_RTD:
         """
         try:
             # Get RTD resistance from blackboard
-            res = var_dict[self.output_variable]
+            res = core.blocks.as_block(var_dict[self.output_variable])
 
-            # re-scale resistance to 100 ohm nominal
-            res *= 100 / self.nominal_resistance
+            # re-scale resistance to 100 ohm nominal (not in place - a block on the blackboard must not be changed)
+            res = res * (100 / self.nominal_resistance)
 
             # coeffs for 5th order fit. Assumes nominal resistance of 100 ohm at 0 deg C.
             c5 = -2.10678E-11
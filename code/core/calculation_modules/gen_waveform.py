@@ -0,0 +1,101 @@
+import abc
+import math
+import traceback
+import logging
+import numpy
+import core.blocks
+
+logger = logging.getLogger(__name__)
+
+pip_requirements = {"numpy": "2.2.6"}
+
+
+# Waveform reductions
+# Turn a block of readings (see core.blocks) into a single value - e.g. an ADS1115 burst of clamp voltages, scaled to
+# current by VoltageClamp, into an RMS current.
+#
+# config (all modules):
+#  - whole_cycles - when the cycles variable is set (e.g. by an ADS1115 burst in cycles mode) only the readings that
+#                   cover whole mains cycles are used, so a part cycle at the end does not bias the result (default true)
+#  - remove_dc    - subtract the mean of the block first, e.g. for a biased AC signal (default false) - not Mean
+# variables:
+#  - var_in  - the block
+#  - var_out - the result
+#  - cycles  - mains cycles covered by the block (default "<var_in>_cycles")
+
+
+def whole_cycles(block, cycles):
+    """Returns the readings of block that cover a whole number of the <cycles> mains cycles it spans"""
+    if cycles is None or cycles < 1:
+        return block
+    n_readings = int(len(block) * math.floor(cycles) / cycles)
+    return block[:max(n_readings, 1)]
+
+
+class WaveformReduction(abc.ABC):
+    """Base of the reductions - not a calculation module itself"""
+    name = "WaveformReduction"
+
+    def __init__(self, config, variables):
+        self.whole_cycles = config.get('whole_cycles', True)
+        self.remove_dc = config.get('remove_dc', False)
+
+        self.var_in = variables.get('var_in')
+        self.var_out = variables.get('var_out')
+        self.cycles = variables.get('cycles', f"{self.var_in}_cycles")
+
+    def dependencies(self):
+        return [self.var_in, self.cycles], [self.var_out]
+
+    def calculate(self, var_dict):
+        try:
+            value = var_dict.get(self.var_in)
+            if value is not None:
+                block = numpy.atleast_1d(core.blocks.as_block(value))
+                if self.whole_cycles:
+                    block = whole_cycles(block, var_dict.get(self.cycles))
+                if self.remove_dc:
+                    block = block - block.mean()
+                var_dict[self.var_out] = float(self.reduce(block))
+            else:
+                logger.warning(f"{self.name}: input variable '{self.var_in}' not found")
+        except Exception:
+            logger.error(traceback.format_exc())
+        return var_dict
+
+    @abc.abstractmethod
+    def reduce(self, block):
+        """Returns the single value for a 1d block"""
+
+
+class TrueRMS(WaveformReduction):
+    """Root mean square of the block - the true RMS whatever the wave shape"""
+    name = "TrueRMS"
+
+    def reduce(self, block):
+        return math.sqrt(numpy.dot(block, block) / len(block))
+
+
+class Mean(WaveformReduction):
+    """Mean of the block"""
+    name = "Mean"
+
+    def reduce(self, block):
+        return block.mean()
+
+
+class Peak(WaveformReduction):
+    """Largest magnitude in the block"""
+    name = "Peak"
+
+    def reduce(self, block):
+        return numpy.abs(block).max()
+
+
+class CrestFactor(WaveformReduction):
+    """Peak / true RMS of the block - sqrt(2) for a pure sine wave"""
+    name = "CrestFactor"
+
+    def reduce(self, block):
+        rms = math.sqrt(numpy.dot(block, block) / len(block))
+        return numpy.abs(block).max() / rms if rms else 0.0
@@ -19,6 +19,11 @@ class CalcClassName:
 
         self.var_out = variables.get("blackboard_var_out")
 
+    def dependencies(self):
+        # (variables read, variables set) - lets core.pipeline skip this module when its results are not used
+        # leave this out if the module can read or set variables that are not known up front
+        return [self.var_in], [self.var_out]
+
     def calculate(self, blackboard):
         try:
             # Get input variable from blackboard
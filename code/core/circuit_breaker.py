@@ -0,0 +1,63 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Circuit breaker
+# Isolates a failing sensing stack so that the other stacks keep sampling at their normal rate.
+#  - closed     - the stack is sampled as normal
+#  - open       - the stack failed and is not sampled until its retry delay has passed
+#  - half_open  - the retry delay has passed - the device is reinitialised and sampled once to test it
+# A successful test closes the breaker, a failed one opens it again with the delay multiplied by <backoff>.
+#
+# config:
+# | key      | meaning                                                  | default |
+# |==========|==========================================================|=========|
+# | enabled  | use a circuit breaker for this stack                     | true    |
+# | initial  | delay before the first retry (seconds)                   | 10      |
+# | backoff  | multiplier applied to the delay after each failed retry  | 2       |
+# | limit    | upper limit on the delay (seconds)                       | 300     |
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, config=None, clock=time.monotonic, on_change=None):
+        config = config or {}
+        self.initial = config.get('initial', 10)
+        self.backoff = config.get('backoff', 2)
+        self.limit = config.get('limit', 300)
+        self.clock = clock
+        self.on_change = on_change  # called with (breaker, reason) whenever the state changes
+
+        self.state = CLOSED
+        self.failures = 0
+        self.delay = None
+        self.retry_at = None
+
+    def allow(self):
+        """Returns True if the stack should be sampled - moving to half_open once the retry delay has passed"""
+        if self.state == OPEN and self.clock() >= self.retry_at:
+            self.__set_state(HALF_OPEN, "retrying")
+        return self.state != OPEN
+
+    def record_success(self):
+        if self.state != CLOSED:
+            self.failures = 0
+            self.delay = None
+            self.retry_at = None
+            self.__set_state(CLOSED, "recovered")
+
+    def record_failure(self, reason):
+        self.failures += 1
+        self.delay = self.initial if self.delay is None else min(self.delay * self.backoff, self.limit)
+        self.retry_at = self.clock() + self.delay
+        self.__set_state(OPEN, reason)
+
+    def __set_state(self, state, reason):
+        self.state = state
+        if self.on_change is not None:
+            self.on_change(self, reason)
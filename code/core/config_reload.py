@@ -0,0 +1,45 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+# Hot config reload
+# The measure building block can reload its config while running - on SIGHUP (forwarded by main) or, with
+# [reload] watch = true, when the user or module config file changes.
+# The new config is compared against the running one item by item and only what changed is rebuilt:
+#  - devices and calculations that changed are reloaded - a device is initialised with the interface already open
+#  - pipelines that changed or use a changed calculation are rebuilt
+#  - measurements that changed are restarted, other sensing stacks are pointed at any rebuilt device or pipeline
+#  - outputs that changed are rebuilt (after publishing anything they have batched)
+# Everything is built before anything is replaced, and the swap happens while no measurement cycle is running.
+# Interfaces, mqtt, transport, metrics and profiling are shared with other parts of the service module and need a
+# restart to change.
+
+RESTART_SECTIONS = ('interface', 'mqtt', 'transport', 'metrics', 'profiling')
+
+
+def changed_items(old_section, new_section):
+    """Returns the names of the items in a config section that were added, removed or changed"""
+    return {name for name in old_section.keys() | new_section.keys() if old_section.get(name) != new_section.get(name)}
+
+
+class ConfigWatcher:
+    def __init__(self, files):
+        self.files = files
+        self.modified = self.__read_modified()
+
+    def changed(self):
+        modified = self.__read_modified()
+        changed = modified != self.modified
+        self.modified = modified
+        return changed
+
+    def __read_modified(self):
+        modified = {}
+        for file in self.files:
+            try:
+                modified[file] = os.stat(file).st_mtime_ns
+            except OSError:
+                modified[file] = None
+        return modified
@@ -0,0 +1,76 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Dead variable elimination
+# Works out at startup (and after each config reload) which variables each sensing stack actually has to produce by
+# tracing the variables used by the output message specs of its measurement back through its pipeline to its device:
+#  - each pipeline only executes the calculation modules leading to a used variable (see core.pipeline)
+#  - devices with a require_variables(variables) method are told which of their variables are used, e.g. the HOBUT
+#    meter then only reads the registers for those variables
+# variables is None wherever every variable has to be kept - an output using a jsonpath that is not a simple key path
+# (e.g. "$.*"), a calculation module that does not say what it reads or a device used by a stack with no pipeline.
+# The timestamp is always kept as it is used by the outputs when the device sets it.
+# Measurement modules that output variables of their own (e.g. <variable>_max from the averaging modules) say which
+# variables they need for them with an input_variables(variables) method.
+#
+# Pipelines and devices shared by several stacks produce the variables of all of them.
+
+ALWAYS_USED = {'timestamp'}
+
+
+def union(a, b):
+    if a is None or b is None:
+        return None
+    return a | b
+
+
+def output_variables(output_names, output_templates):
+    """Returns the variables used by the named outputs - None for all"""
+    variables = set(ALWAYS_USED)
+    for name in output_names:
+        template = output_templates.get(name)
+        if template is None or template.variables is None:
+            return None
+        variables |= template.variables
+    return variables
+
+
+def stack_variables(stack, variables):
+    """Returns the variables the stack's pipeline has to produce for variables to be in the stack's output"""
+    if variables is None or stack.prefix is None:
+        return variables
+    prefix_length = len(stack.prefix)
+    return {variable[prefix_length:] for variable in variables if variable.startswith(stack.prefix)}
+
+
+def eliminate(sensing_stacks, output_routes, output_templates, measurement_modules=None):
+    """Limits the initialised stacks' pipelines and devices to the variables used by the outputs of their measurements"""
+    pipelines = {}  # pipeline tag: (pipeline, variables)
+    for measurement_name, stacks in sensing_stacks.items():
+        variables = output_variables(output_routes.get(measurement_name, ()), output_templates)
+        measurement_module = (measurement_modules or {}).get(measurement_name)
+        if hasattr(measurement_module, 'input_variables'):
+            variables = measurement_module.input_variables(variables)
+        for stack in stacks:
+            if stack is None or stack.pipeline is None:
+                continue
+            _pipeline, used = pipelines.get(stack.pipeline_tag, (stack.pipeline, set()))
+            pipelines[stack.pipeline_tag] = (stack.pipeline, union(used, stack_variables(stack, variables)))
+
+    needed = {tag: pipeline.require(variables) for tag, (pipeline, variables) in pipelines.items()}
+
+    devices = {}  # device tag: (device, variables)
+    for stacks in sensing_stacks.values():
+        for stack in stacks:
+            if stack is None or stack.device is None:
+                continue
+            _device, used = devices.get(stack.device_tag, (stack.device, set()))
+            devices[stack.device_tag] = (stack.device, union(used, needed.get(stack.pipeline_tag)))
+
+    for tag, (device, variables) in devices.items():
+        if hasattr(device, 'require_variables'):
+            device.require_variables(variables)
+            if variables is not None:
+                logger.info(f"Device {tag}: only variables {sorted(variables)} are used")
@@ -1,3 +1,4 @@
+import array
 import time
 import traceback
 import logging
@@ -5,6 +6,27 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+# Burst mode
+# By default each sample is a single shot conversion - one value per sample. With burst set, the ADS111X is put into
+# continuous conversion and <burst> results are read back to back at the configured speed, then it is powered down again.
+# burst = {samples = N} reads N results; burst = {cycles = N, mains_frequency = 50} reads enough for N mains cycles.
+#
+# The variables set by a burst sample:
+# | variable     | default name          | value                                                                |
+# |==============|=======================|======================================================================|
+# | v_in         |                       | array.array('d') of the voltages read, oldest first                  |
+# | sample_rate  | <v_in>_sample_rate    | results per second, measured from the times of the first & last read |
+# | cycles       | <v_in>_cycles         | mains cycles covered (sample_rate / mains_frequency) - cycles mode   |
+#
+# Results are read on a fixed grid at the configured speed rather than by polling the ADS111X, so the bus is only used
+# for the 2 byte reads. The ADS111X's own clock may be up to 10% off the configured speed: faster and a result is
+# occasionally skipped, slower and one is occasionally read twice. Use 860SPS and a whole number of cycles for RMS.
+# A read that wakes up late (e.g. waiting for the GIL) moves on to the latest result rather than catching up on the
+# ones it missed, which would read the same result several times - the block then covers a longer time, which
+# sample_rate (and so cycles) reports.
+# A burst holds the I2C bus for its whole duration (e.g. 10 cycles at 50Hz = 0.2s).
+
+
 class ADS1115:
     # constants
     ADCMax = pow(2, 15)
@@ -47,14 +69,31 @@ class ADS1115:
             logger.warning("Invalid speed set in config, using default of 128SPS")
             self.speed, self.sample_delay = self.ADS111X_SAMPLE_SPEEDS.get('128SPS')
 
+        self.burst_samples = None
+        self.mains_frequency = None
+        burst = config.get('burst')
+        if burst is not None:
+            sample_rate = 1000 / self.sample_delay
+            if 'cycles' in burst:
+                self.mains_frequency = burst.get('mains_frequency', 50)
+                self.burst_samples = max(2, round(burst['cycles'] * sample_rate / self.mains_frequency))
+            else:
+                self.burst_samples = max(2, int(burst['samples']))
+
         self.i2c = None
         self.channel_mask = 0b11
+        self.clock = time.monotonic
+        self.sleep = time.sleep
         self.input_variable = variables['v_in']
+        self.sample_rate_variable = variables.get('sample_rate', f"{self.input_variable}_sample_rate")
+        self.cycles_variable = variables.get('cycles', f"{self.input_variable}_cycles")
 
     def initialise(self, interface):
         self.i2c = interface
 
     def sample(self):
+        if self.burst_samples is not None:
+            return self.sample_burst()
         try:
             # prepare config byte
             config = self.make_config_bytes()
@@ -79,9 +118,54 @@ class ADS1115:
             logger.error(traceback.format_exc())
             raise e
 
-    def make_config_bytes(self):
+    def sample_burst(self):
+        try:
+            n_samples = self.burst_samples
+            interval = self.sample_delay / 1000
+            address = self.i2c_address
+            read = self.i2c.read
+            sleep = self.sleep
+            clock = self.clock
+            raw = [b''] * n_samples
+
+            self.i2c.write_register(address, self.ADS111X_CONFIG_REGISTER, self.make_config_bytes(continuous=True))
+            try:
+                # point at the result register once so each result is a plain 2 byte read
+                self.i2c.write(address, self.ADS111X_ADC_RESULT_REGISTER)
+                # first result is ready one conversion after the start - allow for the oscillator tolerance
+                start = clock() + interval * 1.1
+                slot = 0
+                for index in range(n_samples):
+                    delay = start + slot * interval - clock()
+                    if delay > 0:
+                        sleep(delay)
+                        delay = start + slot * interval - clock()
+                    if delay <= -interval:  # late - skip to the latest result
+                        slot += int(-delay / interval)
+                    if index == 0:
+                        first_read = clock()
+                    raw[index] = bytes(read(address, 2))
+                    slot += 1
+                last_read = clock()
+            finally:
+                # power down - back to single shot mode without starting a conversion
+                self.i2c.write_register(address, self.ADS111X_CONFIG_REGISTER, self.make_config_bytes(start=False))
+
+            scale = self.ADCVoltage / self.ADCMax
+            block = array.array('d', [int.from_bytes(result, 'big', signed=True) * scale for result in raw])
+            sample_rate = (n_samples - 1) / (last_read - first_read) if last_read > first_read else 1 / interval
+            output = {self.input_variable: block, self.sample_rate_variable: sample_rate}
+            if self.mains_frequency is not None:
+                output[self.cycles_variable] = n_samples * self.mains_frequency / sample_rate
+            return output
+        except Exception as e:
+            logger.error(traceback.format_exc())
+            raise e
+
+    def make_config_bytes(self, continuous=False, start=True):
         msb = 0x00
-        msb |= 1 << 7  # start single shot conversion
+        if start and not continuous:
+            msb |= 1 << 7  # start single shot conversion
         if not self.differential:
             msb |= 0b1 << 6
 
@@ -94,7 +178,8 @@ class ADS1115:
 
         msb |= (self.channel & self.channel_mask) << 4
         msb |= self.gain << 1
-        msb |= 0b1  # single shot mode
+        if not continuous:
+            msb |= 0b1  # single shot mode
 
         lsb = 0x00
         lsb |= self.speed << 5
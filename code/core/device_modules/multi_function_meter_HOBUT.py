@@ -76,6 +76,13 @@ class HOBUT_850_LTHN:
         self.varTHD_I2 = variables.get('THD_I2')
         self.varTHD_I3 = variables.get('THD_I3')
 
+        # registers are only read for the variables that are used (see core.dead_variables)
+        self.configured_variables = {name: value for name, value in vars(self).items() if name.startswith('var')}
+
+    def require_variables(self, variables):
+        for name, variable in self.configured_variables.items():
+            setattr(self, name, variable if variables is None or variable in variables else None)
+
     def initialise(self, interface):
         self.modbus = interface
 
@@ -0,0 +1,261 @@
+import array
+import asyncio
+import datetime
+import json
+import logging
+import os
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Record and replay
+# RecordingDevice wraps any device and appends each sample it returns, with the time it was taken, to a recording file.
+# It is added by setting record = "<path>" on a device in the config. ReplayDevice plays a recording back as a device so
+# that pipelines, measurements and outputs can be run against real data without the hardware.
+#
+# Recording file format - a header (MAGIC) then a sequence of records, each starting with a one byte type:
+#  - S  schema  - uint16 length + json list of [variable, type code] - the variables of the following D records
+#  - D  data    - float64 unix time + the values of the current schema packed with their type codes (d, q or ?)
+#  - J  json    - float64 unix time + uint32 length + json sample - for samples that are not all numbers / booleans
+#                 blocks of readings (array.array - e.g. an ADS111X burst) are stored as {"__array__": <type code>,
+#                 "values": [...]} and read back as arrays
+# A new schema record is only written when the variables or their types change, so a steady device costs 9 bytes plus
+# 8 bytes per variable per sample. All values are little endian. A record cut short (e.g. by a power cut) ends the file.
+
+MAGIC = b"SDCREC1\n"
+TIME = struct.Struct("<d")
+LENGTH_16 = struct.Struct("<H")
+LENGTH_32 = struct.Struct("<I")
+ARRAY_KEY = "__array__"
+
+
+def type_code(value):
+    if isinstance(value, bool):
+        return "?"
+    if isinstance(value, int) and -2 ** 63 <= value < 2 ** 63:
+        return "q"
+    if isinstance(value, float):
+        return "d"
+    return None
+
+
+def encode_value(value):
+    # json default for the values json does not know
+    if isinstance(value, array.array):
+        return {ARRAY_KEY: value.typecode, "values": value.tolist()}
+    raise TypeError(f"{type(value).__name__} values can not be recorded")
+
+
+def decode_object(obj):
+    if ARRAY_KEY in obj and len(obj) == 2:
+        return array.array(obj[ARRAY_KEY], obj["values"])
+    return obj
+
+
+class RecordWriter:
+    def __init__(self, path, flush_interval=1):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "ab")
+        if new_file:
+            self.file.write(MAGIC)
+        self.schema = None  # the schema is written again by each session as the file may end in a cut off record
+        self.packer = None
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+
+    def write(self, timestamp, sample):
+        schema = tuple((key, type_code(value)) for key, value in sample.items())
+        if any(code is None for _key, code in schema):
+            encoded = json.dumps(sample, default=encode_value).encode()
+            self.file.write(b"J" + TIME.pack(timestamp) + LENGTH_32.pack(len(encoded)) + encoded)
+        else:
+            if schema != self.schema:
+                encoded = json.dumps(schema).encode()
+                self.file.write(b"S" + LENGTH_16.pack(len(encoded)) + encoded)
+                self.schema = schema
+                self.packer = struct.Struct("<d" + "".join(code for _key, code in schema))
+            self.file.write(b"D" + self.packer.pack(timestamp, *sample.values()))
+
+        now = time.monotonic()
+        if now - self.last_flush >= self.flush_interval:
+            self.file.flush()
+            self.last_flush = now
+
+    def close(self):
+        self.file.close()
+
+
+def read_records(path):
+    """Yields (unix time, sample) from a recording file in the order they were recorded"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a recording")
+        keys, unpacker = None, None
+        while True:
+            kind = f.read(1)
+            if kind == b"S":
+                header = f.read(LENGTH_16.size)
+                if len(header) < LENGTH_16.size:
+                    return
+                encoded = f.read(LENGTH_16.unpack(header)[0])
+                try:
+                    schema = json.loads(encoded)
+                except ValueError:
+                    return
+                keys = [key for key, _code in schema]
+                unpacker = struct.Struct("<d" + "".join(code for _key, code in schema))
+            elif kind == b"D" and unpacker is not None:
+                data = f.read(unpacker.size)
+                if len(data) < unpacker.size:
+                    return
+                timestamp, *values = unpacker.unpack(data)
+                yield timestamp, dict(zip(keys, values))
+            elif kind == b"J":
+                header = f.read(TIME.size + LENGTH_32.size)
+                if len(header) < TIME.size + LENGTH_32.size:
+                    return
+                timestamp = TIME.unpack_from(header)[0]
+                encoded = f.read(LENGTH_32.unpack_from(header, TIME.size)[0])
+                try:
+                    sample = json.loads(encoded, object_hook=decode_object)
+                except ValueError:
+                    return
+                yield timestamp, sample
+            else:  # end of file, or a record cut short
+                return
+
+
+class RecordingDevice:
+    """Wraps a device and records every sample it returns"""
+    def __init__(self, device, path):
+        self.device = device
+        self.path = path
+        self.writer = RecordWriter(path)
+        self.failures = 0
+        if asyncio.iscoroutinefunction(device.sample):
+            self.sample = self.sample_async
+        # dead variable elimination reaches the wrapped device - only its used variables are recorded
+        if hasattr(device, 'require_variables'):
+            self.require_variables = device.require_variables
+
+    def initialise(self, interface):
+        self.device.initialise(interface)
+
+    def sample(self):
+        sample = self.device.sample()
+        self.record(sample)
+        return sample
+
+    async def sample_async(self):
+        sample = await self.device.sample()
+        self.record(sample)
+        return sample
+
+    def record(self, sample):
+        try:
+            self.writer.write(time.time(), sample)
+        except Exception as e:
+            # a failing recording must not stop the measurement - reported once rather than for every sample
+            self.failures += 1
+            if self.failures == 1:
+                logger.error(f"Unable to record sample to {self.path}: {e} - samples that can not be recorded "
+                             f"are skipped")
+
+    def close(self):
+        self.writer.close()
+
+
+class ReplayDevice:
+    """Plays back a recording made with record = "<path>" on a device.
+
+    config:
+     - path      - the recording file
+     - speed     - 1 plays back in real time, N at N times real time, 0 returns the next record on every sample
+     - loop      - start again from the beginning at the end of the recording (default true) - otherwise sampling
+                   fails once the recording has finished
+     - timestamp - add the time each sample was recorded as the timestamp variable (default false) - outputs then
+                   carry the recorded time rather than the replay time
+    variables:
+     - timestamp - name of the timestamp variable (default "timestamp")
+    """
+    def __init__(self, config, variables):
+        self.path = config['path']
+        self.speed = config.get('speed', 1)
+        self.loop = config.get('loop', True)
+        self.add_timestamp = config.get('timestamp', False)
+        self.timestamp_variable = variables.get('timestamp', 'timestamp')
+        self.clock = time.monotonic
+
+        self.records = None
+        self.current = None
+        self.upcoming = None
+        self.started = None
+        self.first_recorded = None
+        self.offset = 0  # added to the recorded times on later passes through a looped recording
+        self.gap = None
+
+    def initialise(self, interface):
+        # (re)initialising starts the playback from the beginning
+        self.records = None
+        self.current = None
+        self.offset = 0
+
+    def sample(self):
+        if self.records is None:
+            self.restart()
+            self.started = self.clock()
+            self.first_recorded = self.upcoming[0]
+
+        if self.speed == 0:
+            self.advance()
+        else:
+            # the latest record at or before the replay time
+            target = self.first_recorded + (self.clock() - self.started) * self.speed
+            if self.current is None:
+                self.advance()
+            while self.upcoming is not None and self.upcoming[0] <= target:
+                self.advance()
+
+        timestamp, sample = self.current
+        if self.add_timestamp:
+            return {**sample, self.timestamp_variable: self.format_timestamp(timestamp)}
+        return dict(sample)
+
+    def restart(self):
+        self.records = read_records(self.path)
+        self.upcoming = self.next_record()
+        if self.upcoming is None:
+            raise EOFError(f"Recording {self.path} is empty")
+
+    def next_record(self):
+        record = next(self.records, None)
+        if record is None:
+            return None
+        return record[0] + self.offset, record[1]
+
+    def advance(self):
+        if self.upcoming is None:
+            if not self.loop:
+                raise EOFError(f"Recording {self.path} finished")
+            # the next pass carries on one sample interval after the end of this one
+            self.offset = self.current[0] + self.record_gap() - self.first_recorded
+            self.restart()
+        self.current = self.upcoming
+        self.upcoming = self.next_record()
+
+    def record_gap(self):
+        # the interval between the first two records
+        if self.gap is None:
+            records = read_records(self.path)
+            first, second = next(records, None), next(records, None)
+            records.close()
+            self.gap = second[0] - first[0] if second is not None else 0
+        return self.gap
+
+    def format_timestamp(self, timestamp):
+        return datetime.datetime.fromtimestamp(timestamp).astimezone().isoformat()
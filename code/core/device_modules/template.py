@@ -25,6 +25,10 @@ class DeviceClassName:
         # for example
         self.adc_voltage = variables.get("v_adc", "default_variable_name")
 
+    # optional - called with the variables that are used (None - all of them) so that a device that reads several
+    # registers can skip the ones that are not needed (see core.dead_variables)
+    # def require_variables(self, variables):
+
     def initialise(self, interface):
         # TODO: save interface
         # (the received interface is defined in the config file, in this example we assume I2C)
@@ -0,0 +1,208 @@
+import asyncio
+import bisect
+import concurrent.futures
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Bus scheduler
+# Interface objects (I2C, SPI, Serial, OneWire, ...) are shared by every device that references them. Blocking device
+# transactions - a device's sample() - are queued per bus and executed one at a time on a worker thread for that bus:
+#  - transactions for devices on the same bus never interleave
+#  - transactions on different buses run at the same time, and the event loop is never blocked by them
+#  - queued transactions are started highest priority first, then in the order they were submitted
+#    (each sensing stack has at most one transaction queued, so a low priority device waits for at most one
+#    transaction from each other device on its bus)
+#  - a transaction that is cancelled before it starts (e.g. its sensing stack timed out) is skipped
+#
+# Each bus keeps statistics which are logged every <report_interval> seconds:
+#  - utilisation    - fraction of the time the bus was busy with transactions
+#  - queue depth    - number of transactions waiting, sampled as each one is submitted
+#  - wait time      - time from a transaction being submitted to it starting, as a histogram
+# With a core.metrics registry they are also exported - wait times as the bus_wait stage and utilisation and queue
+# depth as gauges set at each report.
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)  # upper bounds in seconds - plus an overflow bucket
+
+
+class BusSchedulers:
+    """One BusScheduler per interface, created on first use"""
+    def __init__(self, report_interval=60, metrics=None):
+        self.report_interval = report_interval
+        self.metrics = metrics
+        self.buses = {}
+
+    def get(self, interface_tag):
+        bus = self.buses.get(interface_tag)
+        if bus is None:
+            bus = self.buses[interface_tag] = BusScheduler(interface_tag, report_interval=self.report_interval,
+                                                           metrics=self.metrics)
+            logger.debug(f"Created scheduler for bus {interface_tag}")
+        return bus
+
+    async def run(self, interface_tag, function, *args, priority=0):
+        return await self.get(interface_tag).run(function, *args, priority=priority)
+
+    def report(self):
+        # also called by measure so that the gauges of a bus that has gone quiet are brought up to date
+        for bus in list(self.buses.values()):
+            bus.stats.report()
+
+    def shutdown(self, wait=True):
+        for bus in self.buses.values():
+            bus.shutdown(wait)
+        self.buses = {}
+
+
+class BusScheduler:
+    def __init__(self, name, clock=time.monotonic, report_interval=60, metrics=None):
+        self.name = name
+        self.clock = clock
+        self.stats = BusStats(name, clock, report_interval, metrics)
+
+        self.condition = threading.Condition()
+        self.queue = []  # heap of (-priority, sequence, submitted, future, function, args)
+        self.sequence = itertools.count()
+        self.stopping = False
+
+        self.thread = threading.Thread(target=self.__work, name=f"bus_{name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, function, *args, priority=0):
+        future = concurrent.futures.Future()
+        with self.condition:
+            if self.stopping:
+                raise RuntimeError(f"Bus {self.name} has been shut down")
+            heapq.heappush(self.queue, (-priority, next(self.sequence), self.clock(), future, function, args))
+            self.stats.record_depth(len(self.queue) - 1)
+            self.condition.notify()
+        return future
+
+    async def run(self, function, *args, priority=0):
+        return await asyncio.wrap_future(self.submit(function, *args, priority=priority))
+
+    def shutdown(self, wait=True):
+        with self.condition:
+            self.stopping = True
+            for item in self.queue:
+                item[3].cancel()
+            self.queue = []
+            self.condition.notify()
+        if wait:
+            self.thread.join()
+
+    def __work(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.queue or self.stopping)
+                if self.stopping:
+                    return
+                _priority, _sequence, submitted, future, function, args = heapq.heappop(self.queue)
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            started = self.clock()
+            try:
+                result = function(*args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            self.stats.record_transaction(started - submitted, self.clock() - started)
+            self.stats.report()
+
+
+class BusStats:
+    def __init__(self, name, clock=time.monotonic, interval=60, metrics=None):
+        self.name = name
+        self.clock = clock
+        self.interval = interval
+        self.metrics = metrics
+        # only the bus's worker thread observes its wait times
+        self.wait_timer = metrics.histogram('bus_wait', name) if metrics is not None else None
+        self.lock = threading.Lock()
+        self.report_lock = threading.Lock()  # report() is called from the worker thread and by BusSchedulers
+        self.last_report = clock()
+        self.reset()
+
+    def reset(self):
+        self.transactions = 0
+        self.busy_time = 0
+        self.max_depth = 0
+        self.total_depth = 0
+        self.depth_samples = 0
+        self.max_wait = 0
+        self.wait_histogram = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def record_depth(self, depth):
+        with self.lock:
+            self.depth_samples += 1
+            self.total_depth += depth
+            if depth > self.max_depth:
+                self.max_depth = depth
+
+    def record_transaction(self, wait, busy):
+        with self.lock:
+            self.transactions += 1
+            self.busy_time += busy
+            self.wait_histogram[bisect.bisect_left(WAIT_BUCKETS, wait)] += 1
+            if wait > self.max_wait:
+                self.max_wait = wait
+        if self.wait_timer is not None:
+            self.wait_timer.observe(wait)
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = self.clock() - self.last_report
+            return {
+                'transactions': self.transactions,
+                'utilisation': self.busy_time / elapsed if elapsed > 0 else 0,
+                'mean_depth': self.total_depth / self.depth_samples if self.depth_samples else 0,
+                'max_depth': self.max_depth,
+                'max_wait': self.max_wait,
+                'wait_histogram': dict(zip(WAIT_BUCKETS + (float('inf'),), self.wait_histogram)),
+            }
+
+    def report(self):
+        with self.report_lock:
+            now = self.clock()
+            if now - self.last_report < self.interval:
+                return
+            stats = self.snapshot()
+            if self.metrics is not None:
+                self.metrics.set_gauge('bus_utilisation', self.name, stats['utilisation'],
+                                       "Fraction of the last report interval each bus was busy")
+                self.metrics.set_gauge('bus_queue_depth_mean', self.name, stats['mean_depth'],
+                                       "Mean number of transactions waiting for each bus over the last report interval")
+                self.metrics.set_gauge('bus_queue_depth_max', self.name, stats['max_depth'],
+                                       "Most transactions waiting for each bus over the last report interval")
+            if stats['transactions']:
+                logger.info(f"bus {self.name}: {stats['transactions']} transactions in {now - self.last_report:.0f}s - "
+                            f"utilisation: {100 * stats['utilisation']:.1f}% - "
+                            f"queue depth mean: {stats['mean_depth']:.1f} max: {stats['max_depth']} - "
+                            f"wait p50: {self.__format_bound(0.5)} p95: {self.__format_bound(0.95)} "
+                            f"max: {1000 * stats['max_wait']:.1f}ms")
+            with self.lock:
+                self.reset()
+            self.last_report = now
+
+    def wait_percentile_bound(self, fraction):
+        """Upper bound of the histogram bucket containing the given fraction of wait times"""
+        with self.lock:
+            target = fraction * self.transactions
+            count = 0
+            for bound, bucket_count in zip(WAIT_BUCKETS + (float('inf'),), self.wait_histogram):
+                count += bucket_count
+                if count >= target:
+                    return bound
+        return float('inf')
+
+    def __format_bound(self, fraction):
+        bound = self.wait_percentile_bound(fraction)
+        return f"<={1000 * bound:g}ms" if bound != float('inf') else f">{1000 * WAIT_BUCKETS[-1]:g}ms"
@@ -1,18 +1,203 @@
+import asyncio
 import datetime
-import time
 import traceback
 import logging
-import statistics
+import math
+import numbers
+import core.scheduler
 
 logger = logging.getLogger(__name__)
 
 
+# Timing
+# All modules schedule their cycles with a core.scheduler.DeadlineScheduler, so samples stay on a fixed grid
+# (anchor + k * period) however long each sample takes. The averaging modules take n_samples samples per period.
+# overrun = "skip" (default) or "catch_up" sets what happens when a cycle runs past later deadlines.
+
+def create_scheduler(config, period, name):
+    return core.scheduler.DeadlineScheduler(period, config.get("overrun", "skip"), config.get("max_catch_up", 10),
+                                            name=name)
+
+
+# Merged sampling of multiple sensing stacks (MultiSampleMerged & MultiSampleMergedAvg)
+# By default each stack is executed in turn, so a cycle takes the sum of the stacks' sample times.
+# With concurrent = true, stacks on different interfaces are executed at the same time while stacks sharing an
+# interface are still executed one after another, so a cycle takes roughly as long as the slowest interface.
+# Blocking sample() implementations overlap too as they are run by their interface's bus scheduler - unless the stack
+# sets offload = false, in which case they hold up the event loop whatever the mode.
+#
+# A stack that takes longer than its timeout (the stack's timeout, otherwise the module's stack_timeout) is left out
+# of that cycle's sample. The outputs are merged in stack order whichever mode is used.
+
+async def execute_stack(stack, default_timeout=None):
+    timeout = stack.timeout if stack.timeout is not None else default_timeout
+    if timeout is None:
+        return await stack.execute()
+    try:
+        return await asyncio.wait_for(stack.execute(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Sensing stack for device {stack.device_tag} timed out after {timeout}s - omitted from sample")
+        return None
+
+
+async def execute_merged(sensing_stacks, concurrent=False, default_timeout=None):
+    results = [None] * len(sensing_stacks)
+
+    async def execute_in_turn(indexes):
+        for index in indexes:
+            results[index] = await execute_stack(sensing_stacks[index], default_timeout)
+
+    if concurrent:
+        interface_groups = {}
+        for index, stack in enumerate(sensing_stacks):
+            interface_groups.setdefault(stack.interface_tag, []).append(index)
+        outcomes = await asyncio.gather(*(execute_in_turn(indexes) for indexes in interface_groups.values()),
+                                        return_exceptions=True)
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                raise outcome
+    else:
+        await execute_in_turn(range(len(sensing_stacks)))
+
+    var_dict = {}
+    for res in results:
+        if res is not None:
+            var_dict.update(res)
+    return var_dict
+
+
+# Averaging (SingleSampleAvg, MultiSampleMergedAvg & MultiSampleIndividualAvg)
+# Samples are not kept until the end of the period - each variable has a running Accumulator, so memory does not grow
+# with n_samples:
+#  - numeric values - the mean (exact for integers), min, max and standard deviation
+#  - other values - the most common value, counting at most MODE_LIMIT different values (the first one seen wins a tie)
+# None values (nothing returned by the device) are skipped. A variable that is numeric in some samples and not in
+# others reports the mean of its numeric values if they are at least half of the samples, otherwise the most common
+# of its other values.
+# With statistics = ["min", "max", "std"] (or any of them) in the config, <variable>_min, <variable>_max and
+# <variable>_std (sample standard deviation - 0 for a single sample) are also output for each numeric variable.
+
+MODE_LIMIT = 32
+STATISTICS = ('min', 'max', 'std')
+
+
+class Accumulator:
+    """Count, sum and sum of squares of the differences of a variable's numeric values from its first one - exact
+    for integers and without the loss of precision of plain sums for floats - with their min and max, alongside counts
+    of each of its other values."""
+    __slots__ = ('count', 'shift', 'total', 'squares', 'min', 'max', 'others', 'counts')
+
+    def __init__(self, value):
+        self.count = 0
+        self.shift = None
+        self.total = 0
+        self.squares = 0
+        self.min = self.max = None
+        self.others = 0
+        self.counts = {}  # key: [value, count] for non-numeric values - unhashable values are keyed by their repr
+        self.add(value)
+
+    def add(self, value):
+        if type(value) is not float and type(value) is not int:
+            if value is None:
+                return
+            if not isinstance(value, numbers.Real):
+                self.add_other(value)
+                return
+            if type(value) is not bool:  # e.g. numpy scalars
+                value = int(value) if isinstance(value, numbers.Integral) else float(value)
+        if self.count == 0:
+            self.shift = self.min = self.max = value
+        self.count += 1
+        delta = value - self.shift
+        self.total += delta
+        self.squares += delta * delta
+        if value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+
+    def add_other(self, value):
+        self.others += 1
+        try:
+            entry = self.counts.get(value)
+            key = value
+        except TypeError:  # unhashable - e.g. a list or a block of readings
+            key = repr(value)
+            entry = self.counts.get(key)
+        if entry is not None:
+            entry[1] += 1
+        elif len(self.counts) < MODE_LIMIT:
+            self.counts[key] = [value, 1]
+
+    def numeric(self):
+        return self.count > 0 and self.count >= self.others
+
+    def value(self):
+        if not self.numeric():
+            return max(self.counts.values(), key=lambda entry: entry[1])[0] if self.counts else None
+        if type(self.total) is int:  # only integers
+            quotient, remainder = divmod(self.total, self.count)
+            return self.shift + quotient if remainder == 0 else (self.shift * self.count + self.total) / self.count
+        return self.shift + self.total / self.count
+
+    def statistic(self, name):
+        if name == 'min':
+            return self.min
+        if name == 'max':
+            return self.max
+        if self.count < 2:
+            return 0.0
+        variance = (self.squares - self.total * self.total / self.count) / (self.count - 1)
+        return math.sqrt(max(variance, 0))
+
+
+class Averager:
+    """Running averages of the variables of the samples added since the last result()"""
+    def __init__(self, statistics=()):
+        self.statistics = [name for name in statistics if name in STATISTICS]
+        for name in statistics:
+            if name not in STATISTICS:
+                logger.warning(f"Unknown statistic '{name}' ignored - expected one of {STATISTICS}")
+        self.accumulators = {}
+
+    def add(self, var_dict):
+        # None for cycles where the stack was not sampled (circuit breaker open)
+        if var_dict is None:
+            return
+        accumulators = self.accumulators
+        for key, value in var_dict.items():
+            accumulator = accumulators.get(key)
+            if accumulator is None:
+                accumulators[key] = Accumulator(value)
+            else:
+                accumulator.add(value)
+
+    def result(self):
+        out = {}
+        for key, accumulator in self.accumulators.items():
+            out[key] = accumulator.value()
+            if self.statistics and accumulator.numeric():
+                for name in self.statistics:
+                    out[f"{key}_{name}"] = accumulator.statistic(name)
+        self.accumulators = {}
+        return out
+
+    def input_variables(self, variables):
+        """Returns the variables needed from the sensing stacks for variables to be output (see core.dead_variables)"""
+        if variables is None or not self.statistics:
+            return variables
+        suffixes = tuple(f"_{name}" for name in self.statistics)
+        sources = {variable.rsplit('_', 1)[0] for variable in variables if variable.endswith(suffixes)}
+        return variables | sources
+
+
 class SingleSample:
     """The simplest sampling approach. Sample a single sensing stack once and report the value."""
     def __init__(self, config):
         self.period = config["period"]
         self.sensing_stack = None
-        self.previous_timestamp = None
+        self.scheduler = create_scheduler(config, self.period, type(self).__name__)
 
     def initialise(self, sensing_stacks):
         if len(sensing_stacks) == 1:
@@ -22,24 +207,10 @@ class SingleSample:
             logger.warning("Multiple sensing stacks provided - module expects 1 - using first")
 
     async def loop(self):
+        self.scheduler.start()
         var_dict = await self.sensing_stack.execute()
 
-        return self.__optimise_delay(), var_dict
-
-    def __optimise_delay(self):
-        if self.previous_timestamp:
-            delta = self.period - (time.monotonic() - self.previous_timestamp)
-            self.delay = self.delay + 0.2 * delta
-            logger.debug(f"delay: {delta}>>{self.delay}")
-        else:
-            self.delay = self.period
-
-        if self.delay < 0:
-            logger.warning("Negative delay - resetting to period")
-            self.delay = self.period
-
-        self.previous_timestamp = time.monotonic()
-        return self.delay
+        return self.scheduler.next_delay(), var_dict
 
 
 class SingleSampleAvg:
@@ -49,10 +220,9 @@ class SingleSampleAvg:
         self.n_samples = config["n_samples"]
         self.current_sample = 0
         self.sensing_stack = None
-        self.samples = []
+        self.averager = Averager(config.get("statistics", []))
 
-        self.anchor_timestamp = None
-        self.previous_target = None
+        self.scheduler = create_scheduler(config, self.full_period / self.n_samples, type(self).__name__)
 
     def initialise(self, sensing_stacks):
         if len(sensing_stacks) == 1:
@@ -62,180 +232,73 @@ class SingleSampleAvg:
             logger.warning("Multiple sensing stacks provided - module expects 1 - using first")
 
     async def loop(self):
+        self.scheduler.start()
         var_dict = await self.sensing_stack.execute()
-        self.samples.append(var_dict)
-        delay = self.__optimise_delay()
+        self.averager.add(var_dict)
+        delay = self.scheduler.next_delay()
 
         self.current_sample += 1
         out = None
         if self.current_sample == self.n_samples:
             self.current_sample = 0
-            out = self.__average_variables(self.samples)
-            self.samples = []
+            out = self.averager.result()
 
         return delay, out
 
-    def __optimise_delay(self):
-        current_timestamp = time.monotonic()
-
-        if self.anchor_timestamp is None or self.current_sample == 0:
-            self.anchor_timestamp = current_timestamp
-
-        next_target = ((self.current_sample + 1) / self.n_samples) * self.full_period + self.anchor_timestamp
-        base_delay = next_target - current_timestamp
-
-        if self.previous_target:
-            delta = self.previous_target - current_timestamp
-            self.delay_adjustment = self.delay_adjustment + 0.2 * delta
-            # logger.debug(f"""anchor: {self.anchor_timestamp}, fraction: {((self.current_sample + 1) / self.n_samples)},
-            # target:{next_target}, current:{current_timestamp}, p_target:{self.previous_target}, delta: {delta},
-            # delay_adjustment: {self.delay_adjustment}, b_delay: {base_delay}, delay: {base_delay + self.delay_adjustment}""")
-
-        else:
-            self.delay_adjustment = 0
-
-
-        if base_delay + self.delay_adjustment < 0:
-            logger.warning("Negative delay - resetting adjustment")
-            self.delay_adjustment = 0
-
-        self.previous_target = next_target
-        return base_delay + self.delay_adjustment
-
-    def __average_variables(self, list):
-        aggregated_dict = {}
-        # aggregate
-        for entry in list:
-            for k, v in entry.items():
-                if k not in aggregated_dict:
-                    aggregated_dict[k] = []
-                aggregated_dict[k].append(v)
-
-        out = {}
-        for k, v in aggregated_dict.items():
-            try:
-                mean = statistics.mean(v)
-                out[k] = mean
-            except TypeError:  # not numeric
-                mode = statistics.mode(v)
-                out[k] = mode
-
-        return out
+    def input_variables(self, variables):
+        return self.averager.input_variables(variables)
 
 
 class MultiSampleMerged:
     """Sample once from multiple sensing stacks and merge the dictionaries."""
     def __init__(self, config):
         self.period = config["period"]
+        self.concurrent = config.get("concurrent", False)
+        self.stack_timeout = config.get("stack_timeout")
         self.sensing_stacks = None
-        self.previous_timestamp = None
+        self.scheduler = create_scheduler(config, self.period, type(self).__name__)
 
     def initialise(self, sensing_stacks):
         self.sensing_stacks = sensing_stacks
 
     async def loop(self):
-        var_dict = {}
-        for stack in self.sensing_stacks:
-            res = await stack.execute()
-            var_dict = {**var_dict, **res}
-        return self.__optimise_delay(), var_dict
-
-    def __optimise_delay(self):
-        if self.previous_timestamp:
-            delta = self.period - (time.monotonic() - self.previous_timestamp)
-            self.delay = self.delay + 0.2 * delta
-            logger.debug(f"delay: {delta}>>{self.delay}")
-        else:
-            self.delay = self.period
-
-
-        if self.delay < 0:
-            logger.warning("Negative delay - resetting to period")
-            self.delay = self.period
-
-        self.previous_timestamp = time.monotonic()
-        return self.delay
+        self.scheduler.start()
+        var_dict = await execute_merged(self.sensing_stacks, self.concurrent, self.stack_timeout)
+        return self.scheduler.next_delay(), var_dict
 
 class MultiSampleMergedAvg:
     """Sample multiple times from multiple sensing stacks."""
     def __init__(self, config):
         self.full_period = config["period"]
         self.n_samples = config["n_samples"]
+        self.concurrent = config.get("concurrent", False)
+        self.stack_timeout = config.get("stack_timeout")
         self.current_sample = 0
         self.sensing_stack = None
-        self.samples = []
-
-
-        self.anchor_timestamp = None
-        self.previous_target = None
+        self.averager = Averager(config.get("statistics", []))
 
+        self.scheduler = create_scheduler(config, self.full_period / self.n_samples, type(self).__name__)
 
     def initialise(self, sensing_stacks):
         self.sensing_stacks = sensing_stacks
 
     async def loop(self):
-        var_dict = {}
-        for stack in self.sensing_stacks:
-            res = await stack.execute()
-            var_dict = {**var_dict, **res}
+        self.scheduler.start()
+        var_dict = await execute_merged(self.sensing_stacks, self.concurrent, self.stack_timeout)
 
-        self.samples.append(var_dict)
-        delay = self.__optimise_delay()
+        self.averager.add(var_dict)
+        delay = self.scheduler.next_delay()
 
         self.current_sample += 1
         out = None
         if self.current_sample == self.n_samples:
             self.current_sample = 0
-            out = self.__average_variables(self.samples)
-            self.samples = []
+            out = self.averager.result()
 
         return delay, out
 
-    def __optimise_delay(self):
-        current_timestamp = time.monotonic()
-
-        if self.anchor_timestamp is None or self.current_sample == 0:
-            self.anchor_timestamp = current_timestamp
-
-        next_target = ((self.current_sample + 1) / self.n_samples) * self.full_period + self.anchor_timestamp
-        base_delay = next_target - current_timestamp
-
-        if self.previous_target:
-            delta = self.previous_target - current_timestamp
-            self.delay_adjustment = self.delay_adjustment + 0.2 * delta
-            # logger.debug(f"""anchor: {self.anchor_timestamp}, fraction: {((self.current_sample + 1) / self.n_samples)},
-            # target:{next_target}, current:{current_timestamp}, p_target:{self.previous_target}, delta: {delta},
-            # delay_adjustment: {self.delay_adjustment}, b_delay: {base_delay}, delay: {base_delay + self.delay_adjustment}""")
-
-        else:
-            self.delay_adjustment = 0
-
-        if base_delay + self.delay_adjustment < 0:
-            logger.warning("Negative delay - resetting adjustment")
-            self.delay_adjustment = 0
-
-        self.previous_target = next_target
-        return base_delay + self.delay_adjustment
-
-    def __average_variables(self, list):
-        aggregated_dict = {}
-        # aggregate
-        for entry in list:
-            for k, v in entry.items():
-                if k not in aggregated_dict:
-                    aggregated_dict[k] = []
-                aggregated_dict[k].append(v)
-
-        out = {}
-        for k, v in aggregated_dict.items():
-            try:
-                mean = statistics.mean(v)
-                out[k] = mean
-            except TypeError:  # not numeric
-                mode = statistics.mode(v)
-                out[k] = mode
-
-        return out
+    def input_variables(self, variables):
+        return self.averager.input_variables(variables)
 
 
 class MultiSampleIndividual:
@@ -244,12 +307,14 @@ class MultiSampleIndividual:
         self.period = config["period"]
         self.sensing_stacks = None
         self.counter = 0
-        self.previous_timestamp = None
+        self.scheduler = create_scheduler(config, self.period, type(self).__name__)
 
     def initialise(self, sensing_stacks):
         self.sensing_stacks = sensing_stacks
 
     async def loop(self):
+        if self.counter == 0:
+            self.scheduler.start()
         stack = self.sensing_stacks[self.counter]
         var_dict = await stack.execute()
 
@@ -257,110 +322,52 @@ class MultiSampleIndividual:
         if self.counter >= len(self.sensing_stacks):
             self.counter = 0
 
-        delay = self.__optimise_delay() if self.counter == 0 else 0
+        delay = self.scheduler.next_delay() if self.counter == 0 else 0
         return delay, var_dict
 
-    def __optimise_delay(self):
-        if self.previous_timestamp:
-            delta = self.period - (time.monotonic() - self.previous_timestamp)
-            self.delay = self.delay + 0.2 * delta
-            logger.debug(f"delay: {delta}>>{self.delay}")
-        else:
-            self.delay = self.period
-
-        if self.delay < 0:
-            logger.warning("Negative delay - resetting to period")
-            self.delay = self.period
-
-        self.previous_timestamp = time.monotonic()
-        return self.delay
-
 
 class MultiSampleIndividualAvg:
-    """I'm confused"""
+    """Samples each sensing stack in turn, n_samples times per period, and reports the average of each individually"""
     def __init__(self, config):
         self.full_period = config["period"]
         self.n_samples = config["n_samples"]
         self.current_sample = 0
         self.sensing_stack = None
-        self.samples = None
+        self.statistics = config.get("statistics", [])
+        self.averagers = None
 
         self.stack_counter = 0
-        self.anchor_timestamp = None
-        self.previous_target = None
+        self.scheduler = create_scheduler(config, self.full_period / self.n_samples, type(self).__name__)
 
     def initialise(self, sensing_stacks):
         self.sensing_stacks = sensing_stacks
-        self.samples = [[] for _i in range(len(self.sensing_stacks))]
+        self.averagers = [Averager(self.statistics) for _i in range(len(self.sensing_stacks))]
 
     async def loop(self):
+        if self.stack_counter == 0:
+            self.scheduler.start()
         stack = self.sensing_stacks[self.stack_counter]
         var_dict = await stack.execute()
 
-        self.samples[self.stack_counter].append(var_dict)
+        self.averagers[self.stack_counter].add(var_dict)
 
         delay = 0
         out = None
 
         if self.current_sample == (self.n_samples - 1):
             logger.debug(f"sample:{self.current_sample},stack:{self.stack_counter}")
-            out = self.__average_variables(self.samples[self.stack_counter])
+            out = self.averagers[self.stack_counter].result()
 
         self.stack_counter = self.stack_counter + 1
 
         if self.stack_counter >= len(self.sensing_stacks):
             self.stack_counter = 0
-            delay = self.__optimise_delay()
+            delay = self.scheduler.next_delay()
             self.current_sample += 1
             if self.current_sample == self.n_samples:
                 self.current_sample = 0
-                self.samples = [[] for _i in range(len(self.sensing_stacks))]
 
         return delay, out
 
-    def __optimise_delay(self):
-        current_timestamp = time.monotonic()
-
-        if self.anchor_timestamp is None or self.current_sample == 0:
-            self.anchor_timestamp = current_timestamp
-
-        next_target = ((self.current_sample + 1) / self.n_samples) * self.full_period + self.anchor_timestamp
-        base_delay = next_target - current_timestamp
-
-        if self.previous_target:
-            delta = self.previous_target - current_timestamp
-            self.delay_adjustment = self.delay_adjustment + 0.2 * delta
-            # logger.debug(f"""anchor: {self.anchor_timestamp}, fraction: {((self.current_sample + 1) / self.n_samples)},
-            # target:{next_target}, current:{current_timestamp}, p_target:{self.previous_target}, delta: {delta},
-            # delay_adjustment: {self.delay_adjustment}, b_delay: {base_delay}, delay: {base_delay + self.delay_adjustment}""")
-        else:
-            self.delay_adjustment = 0
-
-        if base_delay + self.delay_adjustment < 0:
-            logger.warning("Negative delay - resetting adjustment")
-            self.delay_adjustment = 0
-
-        self.previous_target = next_target
-        return base_delay + self.delay_adjustment
-
-    def __average_variables(self, list):
-        aggregated_dict = {}
-        # aggregate
-        for entry in list:
-            for k, v in entry.items():
-                if k not in aggregated_dict:
-                    aggregated_dict[k] = []
-                aggregated_dict[k].append(v)
-
-        out = {}
-        for k, v in aggregated_dict.items():
-            try:
-                mean = statistics.mean(v)
-                logger.debug(f"key: {k} - mean: {v} => {mean}")
-                out[k] = mean
-            except TypeError:  # not numeric
-                mode = statistics.mode(v)
-                out[k] = mode
-
-        return out
-
+    def input_variables(self, variables):
+        return self.averagers[0].input_variables(variables) if self.averagers else variables
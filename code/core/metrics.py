@@ -0,0 +1,227 @@
+import bisect
+import http.server
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Metrics
+# Latency histograms for each stage a sample passes through, so that a slow cycle can be traced to its cause.
+# | stage    | label            | building block | time taken                                                      |
+# |==========|==================|================|=================================================================|
+# | cycle    | measurement name | measure        | one cycle of the measurement module - sampling every stack      |
+# | sample   | device tag       | measure        | the device read, including any wait for its bus                 |
+# | pipeline | pipeline tag     | measure        | the pipeline's calculations                                     |
+# | output   | output name      | measure        | report by exception check and rendering the message             |
+# | zmq      |                  | mqtt_out       | handing a message to zmq in measure until mqtt_out receives it  |
+# | publish  |                  | mqtt_out       | handing a message to the MQTT client until it is sent or acked  |
+#
+# | bus_wait | interface tag    | measure        | a blocking sample() waiting for its bus (see bus_scheduler)     |
+#
+# Histograms are cumulative from start up (as Prometheus expects) with geometric buckets from 1us to 100s, ~12% apart.
+# Percentiles are the upper bound of the bucket they fall in, capped at the largest value seen.
+# Timestamps are taken with time.monotonic, which is shared between the building block processes.
+#
+# Gauges are values that are set rather than timed - the latest value of each is exported:
+# | gauge                | label         | value                                                            |
+# |======================|===============|==================================================================|
+# | bus_utilisation      | interface tag | fraction of the last report interval the bus was busy            |
+# | bus_queue_depth_mean | interface tag | mean number of transactions waiting over the last report interval |
+# | bus_queue_depth_max  | interface tag | most transactions waiting over the last report interval          |
+#
+# Exporters - each building block exports its own metrics:
+#  - PrometheusExporter - text format on http://<host>:<port>/metrics, served on a background thread
+#                         (measure uses prometheus_port, mqtt_out prometheus_port + 1)
+#  - MQTTExporter       - a snapshot every <interval> seconds on the topic metrics/<service_module_name>
+#
+# config ([metrics]):
+# | key             | meaning                                                  | default   |
+# |=================|==========================================================|===========|
+# | enabled         | time each stage - nothing is timed when false            | false     |
+# | mqtt            | publish snapshots on metrics/<service_module_name>       | true      |
+# | interval        | seconds between MQTT snapshots                           | 60        |
+# | prometheus_port | port for the Prometheus endpoint - not served if not set |           |
+# | prometheus_host | address the Prometheus endpoint listens on               | "0.0.0.0" |
+
+BUCKETS = tuple(1e-6 * 10 ** (k / 20) for k in range(161))  # upper bounds in seconds - plus an overflow bucket
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    # observe() is called from a single thread per histogram and is left unlocked to keep it cheap - readers on
+    # other threads may see a count that is one observation behind the buckets
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, fraction):
+        target = fraction * self.count
+        count = 0
+        for index, bucket_count in enumerate(self.buckets):
+            count += bucket_count
+            if count >= target and count:
+                return min(BUCKETS[index], self.max) if index < len(BUCKETS) else self.max
+        return 0
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            **{f"p{round(100 * q)}": self.quantile(q) for q in QUANTILES},
+            'max': self.max,
+        }
+
+
+class Metrics:
+    def __init__(self, building_block, clock=time.monotonic):
+        self.building_block = building_block
+        self.clock = clock
+        self.histograms = {}  # (stage, label): Histogram
+        self.gauges = {}  # (name, label): value
+        self.gauge_help = {}  # name: description
+
+    def histogram(self, stage, label=""):
+        histogram = self.histograms.get((stage, label))
+        if histogram is None:
+            histogram = self.histograms[(stage, label)] = Histogram()
+        return histogram
+
+    def observe(self, stage, label, seconds):
+        self.histogram(stage, label).observe(seconds)
+
+    def set_gauge(self, name, label, value, description=""):
+        self.gauge_help.setdefault(name, description)
+        self.gauges[(name, label)] = value
+
+    def snapshot(self):
+        stages = {}
+        for (stage, label), histogram in list(self.histograms.items()):
+            stages.setdefault(stage, {})[label] = histogram.snapshot()
+        gauges = {}
+        for (name, label), value in list(self.gauges.items()):
+            gauges.setdefault(name, {})[label] = value
+        return {'building_block': self.building_block, 'stages': stages, 'gauges': gauges}
+
+    def prometheus_text(self):
+        name = "sensing_stage_latency_seconds"
+        lines = [f"# HELP {name} Time taken by each stage a sample passes through",
+                 f"# TYPE {name} summary"]
+        maxima = [f"# HELP {name}_max Longest time taken by each stage",
+                  f"# TYPE {name}_max gauge"]
+        for (stage, label), histogram in sorted(list(self.histograms.items())):
+            labels = f'building_block="{self.building_block}",stage="{stage}",label="{escape_label(label)}"'
+            for q in QUANTILES:
+                lines.append(f'{name}{{{labels},quantile="{q}"}} {histogram.quantile(q):.9g}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.9g}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+            maxima.append(f'{name}_max{{{labels}}} {histogram.max:.9g}')
+
+        gauges = []
+        for (gauge, label), value in sorted(list(self.gauges.items())):
+            name = f"sensing_{gauge}"
+            if f"# TYPE {name} gauge" not in gauges:
+                gauges += [f"# HELP {name} {self.gauge_help.get(gauge) or gauge}", f"# TYPE {name} gauge"]
+            gauges.append(f'{name}{{building_block="{self.building_block}",label="{escape_label(label)}"}} {value:.9g}')
+        return "\n".join(lines + maxima + gauges) + "\n"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def create_metrics(config, building_block):
+    """Returns a Metrics registry, or None when metrics are disabled"""
+    if not config.get('enabled', False):
+        return None
+    return Metrics(building_block)
+
+
+def create_exporters(metrics, config, publish, port_offset=0):
+    """Exporters for the metrics config - publish(snapshot) is used for MQTT snapshots"""
+    if metrics is None:
+        return []
+    exporters = []
+    if config.get('mqtt', True):
+        exporters.append(MQTTExporter(metrics, publish, config.get('interval', 60)))
+    if config.get('prometheus_port') is not None:
+        exporters.append(PrometheusExporter(metrics, config['prometheus_port'] + port_offset,
+                                            config.get('prometheus_host', "0.0.0.0")))
+    return exporters
+
+
+class MQTTExporter:
+    def __init__(self, metrics, publish, interval=60, clock=time.monotonic):
+        self.metrics = metrics
+        self.publish = publish
+        self.interval = interval
+        self.clock = clock
+        self.last_export = clock()
+
+    def start(self):
+        pass
+
+    def poll(self):
+        now = self.clock()
+        if now - self.last_export < self.interval:
+            return
+        self.last_export = now
+        self.publish(self.metrics.snapshot())
+
+    def stop(self):
+        pass
+
+
+class PrometheusExporter:
+    def __init__(self, metrics, port, host="0.0.0.0"):
+        self.metrics = metrics
+        self.port = port
+        self.host = host
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        metrics = self.metrics
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self.server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            logger.error(f"Unable to serve metrics on {self.host}:{self.port}: {e}")
+            return
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics_http", daemon=True)
+        self.thread.start()
+        logger.info(f"Serving {self.metrics.building_block} metrics on http://{self.host}:{self.port}/metrics")
+
+    def poll(self):
+        pass
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
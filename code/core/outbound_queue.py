@@ -0,0 +1,65 @@
+import logging
+import os
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+
+# Persistent outbound queue
+# Holds messages that could not be published (e.g. while the broker is unreachable) so that they survive restarts of
+# the mqtt_out building block and of the container (when placed on a persistent volume).
+# Messages are stored in an SQLite database in WAL mode and are returned oldest first.
+# The queue is bounded - once it holds max_messages, the oldest messages are evicted to make space for new ones.
+
+class PersistentQueue:
+    def __init__(self, path, max_messages=100000):
+        self.path = path
+        self.max_messages = max_messages
+        self.evicted = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT NOT NULL, payload BLOB)")
+        self.count = self.connection.execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+        if self.count:
+            logger.info(f"Outbound queue at {path} holds {self.count} messages")
+
+    def __len__(self):
+        return self.count
+
+    def put(self, topic, payload):
+        self.put_many([(topic, payload)])
+
+    def put_many(self, messages):
+        with self.connection:
+            self.connection.execute("BEGIN")
+            cursor = self.connection.executemany("INSERT INTO queue (topic, payload) VALUES (?, ?)", messages)
+            self.count += cursor.rowcount
+            if self.count > self.max_messages:
+                self.__evict(self.count - self.max_messages)
+
+    def peek(self, n):
+        """Returns up to n of the oldest messages as a list of (id, topic, payload) without removing them"""
+        return self.connection.execute("SELECT id, topic, payload FROM queue ORDER BY id LIMIT ?", (n,)).fetchall()
+
+    def remove_up_to(self, message_id):
+        """Removes all messages up to and including message_id"""
+        cursor = self.connection.execute("DELETE FROM queue WHERE id <= ?", (message_id,))
+        self.count -= cursor.rowcount
+
+    def close(self):
+        self.connection.close()
+
+    def __evict(self, n):
+        cursor = self.connection.execute(
+            "DELETE FROM queue WHERE id IN (SELECT id FROM queue ORDER BY id LIMIT ?)", (n,))
+        self.count -= cursor.rowcount
+        if self.evicted == 0:
+            logger.warning(f"Outbound queue full ({self.max_messages} messages) - discarding oldest messages")
+        self.evicted += cursor.rowcount
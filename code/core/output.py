@@ -93,6 +93,156 @@ def generate_json_path_message(input_dataset, spec, append=False):
     return from_flat_tree(output)
 
 
+# Compiled message templates
+# generate_json_path_message re-parses the spec on every call. For repeated use of the same spec (as is the case for
+# each output in the measure loop) the spec can be compiled once into a MessageTemplate:
+#  - each leaf is classified once and jsonpath leaves are parsed once
+#  - simple jsonpaths (e.g. "$.a.b") are reduced to plain key lookups
+#  - the nested structure of the output is built once as a skeleton
+# render() then only has to fill in the values for each new dataset.
+# The output matches generate_json_path_message(input_dataset, spec) (append=False)
+
+_MISSING = object()
+
+
+class MessageTemplate:
+    def __init__(self, spec):
+        self.spec = spec
+        self.variables = set()  # top level variables of the dataset used by the template - None if not known
+
+        leaves = {}
+        for leaf_path, leaf_value in to_flat_tree(spec).items():
+            leaves[leaf_path] = self.__compile_leaf(leaf_value)
+        self.skeleton = _compile_node(from_flat_tree(leaves))
+
+    def render(self, input_dataset):
+        if self.skeleton is None:
+            return None
+        output = self.skeleton.render(input_dataset)
+        return None if output is _MISSING else output
+
+    def __compile_leaf(self, leaf_value):
+        leaf_type, true_value = get_leaf_type(leaf_value)
+        if leaf_type != LEAF.JSONPATH:
+            return _ConstantLeaf(true_value)
+
+        expression = jsonpath_rw.parse(true_value)
+        keys = _simple_path_keys(expression)
+        if keys is None:
+            self.variables = None
+            return _JsonPathLeaf(leaf_value, expression)
+
+        if not keys:  # "$" - the whole dataset
+            self.variables = None
+        elif self.variables is not None:
+            self.variables.add(keys[0])
+        return _KeyPathLeaf(leaf_value, keys)
+
+
+def compile_json_path_message(spec):
+    return MessageTemplate(spec)
+
+
+def _simple_path_keys(expression):
+    # returns the list of keys for jsonpaths that are only a chain of single field lookups - otherwise None
+    if isinstance(expression, jsonpath_rw.Root):
+        return []
+    if isinstance(expression, jsonpath_rw.Fields):
+        if len(expression.fields) == 1 and expression.fields[0] != '*':
+            return [expression.fields[0]]
+        return None
+    if isinstance(expression, jsonpath_rw.Child):
+        left = _simple_path_keys(expression.left)
+        right = _simple_path_keys(expression.right)
+        if left is None or right is None or isinstance(expression.right, jsonpath_rw.Root):
+            return None
+        return left + right
+    return None
+
+
+def _compile_node(node):
+    if isinstance(node, dict):
+        return _DictNode([(key, _compile_node(value)) for key, value in node.items()])
+    if isinstance(node, list):
+        return _ListNode([_compile_node(value) for value in node])
+    return node
+
+
+class _DictNode:
+    __slots__ = ('children',)
+
+    def __init__(self, children):
+        self.children = children
+
+    def render(self, input_dataset):
+        output = {}
+        for key, child in self.children:
+            value = child.render(input_dataset)
+            if value is not _MISSING:
+                output[key] = value
+        return output if output else _MISSING
+
+
+class _ListNode:
+    __slots__ = ('children',)
+
+    def __init__(self, children):
+        self.children = children
+
+    def render(self, input_dataset):
+        output = []
+        for child in self.children:
+            value = child.render(input_dataset)
+            if value is not _MISSING:
+                output.append(value)
+        return output if output else _MISSING
+
+
+class _ConstantLeaf:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def render(self, _input_dataset):
+        return self.value
+
+
+class _KeyPathLeaf:
+    __slots__ = ('leaf_value', 'keys')
+
+    def __init__(self, leaf_value, keys):
+        self.leaf_value = leaf_value
+        self.keys = keys
+
+    def render(self, input_dataset):
+        value = input_dataset
+        try:
+            for key in self.keys:
+                value = value[key]
+        except (TypeError, KeyError, AttributeError):
+            logger.warning(f"json_path {self.leaf_value} return no data and was ignored")
+            return _MISSING
+        return value
+
+
+class _JsonPathLeaf:
+    __slots__ = ('leaf_value', 'expression')
+
+    def __init__(self, leaf_value, expression):
+        self.leaf_value = leaf_value
+        self.expression = expression
+
+    def render(self, input_dataset):
+        res = self.expression.find(input_dataset)
+        if len(res) == 0:
+            logger.warning(f"json_path {self.leaf_value} return no data and was ignored")
+            return _MISSING
+        if len(res) > 1:
+            logger.warning(f"json_path {self.leaf_value} returned more than one result - using first entry")
+        return res[0].value
+
+
 def get_leaf_type(leaf_value):
     if leaf_value[0] == '#':
         return LEAF.STRING, leaf_value[1:]
@@ -151,66 +301,47 @@ def from_flat_tree(path_leave_dict):
 
     for path_string, leaf_value in path_leave_dict.items():
         path_element_list = path_string.split('.')
-        branch = recursive_build_branch(path_element_list, leaf_value)
         if tree is None:
-            tree = clean_branch(branch)
-        else:
-            merge_branch(tree, branch)
+            tree = new_branch(path_element_list[0])
+        insert_leaf(tree, path_element_list, leaf_value)
 
     return tree
 
-# bottom up build
+# single pass top down build - each leaf is inserted by walking its path once from the root
 # a.b.[0].c => {a:{b:[{c:value}]}}
-def recursive_build_branch(path_list, value):
-    if len(path_list) == 0:
-        return value
-
-    current_element = path_list.pop(0)
-    array_element = current_element[0] == '[' and current_element[-1] == ']'
+def insert_leaf(tree, path_element_list, value):
+    node = tree
+    last_index = len(path_element_list) - 1
+    for depth, element in enumerate(path_element_list):
+        is_leaf = depth == last_index
+
+        if is_array_element(element):
+            if not isinstance(node, list):
+                raise Exception("Something went Badly wrong")
+            array_index = int(element[1:-1])
+            if array_index == len(node) or not node:  # a new array takes its first entry whatever the index
+                node.append(value if is_leaf else new_branch(path_element_list[depth + 1]))
+                node = node[-1]
+            elif array_index > len(node) or is_leaf:
+                raise Exception("Something went Badly wrong")
+            else:
+                node = node[array_index]
+        else:
+            if not isinstance(node, dict):
+                raise Exception("Something went Badly wrong")
+            if element not in node:
+                node[element] = value if is_leaf else new_branch(path_element_list[depth + 1])
+            elif is_leaf:
+                raise Exception("Something went Badly wrong")
+            node = node[element]
 
-    child_obj = recursive_build_branch(path_list, value)
 
-    if array_element:
-        array_index = int(current_element[1:-1])
-        return [(array_index, child_obj)]
-    else:
-        return {current_element: child_obj}
-
-# top down merge
-def merge_branch(tree, branch):
-    tree_is_dict = isinstance(tree, dict)
-    tree_is_list = isinstance(tree, list)
-    branch_is_dict = isinstance(branch, dict)
-    branch_is_list = isinstance(branch, list)
-
-    if tree_is_dict and branch_is_dict:
-        branch_key, branch_value = list(branch.items())[0]
-        if branch_key in tree:
-            merge_branch(tree[branch_key], branch_value)
-        else:
-            tree[branch_key] = clean_branch(branch_value)
-    elif tree_is_list and branch_is_list:
-        branch_index, branch_value = branch[0]
-        if branch_index < len(tree):
-            merge_branch(tree[branch_index], branch_value)
-        elif branch_index == len(tree):
-            tree.append(clean_branch(branch_value))
-        else:
-            raise Exception("Something went Badly wrong")
-    else:
-        raise Exception("Something went Badly wrong")
+def is_array_element(element):
+    return element[:1] == '[' and element[-1:] == ']'
 
 
-def clean_branch(branch):
-    if isinstance(branch, dict):
-        branch_key, branch_value = list(branch.items())[0]
-        return {branch_key: clean_branch(branch_value)}
-    elif isinstance(branch, list):
-        branch_index, branch_value = branch.pop()
-        branch.append(branch_value)
-        return [clean_branch(branch_value)]
-    else:
-        return branch
+def new_branch(element):
+    return [] if is_array_element(element) else {}
 
 def generate_basic_output(input_dataset, output_spec):
     payload = {}
@@ -1,25 +1,176 @@
 import traceback
 import logging
+import core.blocks
 import core.exceptions
 
 logger = logging.getLogger(__name__)
 
+
+# Affine fusion
+# Calculation modules whose output is a*input + b (GenAmplifier, VoltageClamp, RMSToPeak, MultiplierOffset,
+# OffsetMultiplier, PowerToCurrent) say so with an affine() method returning (input, output, a, b).
+# When initialised, runs of two or more consecutive affine modules are folded into one AffineChain, which sets every
+# variable the run would set with a single precomputed a*x + b from the variables as they were before the run.
+# Results can differ from step by step execution in the last bit or so of precision.
+# If an input of the run is missing, None or can not be calculated with, the modules of the run are executed one by one
+# as normal so that their warnings and errors are the same.
+
+# Dead variable elimination
+# require(variables) limits the pipeline to the calculation modules that lead to the given variables (see
+# core.dead_variables). Modules say which variables they read and set with a dependencies() method returning
+# (inputs, outputs) - affine modules are worked out from affine(). Modules that say neither are always executed and
+# are assumed to read every variable. Modules only set their outputs when they can, so a value from earlier in the
+# pipeline can still get through and setting a variable never makes earlier modules unnecessary.
+# AffineChains only set the variables of their run that are used later.
+
 class Pipeline:
     def __init__(self,spec):
         self.spec = spec
         self.contents = []
+        self.steps = []  # calculation modules & AffineChains in execution order, with their index in spec
 
     def initialise(self,calculation_modules):
         for entry in self.spec:
             self.contents.append(calculation_modules[entry])
+        self.steps = compile_steps(self.contents)
+
+    def require(self, variables=None):
+        """Only executes the modules needed for variables (None - all) and returns the variables needed from the sample
+        (None - all)"""
+        live_after, needed = find_live_variables(self.contents, variables)
+        self.steps = compile_steps(self.contents, live_after)
+        skipped = [self.spec[index] for index, live in enumerate(live_after) if live is DEAD]
+        if skipped:
+            logger.info(f"Pipeline {self.spec}: results of {skipped} are not used - not executed")
+        return needed
 
     def execute(self,sample_dict):
+        # the blackboard is copied from the sample once and then updated in place by each step
         variables_dict = {**sample_dict}
-        for index,calc_module in enumerate(self.contents):
-            try:
-                output = calc_module.calculate(variables_dict)
-                variables_dict = {**variables_dict,**output}
-            except Exception as e:
-                logger.error(f"Error during calculation: {traceback.format_exc()}")
-                raise core.exceptions.CalculationError(str(e),self.spec[index])
-        return variables_dict
\ No newline at end of file
+        for index, step in self.steps:
+            if isinstance(step, AffineChain):
+                if step.calculate(variables_dict) is not None:
+                    continue
+                for module_index, calc_module in step.modules:
+                    self.__calculate(module_index, calc_module, variables_dict)
+            else:
+                self.__calculate(index, step, variables_dict)
+        return variables_dict
+
+    def __calculate(self, index, calc_module, variables_dict):
+        try:
+            output = calc_module.calculate(variables_dict)
+            if output is not variables_dict:  # modules normally update the blackboard and return it
+                variables_dict.update(output)
+        except Exception as e:
+            logger.error(f"Error during calculation: {traceback.format_exc()}")
+            raise core.exceptions.CalculationError(str(e),self.spec[index])
+
+
+DEAD = object()  # find_live_variables entry for a module whose results are not used
+
+
+def find_live_variables(contents, variables=None):
+    """Returns the variables used after each module (None - all, DEAD - the module is not needed) and the variables
+    needed from the sample (None - all)"""
+    live = None if variables is None else set(variables)
+    live_after = [None] * len(contents)
+    for index in reversed(range(len(contents))):
+        dependencies = get_dependencies(contents[index])
+        if dependencies is None:
+            live_after[index] = live
+            live = None
+            continue
+        inputs, outputs = dependencies
+        if live is not None and live.isdisjoint(outputs):
+            live_after[index] = DEAD
+            continue
+        live_after[index] = live
+        if live is not None:
+            live = live | inputs
+    return live_after, live
+
+
+def get_dependencies(calc_module):
+    """Returns ({variables read}, {variables set}) for a calculation module - None if it does not say"""
+    if hasattr(calc_module, 'dependencies'):
+        try:
+            inputs, outputs = calc_module.dependencies()
+        except Exception:
+            return None
+        return set(inputs), set(outputs)
+    affine = get_affine(calc_module)
+    if affine is None:
+        return None
+    var_in, var_out, _a, _b = affine
+    return {var_in}, {var_out}
+
+
+def compile_steps(contents, live_after=None):
+    """Returns [(index in contents, step)] with runs of affine calculation modules folded into AffineChains and
+    modules that are DEAD in live_after left out"""
+    steps = []
+    run = []
+
+    def end_run():
+        if len(run) > 1:
+            used = live_after[run[-1][0]] if live_after is not None else None
+            steps.append((run[0][0], AffineChain(run, used)))
+        else:
+            steps.extend((index, module) for index, module, _affine in run)
+        run.clear()
+
+    for index, calc_module in enumerate(contents):
+        if live_after is not None and live_after[index] is DEAD:
+            continue
+        affine = get_affine(calc_module)
+        if affine is not None:
+            run.append((index, calc_module, affine))
+        else:
+            end_run()
+            steps.append((index, calc_module))
+    end_run()
+    return steps
+
+
+def get_affine(calc_module):
+    # modules with invalid config (e.g. no gain) are left to report their errors when executed
+    if not hasattr(calc_module, 'affine'):
+        return None
+    try:
+        var_in, var_out, a, b = calc_module.affine()
+    except Exception:
+        return None
+    if not isinstance(a, (int, float)) or not isinstance(b, (int, float)):
+        return None
+    return var_in, var_out, a, b
+
+
+class AffineChain:
+    def __init__(self, run, used=None):
+        # run - [(index in contents, calc_module, affine)], used - variables used after the run (None - all)
+        self.modules = [(index, calc_module) for index, calc_module, _affine in run]
+        terms = {}  # variable set: (variable read before the run, a, b)
+        for _index, _calc_module, (var_in, var_out, a, b) in run:
+            source, a_in, b_in = terms.get(var_in, (var_in, 1, 0))
+            terms[var_out] = (source, a * a_in, a * b_in + b)
+        # intermediate variables that are not used later are not set
+        self.terms = [(variable, source, a, b) for variable, (source, a, b) in terms.items()
+                      if used is None or variable in used]
+        self.sources = list(dict.fromkeys(source for _variable, source, _a, _b in self.terms))
+
+    def calculate(self, var_dict):
+        """Sets the variables of the whole run - returns None if the modules need to be executed one by one"""
+        try:
+            values = {}
+            for source in self.sources:
+                value = var_dict.get(source)
+                if value is None:
+                    return None
+                values[source] = core.blocks.as_block(value)
+            results = [(variable, values[source] * a + b) for variable, source, a, b in self.terms]
+        except Exception:
+            return None
+        for variable, value in results:
+            var_dict[variable] = value
+        return var_dict
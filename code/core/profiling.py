@@ -0,0 +1,138 @@
+import cProfile
+import datetime
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# On-demand profiling
+# Captures <duration> seconds of profile data from a running building block, writes it to <path> and switches itself
+# off. A capture is started by SIGUSR1 (main forwards it to every building block) or, with on_start = true, when the
+# building block starts. A trigger while a capture is running is ignored, so it is safe to send repeatedly.
+#
+# modes:
+#  - sample   - a background thread samples the stack of every thread each <interval> seconds and writes
+#               <building block>-<time>.folded - one "thread;file:function;... count" line per distinct stack,
+#               the input to flamegraph.pl, speedscope and similar tools
+#  - cprofile - cProfile traces every call on the building block's main thread and writes <building block>-<time>.prof
+#               (pstats format - flameprof or snakeviz turn it into a flame graph)
+#
+# Effect on the measurement deadlines:
+#  - sample   - each sample holds the GIL while the stacks are walked, typically 20-100us for the few threads a building
+#               block runs, so a deadline is delayed by at most one sample and the overall slowdown is below 1% at the
+#               default interval. Files are written from the sampling thread.
+#  - cprofile - every Python call is slowed down (commonly 1.5-3x the CPU time) for the whole capture, so cycles whose
+#               work is close to their period will overrun - use sample mode on units that are already late.
+#
+# config ([profiling]):
+# | key      | meaning                                                 | default           |
+# |==========|=========================================================|===================|
+# | enabled  | start a capture on SIGUSR1                              | true              |
+# | on_start | start a capture when the building block starts          | false             |
+# | mode     | sample or cprofile                                      | "sample"          |
+# | duration | length of a capture (seconds)                           | 30                |
+# | interval | time between stack samples in sample mode (seconds)     | 0.01              |
+# | path     | directory the profiles are written to                   | "./data/profiles" |
+
+SAMPLE = "sample"
+CPROFILE = "cprofile"
+
+
+class Profiler:
+    def __init__(self, config, building_block, clock=time.monotonic):
+        self.building_block = building_block
+        self.enabled = config.get('enabled', True)
+        self.mode = config.get('mode', SAMPLE)
+        self.duration = config.get('duration', 30)
+        self.interval = config.get('interval', 0.01)
+        self.path = config.get('path', './data/profiles')
+        self.clock = clock
+
+        self.requested = config.get('on_start', False)
+        self.running = False
+        self.profile = None
+        self.stop_at = None
+        self.last_file = None
+
+    def request(self):
+        """Asks for a capture to start at the next poll() - safe to call from a signal handler"""
+        if self.enabled:
+            self.requested = True
+
+    def poll(self):
+        """Starts and stops captures - called regularly from the building block's main thread"""
+        if self.requested:
+            self.requested = False
+            if self.running:
+                logger.info("Profiling already in progress - request ignored")
+            else:
+                self.start()
+        elif self.profile is not None and self.clock() >= self.stop_at:
+            self.stop_cprofile()
+
+    def start(self):
+        self.running = True
+        logger.info(f"Profiling {self.building_block} ({self.mode}) for {self.duration}s")
+        if self.mode == CPROFILE:
+            self.stop_at = self.clock() + self.duration
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            threading.Thread(target=self.sample, args=(threading.main_thread().ident,), name="profiler",
+                             daemon=True).start()
+
+    def stop_cprofile(self):
+        profile, self.profile = self.profile, None
+        profile.disable()
+        # written off the main thread so that the measurement is not held up
+        threading.Thread(target=self.write, args=(profile.dump_stats, "prof"), name="profiler", daemon=True).start()
+
+    def sample(self, main_thread_ident):
+        own_ident = threading.get_ident()
+        stacks = {}
+        end = self.clock() + self.duration
+        while self.clock() < end:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                thread_name = "main" if ident == main_thread_ident else names.get(ident, str(ident))
+                stack = fold_stack(thread_name, frame)
+                stacks[stack] = stacks.get(stack, 0) + 1
+            time.sleep(self.interval)
+
+        def write_folded(file_name):
+            with open(file_name, "w") as f:
+                for stack, count in sorted(stacks.items()):
+                    f.write(f"{stack} {count}\n")
+
+        self.write(write_folded, "folded")
+
+    def write(self, writer, extension):
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            timestamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+            file_name = os.path.join(self.path, f"{self.building_block}-{timestamp}.{extension}")
+            writer(file_name)
+            self.last_file = file_name
+            logger.info(f"Profile written to {file_name}")
+        except OSError as e:
+            logger.error(f"Unable to write profile: {e}")
+        finally:
+            self.running = False
+
+
+def fold_stack(thread_name, frame):
+    """Returns the stack of frame as "thread;file:function;..." - outermost call first"""
+    entries = []
+    while frame is not None:
+        code = frame.f_code
+        entries.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    entries.append(thread_name)
+    entries.reverse()
+    return ";".join(entries).replace(" ", "_")
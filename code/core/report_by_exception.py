@@ -0,0 +1,93 @@
+import logging
+import numbers
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Report by exception
+# Used to filter an output so that it is only published when something has meaningfully changed.
+# The values of the variables used by the output are compared against the values that were last sent:
+#  - numeric variables have changed when they move by more than their deadband
+#  - other variables have changed when they are not equal to the value last sent - values that do not compare to a
+#    single True or False (e.g. numpy arrays) always count as changed
+#  - a variable appearing or disappearing counts as a change
+# If a heartbeat is set, the output is also published when nothing has been sent for that many seconds.
+#
+# config:
+# | key              | meaning                                                         | default |
+# |==================|=================================================================|=========|
+# | heartbeat        | publish at least once every <heartbeat> seconds                 | None    |
+# | deadband         | absolute deadband applied to all numeric variables              | 0       |
+# | deadband_percent | deadband as a percentage of the last sent value                 | 0       |
+# | ignore           | variables that are never compared                               | ["timestamp"] |
+# | variables        | per variable overrides e.g. variables.temperature.deadband=0.2 | {}      |
+#
+# When both an absolute and a percentage deadband apply to a variable the larger of the two is used.
+
+class ReportByException:
+    def __init__(self, config, variables=None, clock=time.monotonic):
+        self.heartbeat = config.get('heartbeat')
+        self.deadband = config.get('deadband', 0)
+        self.deadband_percent = config.get('deadband_percent', 0)
+        self.variable_config = config.get('variables', {})
+        self.ignore = set(config.get('ignore', ['timestamp']))
+
+        self.variables = None if variables is None else [v for v in variables if v not in self.ignore]
+        self.clock = clock
+
+        self.deadbands = {}
+        self.last_sent = None
+        self.last_sent_time = None
+
+    def should_publish(self, dataset):
+        now = self.clock()
+        current = self.__select(dataset)
+
+        if self.last_sent is None \
+                or (self.heartbeat is not None and now - self.last_sent_time >= self.heartbeat) \
+                or self.__changed(current):
+            self.last_sent = current
+            self.last_sent_time = now
+            return True
+        return False
+
+    def __select(self, dataset):
+        if self.variables is None:
+            return {k: v for k, v in dataset.items() if k not in self.ignore}
+        return {k: dataset[k] for k in self.variables if k in dataset}
+
+    def __changed(self, current):
+        if current.keys() != self.last_sent.keys():
+            return True
+
+        for key, value in current.items():
+            last_value = self.last_sent[key]
+            if is_number(value) and is_number(last_value):
+                absolute, percent = self.__get_deadband(key)
+                threshold = max(absolute, abs(last_value) * percent / 100)
+                if abs(value - last_value) > threshold:
+                    return True
+            elif not is_equal(value, last_value):
+                return True
+        return False
+
+    def __get_deadband(self, key):
+        deadband = self.deadbands.get(key)
+        if deadband is None:
+            variable_config = self.variable_config.get(key, {})
+            deadband = (variable_config.get('deadband', self.deadband),
+                        variable_config.get('deadband_percent', self.deadband_percent))
+            self.deadbands[key] = deadband
+        return deadband
+
+
+def is_equal(value, last_value):
+    try:
+        return bool(value == last_value)
+    except (TypeError, ValueError):  # e.g. "the truth value of an array is ambiguous"
+        return False
+
+
+def is_number(value):
+    return isinstance(value, numbers.Real) and not isinstance(value, bool)
@@ -0,0 +1,134 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Deadline scheduler
+# Used by the measurement modules to work out how long to wait before the next cycle.
+# Cycles are scheduled against absolute deadlines on the monotonic clock - anchor + k * period - where the anchor is
+# the start of the first cycle. Variations in how long a cycle takes do not move later deadlines, so there is no
+# drift however long the service module runs.
+#
+# A cycle that is still running when one or more later deadlines pass has overrun. The policy decides what happens:
+# | policy   | behaviour                                                                                   |
+# |==========|=============================================================================================|
+# | skip     | the missed deadlines are dropped and the next cycle waits for the next deadline on the grid |
+# | catch_up | the missed cycles are run back to back (at most max_catch_up of them) until back on time    |
+#
+# Usage - in a measurement module's loop():
+#   self.scheduler.start()          # as the cycle starts - records how late it started
+#   ...sample...
+#   return self.scheduler.next_delay(), var_dict
+#
+# Per cycle lateness, jitter (mean change in lateness between consecutive cycles) and overruns are logged every
+# <report_interval> seconds.
+
+class DeadlineScheduler:
+    POLICIES = ("skip", "catch_up")
+
+    def __init__(self, period, policy="skip", max_catch_up=10, name="measurement", clock=time.monotonic,
+                 report_interval=60):
+        self.period = period
+        self.policy = policy
+        if self.policy not in self.POLICIES:
+            logger.warning(f"Unknown overrun policy '{self.policy}' - using skip")
+            self.policy = "skip"
+        self.max_catch_up = max_catch_up
+        self.clock = clock
+
+        self.anchor = None
+        self.cycle = 0  # k of the current deadline
+        self.deadline = None
+        self.behind = 0  # number of passed deadlines, including the current one, while catching up
+        self.stats = ScheduleStats(name, clock, report_interval)
+
+    def start(self):
+        now = self.clock()
+        if self.anchor is None:
+            self.anchor = self.deadline = now
+        self.stats.record_start(now - self.deadline)
+
+    def next_delay(self):
+        now = self.clock()
+        if self.anchor is None:
+            self.anchor = self.deadline = now
+
+        self.cycle += 1
+        deadline = self.anchor + self.cycle * self.period
+        if deadline <= now:
+            missed = int((now - deadline) // self.period) + 1
+            # while catching up the deadlines missed earlier are not counted again
+            newly_missed = missed - max(self.behind - 1, 0)
+            if newly_missed > 0:
+                self.stats.record_overrun(newly_missed)
+
+            if self.policy == "skip":
+                self.cycle += missed
+                self.behind = 0
+            else:
+                if missed > self.max_catch_up:
+                    self.cycle += missed - self.max_catch_up
+                    missed = self.max_catch_up
+                self.behind = missed
+            deadline = self.anchor + self.cycle * self.period
+        else:
+            self.behind = 0
+
+        self.deadline = deadline
+        self.stats.report()
+        return max(deadline - now, 0)
+
+
+class ScheduleStats:
+    def __init__(self, name, clock=time.monotonic, interval=60):
+        self.name = name
+        self.clock = clock
+        self.interval = interval
+        self.last_report = clock()
+        self.previous_lateness = None
+        self.reset()
+
+    def reset(self):
+        self.cycles = 0
+        self.total_lateness = 0
+        self.max_lateness = 0
+        self.total_jitter = 0
+        self.jitter_samples = 0
+        self.overruns = 0
+        self.missed = 0
+
+    def record_start(self, lateness):
+        self.cycles += 1
+        self.total_lateness += lateness
+        if lateness > self.max_lateness:
+            self.max_lateness = lateness
+        if self.previous_lateness is not None:
+            self.total_jitter += abs(lateness - self.previous_lateness)
+            self.jitter_samples += 1
+        self.previous_lateness = lateness
+
+    def record_overrun(self, missed):
+        self.overruns += 1
+        self.missed += missed
+
+    def mean_lateness(self):
+        return self.total_lateness / self.cycles if self.cycles else 0
+
+    def jitter(self):
+        return self.total_jitter / self.jitter_samples if self.jitter_samples else 0
+
+    def report(self):
+        now = self.clock()
+        if now - self.last_report < self.interval:
+            return
+        if self.cycles:
+            message = (f"{self.name}: {self.cycles} cycles in {now - self.last_report:.0f}s - "
+                       f"lateness mean: {1000 * self.mean_lateness():.1f}ms max: {1000 * self.max_lateness:.1f}ms - "
+                       f"jitter: {1000 * self.jitter():.1f}ms - overruns: {self.overruns} ({self.missed} deadlines)")
+            if self.overruns:
+                logger.warning(message)
+            else:
+                logger.info(message)
+        self.reset()
+        self.last_report = now
@@ -1,45 +1,126 @@
 import traceback
 import logging
 import asyncio
+import core.circuit_breaker
 import core.exceptions
 
 logger = logging.getLogger(__name__)
 
 
 class SensingStack:
-    def __init__(self, config):
+    def __init__(self, config, interface_tag=None):
         self.device_tag = config['device']
         self.pipeline_tag = config['pipeline']
+        self.interface_tag = interface_tag
         self.prefix = config.get('prefix')
         self.constants = config.get('constants')
+        self.timeout = config.get('timeout')
+        self.offload = config.get('offload', True)
+        self.priority = config.get('priority', 0)
+        self.breaker_config = config.get('circuit_breaker', {})
+
+        # prefixed names are worked out once rather than for every sample
+        self.prefixed_keys = {}
+        self.prefixed_constants = None
+        if self.prefix is not None and self.constants is not None:
+            self.prefixed_constants = {self.prefix + key: value for key, value in self.constants.items()}
 
         self.device = None
         self.pipeline = None
+        self.interface = None
+        self.buses = None
+        self.breaker = None
+        self.sample_timer = None
+        self.pipeline_timer = None
 
-    def initialise(self, devices, pipelines):
+    def initialise(self, devices, pipelines, buses=None, interfaces=None, on_breaker_change=None, metrics=None):
         self.device = devices[self.device_tag]
         self.pipeline = pipelines[self.pipeline_tag]
+        self.interface = interfaces.get(self.interface_tag) if interfaces is not None else None
+        # blocking sample() implementations are queued on the interface's bus scheduler rather than run on the loop
+        if self.offload and buses is not None and not asyncio.iscoroutinefunction(self.device.sample):
+            self.buses = buses
+        if self.breaker_config.get('enabled', True):
+            on_change = (lambda breaker, reason: on_breaker_change(self, breaker, reason)) \
+                if on_breaker_change is not None else None
+            self.breaker = core.circuit_breaker.CircuitBreaker(self.breaker_config, on_change=on_change)
+        if metrics is not None:
+            self.clock = metrics.clock
+            self.sample_timer = metrics.histogram('sample', self.device_tag)
+            self.pipeline_timer = metrics.histogram('pipeline', self.pipeline_tag)
 
     async def execute(self):
+        """Samples the device and runs the pipeline - returns None while the stack's circuit breaker is open"""
+        if self.breaker is None:
+            return await self.__execute()
+
+        if not self.breaker.allow():
+            return None
+        try:
+            if self.breaker.state == core.circuit_breaker.HALF_OPEN:
+                await self.__reinitialise_device()
+            output_dict = await self.__execute()
+        except core.exceptions.SampleError as e:
+            self.breaker.record_failure(f"Sample error: {e}")
+            return None
+        except core.exceptions.CalculationError as e:
+            self.breaker.record_failure(f"Calculation error in {e.module}: {e}")
+            return None
+        self.breaker.record_success()
+        return output_dict
+
+    async def __reinitialise_device(self):
+        try:
+            if self.buses is not None:
+                await self.buses.run(self.interface_tag, self.device.initialise, self.interface, priority=self.priority)
+            else:
+                self.device.initialise(self.interface)
+        except Exception as e:
+            logger.error(f"Error reinitialising device: {traceback.format_exc()}")
+            raise core.exceptions.SampleError(str(e), self.device_tag)
+
+    async def __execute(self):
+        timed = self.sample_timer is not None
+        if timed:
+            started = self.clock()
         try:
-            sample_resp = self.device.sample()
+            if self.buses is not None:
+                sample_resp = await self.buses.run(self.interface_tag, self.device.sample, priority=self.priority)
+            else:
+                sample_resp = self.device.sample()
 
             if asyncio.iscoroutine(sample_resp):
                 sample_dict = await sample_resp
             else:
                 sample_dict = sample_resp
 
-            logger.debug(f"sample: {sample_dict}")
+            logger.debug("sample: %s", sample_dict)
         except Exception as e:
             logger.error(f"Error during sampling: {traceback.format_exc()}")
             raise core.exceptions.SampleError(str(e),self.device_tag)
 
+        if timed:
+            sampled = self.clock()
+            self.sample_timer.observe(sampled - started)
         output_dict = self.pipeline.execute(sample_dict)
+        if timed:
+            self.pipeline_timer.observe(self.clock() - sampled)
 
-        if self.constants is not None:
-            output_dict = {**self.constants, **output_dict}
+        return self.add_constants_and_prefix(output_dict)
 
-        if self.prefix is not None:
-            return {self.prefix + key: value for key, value in output_dict.items()}
-        else:
+    def add_constants_and_prefix(self, output_dict):
+        # the pipeline returns a new dict, so it is added to in place - values from the pipeline take precedence
+        if self.prefix is None:
+            if self.constants is not None:
+                for key, value in self.constants.items():
+                    output_dict.setdefault(key, value)
             return output_dict
+
+        prefixed_dict = {**self.prefixed_constants} if self.prefixed_constants is not None else {}
+        prefixed_keys = self.prefixed_keys
+        for key, value in output_dict.items():
+            prefixed_key = prefixed_keys.get(key)
+            if prefixed_key is None:
+                prefixed_key = prefixed_keys[key] = self.prefix + key
+            prefixed_dict[prefixed_key] = value
+        return prefixed_dict
@@ -0,0 +1,64 @@
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+
+# Payload serialisers
+# In multipart transport mode the measure building block serialises each payload once and mqtt_out publishes the
+# resulting bytes as they are.
+#
+# | serialiser | payload format | notes                                                                    |
+# |============|================|==========================================================================|
+# | auto       | json           | orjson if it is installed, otherwise json                                |
+# | json       | json           | standard library - same bytes as the json transport mode publishes       |
+# | orjson     | json           | compact output, several times faster than json                           |
+# | msgpack    | msgpack        | changes what is published - subscribers must decode msgpack              |
+#
+# orjson is stricter than the json module (e.g. integers above 64 bits, non-string keys) - payloads that it rejects
+# are serialised with the json module instead.
+# orjson and msgpack are optional, if the selected serialiser is not installed the json serialiser is used.
+
+SERIALISERS = ("auto", "json", "orjson", "msgpack")
+
+
+def json_dumps(payload):
+    return json.dumps(payload).encode()
+
+
+def orjson_dumps(payload):
+    try:
+        return orjson.dumps(payload)
+    except TypeError:
+        return json_dumps(payload)
+
+
+def msgpack_dumps(payload):
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def get_serialiser(name="auto"):
+    if name == "auto":
+        name = "orjson" if orjson is not None else "json"
+
+    if name == "orjson":
+        if orjson is not None:
+            return orjson_dumps
+        logger.error("Serialiser orjson selected but orjson is not installed - using json")
+    elif name == "msgpack":
+        if msgpack is not None:
+            return msgpack_dumps
+        logger.error("Serialiser msgpack selected but msgpack is not installed - using json")
+    elif name != "json":
+        logger.error(f"Unknown serialiser '{name}' - using json")
+    return json_dumps
@@ -0,0 +1,123 @@
+import functools
+import html
+import logging
+from urllib.parse import urljoin
+
+import chevron
+import chevron.tokenizer
+
+logger = logging.getLogger(__name__)
+
+
+# Topic templates
+# Output topics are mustache templates filled in from the payload (e.g. "power_monitoring/{{machine}}").
+# Rendering with chevron parses the template on every call, but there are usually only a handful of distinct topics.
+# TopicCache compiles each distinct topic once:
+#  - topics without "{{" are returned as they are
+#  - topics that only use variable tags ({{x}}, {{{x}}}, {{&x}}) are assembled from their literal parts and the
+#    payload values, using the same lookup and escaping rules as chevron (get_key & html_escape below - chevron's own
+#    helpers are private)
+#  - anything else (sections, partials, etc.) falls back to chevron.render
+# Compiled topics are kept in a bounded LRU cache, so configs producing many distinct templates cannot grow it forever.
+# The topic base is joined on before rendering, so a value containing ':' or starting with '/' can not change where
+# the base goes - the measure building block renders multipart topics with the same base for the same result.
+# prefix() applies the base to a topic that is not a template.
+
+class TopicCache:
+    def __init__(self, topic_base="", max_size=256):
+        self.topic_base = topic_base
+        self.compile = functools.lru_cache(maxsize=max_size)(self.__compile)
+        self.prefix = functools.lru_cache(maxsize=max_size)(self.__prefix)
+
+    def render(self, topic, payload):
+        return self.compile(topic).render(payload)
+
+    def __prefix(self, topic):
+        return urljoin(self.topic_base, topic) if self.topic_base else topic
+
+    def __compile(self, topic):
+        full_topic = self.__prefix(topic)
+        if "{{" not in full_topic:
+            return LiteralTopic(full_topic)
+
+        try:
+            tokens = list(chevron.tokenizer.tokenize(full_topic))
+        except Exception:
+            return ChevronTopic(full_topic)
+
+        parts = []  # (None, literal text) or (variable key, html escape)
+        for tag, key in tokens:
+            if tag == 'literal':
+                parts.append((None, key))
+            elif tag in ('variable', 'no escape') and key != '.':
+                parts.append((key, tag == 'variable'))
+            else:
+                return ChevronTopic(full_topic)
+        return CompiledTopic(full_topic, parts)
+
+
+class LiteralTopic:
+    __slots__ = ('topic', 'variables')
+
+    def __init__(self, topic):
+        self.topic = topic
+        self.variables = ()
+
+    def render(self, _payload):
+        return self.topic
+
+
+class CompiledTopic:
+    __slots__ = ('topic', 'parts', 'variables')
+
+    def __init__(self, topic, parts):
+        self.topic = topic
+        self.parts = parts
+        self.variables = tuple(key for key, _text_or_escape in parts if key is not None)
+
+    def render(self, payload):
+        output = []
+        for key, text_or_escape in self.parts:
+            if key is None:
+                output.append(text_or_escape)
+                continue
+            thing = get_key(key, payload)
+            if not isinstance(thing, str):
+                thing = str(thing)
+            output.append(html_escape(thing) if text_or_escape else thing)
+        return ''.join(output)
+
+
+def get_key(key, payload):
+    """Looks up a dotted key as chevron does - '' when it is missing or falsy, except for 0 and False"""
+    value = payload
+    try:
+        for child in key.split('.'):
+            try:
+                value = value[child]
+            except (TypeError, AttributeError):
+                try:
+                    value = getattr(value, child)
+                except (TypeError, AttributeError):
+                    value = value[int(child)]
+    except (AttributeError, KeyError, IndexError, ValueError):
+        return ''
+    if value in (0, False):
+        return value
+    return value or ''
+
+
+def html_escape(text):
+    # chevron escapes & < > and " but not '
+    return html.escape(text, quote=False).replace('"', '&quot;')
+
+
+class ChevronTopic:
+    __slots__ = ('topic', 'variables')
+
+    def __init__(self, topic):
+        self.topic = topic
+        self.variables = None
+
+    def render(self, payload):
+        return chevron.render(self.topic, payload)
@@ -15,7 +15,7 @@ import mqtt_out
 logger = logging.getLogger("main")
 terminate_flag = False
 
-def create_building_blocks(config):
+def create_building_blocks(config, config_args=None):
     bbs = {}
 
     measure_out = {"type": zmq.PUSH,
@@ -24,7 +24,9 @@ def create_building_blocks(config):
                   "address": "tcp://127.0.0.1:4000", "bind": False}
 
     bbs["measure"] = {"class": measure.BuildingBlockFramework,
-                      "args": [config, measure_out]}
+                      "args": [config, measure_out, config_args],
+                      "reload": True,
+                      "config_args": config_args}
     bbs["wrapper"] = {"class": mqtt_out.MQTTServiceWrapper,
                       "args": [config, wrapper_in]}
 
@@ -63,9 +65,22 @@ def monitor_building_blocks(bbs):
                 logger.warning(
                     f"Building block {key} stopped with exit: {process.exitcode}")
                 logger.info(f"Restarting Building block {key}")
+                refresh_config(bbs[key])
                 start_building_block(bbs[key])
 
 
+def refresh_config(bb):
+    # a building block that reloads its config is restarted with the config as it is now -
+    # not the one it was first started with
+    config_args = bb.get('config_args')
+    if config_args is None:
+        return
+    try:
+        bb['args'][0] = config_manager.get_config(**config_args, wait_on_error=False)
+    except config_manager.ConfigError as e:
+        logger.error(f"Unable to re-read the config - restarting with the previous one: {e}")
+
+
 def graceful_signal_handler(sig, _frame):
     logger.info(
         f'Received {signal.Signals(sig).name}. Triggering graceful termination.')
@@ -75,6 +90,22 @@ def graceful_signal_handler(sig, _frame):
     signal.alarm(10)
 
 
+def reload_signal_handler(sig, _frame):
+    logger.info(f'Received {signal.Signals(sig).name}. Forwarding config reload to building blocks.')
+    for key in bbs:
+        process = bbs[key].get('process')
+        if bbs[key].get('reload', False) and process is not None and process.is_alive():
+            os.kill(process.pid, signal.SIGHUP)
+
+
+def profile_signal_handler(sig, _frame):
+    logger.info(f'Received {signal.Signals(sig).name}. Forwarding profiling request to building blocks.')
+    for key in bbs:
+        process = bbs[key].get('process')
+        if process is not None and process.is_alive():
+            os.kill(process.pid, signal.SIGUSR1)
+
+
 def harsh_signal_handler(sig, _frame):
     logger.debug(f'Received {signal.Signals(sig).name}.')
     if terminate_flag:
@@ -112,8 +143,10 @@ if __name__ == "__main__":
         signal.signal(signal.SIGTERM, graceful_signal_handler)
         signal.signal(signal.SIGALRM, harsh_signal_handler)
     
-        bbs = create_building_blocks(conf)
+        bbs = create_building_blocks(conf, {'arg_module_file': module_conf_file, 'arg_user_file': user_conf_file})
         start_building_blocks(bbs)
+        signal.signal(signal.SIGHUP, reload_signal_handler)
+        signal.signal(signal.SIGUSR1, profile_signal_handler)
         monitor_building_blocks(bbs)
 
     else:
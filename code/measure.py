@@ -6,10 +6,23 @@ import datetime
 import signal
 import asyncio
 import importlib
+import struct
 import core.pipeline
 import core.sensing_stack
 import core.output
+import core.report_by_exception
+import core.batching
+import core.serialisation
+import core.topic_template
+import core.interface_modules.bus_scheduler
 import core.exceptions
+import core.circuit_breaker
+import core.dead_variables
+import core.config_reload
+import core.metrics
+import core.profiling
+import core.device_modules.replay
+import utilities.config_manager as config_manager
 import zmq
 import sys
 
@@ -17,11 +30,27 @@ logger = logging.getLogger("main.measure")
 context = zmq.Context()
 
 terminate_flag = False
+reload_flag = False
+profile_flag = False
 
 
 def setup_signal_handlers():
     signal.signal(signal.SIGINT, graceful_signal_handler)
     signal.signal(signal.SIGTERM, graceful_signal_handler)
+    signal.signal(signal.SIGHUP, reload_signal_handler)
+    signal.signal(signal.SIGUSR1, profile_signal_handler)
+
+
+def profile_signal_handler(sig, _frame):
+    logger.info(f'Received {signal.Signals(sig).name}. Starting profiling.')
+    global profile_flag
+    profile_flag = True
+
+
+def reload_signal_handler(sig, _frame):
+    logger.info(f'Received {signal.Signals(sig).name}. Reloading config.')
+    global reload_flag
+    reload_flag = True
 
 
 def graceful_signal_handler(sig, _frame):
@@ -31,32 +60,84 @@ def graceful_signal_handler(sig, _frame):
     signal.alarm(10)
 
 
+# measurement is either a single measurement (with module, class, config and sensing_stacks)
+# or a table of named measurements e.g. [measurement.power] and [measurement.climate], each run as its own loop.
+# A single measurement is named "measurement".
+DEFAULT_MEASUREMENT = "measurement"
+
+
+def get_measurement_configs(measurement_config):
+    if 'module' in measurement_config:
+        return {DEFAULT_MEASUREMENT: measurement_config}
+    return measurement_config
+
+
+def get_output_measurements(output_spec, measurement_configs):
+    # output.<name>.measurement limits an output to one or a list of named measurements
+    measurements = output_spec.get('measurement')
+    if measurements is None:
+        return list(measurement_configs)
+    if isinstance(measurements, str):
+        measurements = [measurements]
+    for measurement in measurements:
+        if measurement not in measurement_configs:
+            logger.warning(f"Output refers to unknown measurement '{measurement}'")
+    return measurements
+
+
 class BuildingBlockFramework(multiprocessing.Process):
-    def __init__(self, config, zmq_conf):
+    def __init__(self, config, zmq_conf, config_args=None):
         super().__init__()
 
         self.config = config
+        self.config_args = config_args  # arguments for config_manager.get_config - None disables reloading
+        self.reload_config = config.get('reload', {})
         self.name = config.get("service_module_name","sensing_dc")
 
         self.interface_config = config['interface']
         self.device_config = config['device']
         self.calculation_config = config['calculation']
         self.pipeline_config = config['pipelines']
-        self.measurement_config = config['measurement']
+        self.measurement_configs = get_measurement_configs(config['measurement'])
         self.output_config = config['output']
+        self.transport_config = config.get('transport', {})
+        self.metrics_config = config.get('metrics', {})
 
         # declarations
         self.interfaces = {}
         self.devices = {}
         self.calculations = {}
         self.pipelines = {}
-        self.sensing_stacks = []
-        self.measurement_module = None
+        self.sensing_stacks = {}
+        self.measurement_modules = {}
+        self.output_templates = {}
+        self.output_routes = {}
+        self.output_filters = {}
+        self.output_batchers = {}
+        self.batch_flush_task = None
+        self.measurement_tasks = {}
+        self.reload_task = None
+        self.metrics = core.metrics.create_metrics(self.metrics_config, "measure")
+        self.bus_schedulers = core.interface_modules.bus_scheduler.BusSchedulers(metrics=self.metrics)
+        self.metrics_exporters = core.metrics.create_exporters(self.metrics, self.metrics_config, self.publish_metrics)
+        self.metrics_task = None
+        self.profiler = core.profiling.Profiler(config.get('profiling', {}), "measure")
+        self.profile_task = None
+
+        # measurement cycles only start while cycle_gate is set - cleared while the config is swapped
+        self.cycle_gate = asyncio.Event()
+        self.cycle_gate.set()
+        self.active_cycles = 0
+        self.cycles_idle = asyncio.Event()
 
         self.zmq_conf = zmq_conf
         self.zmq_out = None
+        self.transport_mode = self.transport_config.get('mode', 'json')
+        self.serialise = core.serialisation.get_serialiser(self.transport_config.get('serialiser', 'auto'))
+        # multipart topics are rendered here - with mqtt.topic_prefix joined on before rendering, as mqtt_out does
+        self.topics = core.topic_template.TopicCache(config.get('mqtt', {}).get('topic_prefix', ""))
 
-        self.fail_count= 0
+        self.fail_counts = {}  # unexpected errors per measurement - see increment_fail_counter
 
     def do_connect(self):
         self.zmq_out = context.socket(self.zmq_conf['type'])
@@ -73,64 +154,322 @@ class BuildingBlockFramework(multiprocessing.Process):
 
         asyncio.run(self.async_loop())
 
-    # could be multiplexed as measurement loops
     async def async_loop(self):
         # Load Elements
         logger.info("+---Loading Modules")
         self.load_modules()
         self.create_pipelines()
         self.create_sensing_stacks()
+        self.create_output_templates()
         # Initialise Elements
         logger.info("+---Initialising Modules")
         await self.initialise_interfaces()
         self.initialise_devices()
         self.initialise_pipelines()
         self.initialise_sensing_stacks()
-        self.initialise_measurement()
+        self.initialise_measurements()
+        self.eliminate_dead_variables()
 
         logger.info("+---Starting Loop")
+        self.start_batch_flush_task()
+        if self.metrics_exporters:
+            self.metrics_task = asyncio.create_task(self.export_metrics())
+        self.profile_task = asyncio.create_task(self.watch_profiling())
+        if self.config_args is not None:
+            self.reload_task = asyncio.create_task(self.watch_config())
+
+        # each measurement runs as its own task - interfaces, devices and outputs are shared
+        self.start_measurement_tasks()
+        while self.measurement_tasks:
+            done, _pending = await asyncio.wait(self.measurement_tasks.values(), return_when=asyncio.FIRST_COMPLETED)
+            self.measurement_tasks = {name: task for name, task in self.measurement_tasks.items() if task not in done}
+
+        for batcher in self.output_batchers.values():
+            for message in batcher.flush_all():
+                self.send(message)
+        for exporter in self.metrics_exporters:
+            exporter.stop()
+        for device in self.devices.values():
+            if isinstance(device, core.device_modules.replay.RecordingDevice):
+                device.close()
+        self.bus_schedulers.shutdown()
+        logger.info("Done")
+
+    def start_measurement_tasks(self):
+        for name, module in self.measurement_modules.items():
+            if module is not None and name not in self.measurement_tasks:
+                self.measurement_tasks[name] = asyncio.create_task(self.measurement_loop(name))
+
+    def start_batch_flush_task(self):
+        if self.output_batchers and self.batch_flush_task is None:
+            self.batch_flush_task = asyncio.create_task(self.flush_output_batches())
+
+    async def measurement_loop(self, measurement_name):
         while terminate_flag is False:
+            await self.cycle_gate.wait()
+            measurement_module = self.measurement_modules.get(measurement_name)
+            if measurement_module is None:  # removed by a config reload
+                return
+
+            self.active_cycles += 1
             try:
-                delay, output_vars = await self.measurement_module.loop()
-
-                if output_vars:
-                    messages = self.generate_output(output_vars, self.output_config)
-                    for message in messages:
-                        self.dispatch(message)
-                self.decrement_fail_counter()
-                await asyncio.sleep(delay)
-            except core.exceptions.SampleError as e:
-                logger.error(f"Sample Error for device {e.device}: {e} - pausing for 10 seconds")
-                self.increment_fail_counter()
-                self.dispatch_error('device',e.device,str(e))
-                await asyncio.sleep(10)
-            except core.exceptions.CalculationError as e:
-                logger.error(f"Sample Error for device {e.module}: {e} - pausing for 10 seconds")
-                self.increment_fail_counter()
-                self.dispatch_error('calculation',e.module,str(e))
-                await asyncio.sleep(10)
-            except Exception as e:
-                logger.error(f"Error during sampling: {traceback.format_exc()} - pausing for 10 seconds")
-                self.increment_fail_counter()
-                await asyncio.sleep(10)
+                delay = await self.measurement_cycle(measurement_name, measurement_module)
+            finally:
+                self.active_cycles -= 1
+                if self.active_cycles == 0:
+                    self.cycles_idle.set()
+            await asyncio.sleep(delay)
+
+    async def measurement_cycle(self, measurement_name, measurement_module):
+        """Runs one cycle of a measurement and returns the delay before the next one"""
+        try:
+            if self.metrics is not None:
+                started = self.metrics.clock()
+                delay, output_vars = await measurement_module.loop()
+                self.metrics.observe('cycle', measurement_name, self.metrics.clock() - started)
+            else:
+                delay, output_vars = await measurement_module.loop()
+
+            if output_vars:
+                messages = self.generate_output(output_vars, measurement_name)
+                for message in messages:
+                    self.dispatch(message)
+            self.decrement_fail_counter(measurement_name)
+            return delay
+        # errors from a sensing stack (only raised when its circuit breaker is disabled) pause just this measurement
+        except core.exceptions.SampleError as e:
+            logger.error(f"Sample Error for device {e.device}: {e} - pausing {measurement_name} for 10 seconds")
+            self.dispatch_error('device',e.device,str(e))
+            return 10
+        except core.exceptions.CalculationError as e:
+            logger.error(f"Calculation Error in {e.module}: {e} - pausing {measurement_name} for 10 seconds")
+            self.dispatch_error('calculation',e.module,str(e))
+            return 10
+        except Exception as e:
+            logger.error(f"Error during {measurement_name}: {traceback.format_exc()} - pausing for 10 seconds")
+            self.increment_fail_counter(measurement_name)
+            return 10
+
+    async def export_metrics(self):
+        for exporter in self.metrics_exporters:
+            exporter.start()
+        while terminate_flag is False:
+            self.bus_schedulers.report()
+            for exporter in self.metrics_exporters:
+                exporter.poll()
+            await asyncio.sleep(1)
 
-        logger.info("Done")
+    async def watch_profiling(self):
+        global profile_flag
+        while terminate_flag is False:
+            if profile_flag:
+                profile_flag = False
+                self.profiler.request()
+            self.profiler.poll()
+            await asyncio.sleep(0.1)
+
+    def publish_metrics(self, snapshot):
+        self.send({'topic': f'metrics/{self.name}', 'payload': snapshot})
+
+    async def watch_config(self):
+        global reload_flag
+        reload_config = None
+        while terminate_flag is False:
+            if self.reload_config is not reload_config:  # started, or [reload] replaced by a reload
+                reload_config = self.reload_config
+                watcher = None
+                if reload_config.get('watch', False):
+                    watcher = core.config_reload.ConfigWatcher(config_manager.get_config_files(**self.config_args))
+                interval = reload_config.get('interval', 5)
+                next_check = time.monotonic() + interval
+
+            await asyncio.sleep(min(interval, 1))
+            if watcher is not None and time.monotonic() >= next_check:
+                next_check = time.monotonic() + interval
+                if watcher.changed():
+                    logger.info("Config file changed. Reloading config.")
+                    reload_flag = True
+            if reload_flag:
+                reload_flag = False
+                await self.reload()
+
+    async def reload(self):
+        try:
+            config = config_manager.get_config(**self.config_args, wait_on_error=False)
+        except config_manager.ConfigError as e:
+            logger.error(f"Config reload failed - continuing with the current config: {e}")
+            return
+
+        # let running cycles finish and hold back new ones while the config is swapped
+        self.cycle_gate.clear()
+        try:
+            while self.active_cycles:
+                self.cycles_idle.clear()
+                await self.cycles_idle.wait()
+            self.apply_config(config)
+        except Exception:
+            logger.error(f"Config reload failed - continuing with the current config: {traceback.format_exc()}")
+        finally:
+            self.cycle_gate.set()
+        self.start_measurement_tasks()
+        self.start_batch_flush_task()
+
+    def apply_config(self, config):
+        changed_items = core.config_reload.changed_items
+        for section in core.config_reload.RESTART_SECTIONS:
+            if config.get(section) != self.config.get(section):
+                logger.warning(f"Changes to [{section}] need a restart to take effect - ignored")
+
+        # build everything that changed before replacing anything
+        device_config = config['device']
+        pipeline_config = config['pipelines']
+        measurement_configs = get_measurement_configs(config['measurement'])
+        self.check_stack_references(measurement_configs, device_config, pipeline_config)
+
+        changed_devices = changed_items(self.device_config, device_config)
+        devices = {name: device for name, device in self.devices.items() if name not in changed_devices}
+        try:
+            for name in changed_devices & device_config.keys():
+                spec = device_config[name]
+                devices[name] = self.record_device(
+                    self.load_single_module('core.device_modules', spec['module'], spec['class'],
+                                            {arg: spec.get(arg, {}) for arg in ['config', 'variables']}), spec)
+                if devices[name] is not None:
+                    devices[name].initialise(self.interfaces[spec['interface']])
+
+            calculation_config = config['calculation']
+            changed_calculations = changed_items(self.calculation_config, calculation_config)
+            calculations = {name: calculation for name, calculation in self.calculations.items()
+                            if name not in changed_calculations}
+            self.load_module_list(calculations, 'core.calculation_modules',
+                                  {name: calculation_config[name]
+                                   for name in changed_calculations & calculation_config.keys()})
+
+            changed_pipelines = changed_items(self.pipeline_config, pipeline_config) | {
+                name for name, spec in pipeline_config.items() if changed_calculations.intersection(spec)}
+            pipelines = {name: pipeline for name, pipeline in self.pipelines.items() if name not in changed_pipelines}
+            for name in changed_pipelines & pipeline_config.keys():
+                pipelines[name] = core.pipeline.Pipeline(pipeline_config[name])
+                pipelines[name].initialise(calculations)
+
+            changed_measurements = changed_items(self.measurement_configs, measurement_configs)
+            measurement_modules = {name: module for name, module in self.measurement_modules.items()
+                                   if name not in changed_measurements}
+            sensing_stacks = {name: stacks for name, stacks in self.sensing_stacks.items()
+                              if name not in changed_measurements}
+            for name in changed_measurements & measurement_configs.keys():
+                measurement_modules[name] = self.load_measurement(measurement_configs[name])
+                sensing_stacks[name] = self.create_stacks(measurement_configs[name], device_config)
+                for stack in sensing_stacks[name]:
+                    stack.initialise(devices, pipelines, self.bus_schedulers, self.interfaces,
+                                     self.report_breaker_state, self.metrics)
+                if measurement_modules[name] is not None:
+                    measurement_modules[name].initialise(sensing_stacks[name])
+
+            # unchanged measurements using a rebuilt device or pipeline keep their module with new stacks
+            rebound_measurements = {
+                name for name in measurement_configs.keys() - changed_measurements
+                if any(stack.device_tag in changed_devices or stack.pipeline_tag in changed_pipelines
+                       for stack in sensing_stacks[name])}
+            for name in rebound_measurements:
+                sensing_stacks[name] = self.create_stacks(measurement_configs[name], device_config)
+                for stack in sensing_stacks[name]:
+                    stack.initialise(devices, pipelines, self.bus_schedulers, self.interfaces,
+                                     self.report_breaker_state, self.metrics)
+
+            output_config = config['output']
+            changed_outputs = changed_items(self.output_config, output_config)
+            output_templates = {name: template for name, template in self.output_templates.items()
+                                if name not in changed_outputs}
+            output_templates.update(self.create_templates(
+                {name: output_config[name] for name in changed_outputs & output_config.keys()}))
+            output_routes = self.create_output_routes(output_config, measurement_configs)
+            # routes of unchanged outputs keep their filter & batch state
+            output_filters, output_batchers = self.create_output_state(output_config, output_routes, output_templates)
+            for states, new_states in ((self.output_filters, output_filters), (self.output_batchers, output_batchers)):
+                for key in new_states:
+                    if key[1] not in changed_outputs and key in states:
+                        new_states[key] = states[key]
+        except Exception:
+            # the running config is left as it was - only the devices built for the new one are closed
+            for name in changed_devices & device_config.keys():
+                if isinstance(devices.get(name), core.device_modules.replay.RecordingDevice):
+                    devices[name].close()
+            raise
+
+        # swap
+        for name in changed_devices:
+            if isinstance(self.devices.get(name), core.device_modules.replay.RecordingDevice):
+                self.devices[name].close()
+        for key, batcher in self.output_batchers.items():
+            if output_batchers.get(key) is not batcher:
+                for message in batcher.flush_all():
+                    self.send(message)
+        for name in rebound_measurements:
+            if measurement_modules[name] is not None:
+                measurement_modules[name].initialise(sensing_stacks[name])
+
+        self.config = config
+        self.reload_config = config.get('reload', {})
+        self.name = config.get("service_module_name","sensing_dc")
+        self.device_config = device_config
+        self.calculation_config = calculation_config
+        self.pipeline_config = pipeline_config
+        self.measurement_configs = measurement_configs
+        self.output_config = output_config
+        self.devices = devices
+        self.calculations = calculations
+        self.pipelines = pipelines
+        self.measurement_modules = measurement_modules
+        self.sensing_stacks = sensing_stacks
+        self.output_templates = output_templates
+        self.output_filters = output_filters
+        self.output_batchers = output_batchers
+        self.output_routes = output_routes
+        self.eliminate_dead_variables()
+
+        logger.info(f"Reloaded config - devices: {sorted(changed_devices)}, "
+                    f"calculations: {sorted(changed_calculations)}, pipelines: {sorted(changed_pipelines)}, "
+                    f"measurements: {sorted(changed_measurements)}, outputs: {sorted(changed_outputs)}")
+
+    async def flush_output_batches(self):
+        while terminate_flag is False:
+            for batcher in self.output_batchers.values():
+                for message in batcher.flush_due():
+                    self.send(message)
+
+            due = [d for d in (batcher.next_due() for batcher in self.output_batchers.values()) if d is not None]
+            delay = min(due) - time.monotonic() if due else 1
+            await asyncio.sleep(min(max(delay, 0), 1))
 
     def load_modules(self):
         # load general modules
         self.load_module_list(self.interfaces, 'core.interface_modules', self.interface_config, ['config'])
         self.load_module_list(self.devices, 'core.device_modules', self.device_config)
+        for name, spec in self.device_config.items():
+            self.devices[name] = self.record_device(self.devices[name], spec)
         self.load_module_list(self.calculations, 'core.calculation_modules', self.calculation_config)
 
-        # load measurement
-        self.measurement_module = self.load_single_module(
+        # load measurements
+        for name, measurement_config in self.measurement_configs.items():
+            self.measurement_modules[name] = self.load_measurement(measurement_config)
+        logger.debug(f"Loaded measurements: {self.measurement_modules}")
+
+    def load_measurement(self, measurement_config):
+        return self.load_single_module(
             'core.measurement_modules',
-            self.measurement_config['module'],
-            self.measurement_config['class'],
+            measurement_config['module'],
+            measurement_config['class'],
             {
-                'config': self.measurement_config.get('config')
+                'config': measurement_config.get('config')
             })
-        logger.debug(f"Loaded measurement: {self.measurement_module}")
+
+    def record_device(self, device, device_spec):
+        # record = "<path>" on a device records its samples for core.device_modules.replay.ReplayDevice
+        if device is None or 'record' not in device_spec:
+            return device
+        logger.info(f"Recording samples to {device_spec['record']}")
+        return core.device_modules.replay.RecordingDevice(device, device_spec['record'])
 
     def load_module_list(self, output_dict, prefix, spec_dict, args=['config', 'variables']):
         for name, spec in spec_dict.items():
@@ -163,8 +502,52 @@ class BuildingBlockFramework(multiprocessing.Process):
         self.pipelines = {name: core.pipeline.Pipeline(spec) for name, spec in self.pipeline_config.items()}
 
     def create_sensing_stacks(self):
-        self.sensing_stacks = [core.sensing_stack.SensingStack(stack) for stack in
-                               self.measurement_config['sensing_stacks']]
+        self.sensing_stacks = {name: self.create_stacks(measurement_config, self.device_config)
+                               for name, measurement_config in self.measurement_configs.items()}
+
+    def check_stack_references(self, measurement_configs, device_config, pipeline_config):
+        for name, measurement_config in measurement_configs.items():
+            for stack in measurement_config['sensing_stacks']:
+                if stack['device'] not in device_config:
+                    raise KeyError(f"Measurement {name} uses device {stack['device']} which is not configured")
+                if stack['pipeline'] not in pipeline_config:
+                    raise KeyError(f"Measurement {name} uses pipeline {stack['pipeline']} which is not configured")
+
+    def create_stacks(self, measurement_config, device_config):
+        return [core.sensing_stack.SensingStack(stack, device_config.get(stack['device'], {}).get('interface'))
+                for stack in measurement_config['sensing_stacks']]
+
+    def create_output_templates(self):
+        self.output_templates = self.create_templates(self.output_config)
+        self.output_routes = self.create_output_routes(self.output_config, self.measurement_configs)
+        self.output_filters, self.output_batchers = self.create_output_state(self.output_config, self.output_routes,
+                                                                             self.output_templates)
+
+    def create_templates(self, output_config):
+        return {name: core.output.compile_json_path_message(spec['message_spec'])
+                for name, spec in output_config.items()}
+
+    def create_output_state(self, output_config, output_routes, templates):
+        # report by exception filters & batchers are kept per (measurement, output) - an output shared by several
+        # measurements compares and batches the messages of each measurement separately
+        filters = {}
+        batchers = {}
+        for measurement_name, names in output_routes.items():
+            for name in names:
+                spec = output_config[name]
+                if 'report_by_exception' in spec:
+                    filters[(measurement_name, name)] = core.report_by_exception.ReportByException(
+                        spec['report_by_exception'], templates[name].variables)
+                if 'batch' in spec:
+                    batchers[(measurement_name, name)] = core.batching.OutputBatcher(spec['batch'])
+        return filters, batchers
+
+    def create_output_routes(self, output_config, measurement_configs):
+        # outputs without a measurement are generated for every measurement
+        return {
+            measurement_name: [name for name, spec in output_config.items()
+                               if measurement_name in get_output_measurements(spec, measurement_configs)]
+            for measurement_name in measurement_configs}
 
     async def initialise_interfaces(self):
         for _name, interface in self.interfaces.items():
@@ -186,52 +569,104 @@ class BuildingBlockFramework(multiprocessing.Process):
                 pipeline.initialise(self.calculations)
 
     def initialise_sensing_stacks(self):
-        for stack in self.sensing_stacks:
-            if stack is not None:
-                stack.initialise(self.devices, self.pipelines)
-
-    def initialise_measurement(self):
-        self.measurement_module.initialise(self.sensing_stacks)
+        for stacks in self.sensing_stacks.values():
+            for stack in stacks:
+                if stack is not None:
+                    stack.initialise(self.devices, self.pipelines, self.bus_schedulers, self.interfaces,
+                                     self.report_breaker_state, self.metrics)
+
+    def initialise_measurements(self):
+        for name, measurement_module in self.measurement_modules.items():
+            if measurement_module is not None:
+                measurement_module.initialise(self.sensing_stacks[name])
+
+    def eliminate_dead_variables(self):
+        # only calculate and read the variables used by the outputs
+        core.dead_variables.eliminate(self.sensing_stacks, self.output_routes, self.output_templates,
+                                      self.measurement_modules)
 
     def get_timestamp(self):
         __dt = -1 * (time.timezone if (time.localtime().tm_isdst == 0) else time.altzone)
         tz = datetime.timezone(datetime.timedelta(seconds=__dt))
         return datetime.datetime.now(tz=tz).isoformat()
 
-    def generate_output(self, var_dict, output_config):
+    def generate_output(self, var_dict, measurement_name=DEFAULT_MEASUREMENT):
         dataset = {**var_dict}
 
         if "timestamp" not in dataset:
             dataset["timestamp"] = self.get_timestamp()
 
         outputs = []
-        for _output_item, output_item_config in output_config.items():
-            payload = core.output.generate_json_path_message(dataset, output_item_config['message_spec'])
+        for output_item in self.output_routes.get(measurement_name, ()):
+            if self.metrics is not None:
+                started = self.metrics.clock()
+            template = self.output_templates[output_item]
+            output_filter = self.output_filters.get((measurement_name, output_item))
+            if output_filter is not None and not output_filter.should_publish(dataset):
+                continue
+            payload = template.render(dataset)
             # payload = core.output.generate_basic_output(dataset,output_spec)
-            outputs.append({'topic': output_item_config.get('topic', ""), 'payload': payload})
+            outputs.append({'name': output_item, 'measurement': measurement_name,
+                            'topic': self.output_config[output_item].get('topic', ""),
+                            'payload': payload, 'timestamp': dataset['timestamp']})
+            if self.metrics is not None:
+                self.metrics.observe('output', output_item, self.metrics.clock() - started)
 
         return outputs
 
     def dispatch(self, output):
+        batcher = self.output_batchers.get((output.get('measurement'), output.get('name')))
+        if batcher is not None:
+            for message in batcher.add(output.get('topic', ""), output['payload'], output.get('timestamp')):
+                self.send(message)
+        else:
+            self.send(output)
+
+    def send(self, output):
         logger.debug(f"dispatch to {output.get('topic', '')} of {output['payload']}")
-        self.zmq_out.send_json({'topic': output.get('topic', ""), 'payload': output['payload']})
+        if self.transport_mode == 'multipart':
+            # topic is rendered here and the payload serialised once - mqtt_out publishes the bytes as they are
+            topic = self.topics.render(output.get('topic', ""), output['payload'])
+            frames = [topic.encode(), self.serialise(output['payload'])]
+            if self.metrics is not None:  # send time for mqtt_out's zmq stage
+                frames.append(struct.pack('!d', self.metrics.clock()))
+            self.zmq_out.send_multipart(frames)
+        else:
+            message = {'topic': output.get('topic', ""), 'payload': output['payload']}
+            if self.metrics is not None:
+                message['sent'] = self.metrics.clock()
+            self.zmq_out.send_json(message)
 
-    def dispatch_error(self,type,id,reason):
+    def dispatch_error(self,type,id,reason,**details):
         payload = {
             'type': type,
             'id': id,
             'reason': reason,
+            **details,
             'timestamp': self.get_timestamp()
         }
-        self.zmq_out.send_json({'topic': f'error/{self.name}', 'payload': payload})
-
-    def decrement_fail_counter(self):
-        self.fail_count = self.fail_count-1 if self.fail_count > 0 else 0
-    
-    def increment_fail_counter(self):
-        self.fail_count +=1
-        if self.fail_count >= 6:
-            logger.critical("Too many failed attempts - hard resetting")
+        self.send({'topic': f'error/{self.name}', 'payload': payload})
+
+    def report_breaker_state(self, stack, breaker, reason):
+        details = {'state': breaker.state, 'failures': breaker.failures}
+        if breaker.state == core.circuit_breaker.OPEN:
+            logger.error(f"Sensing stack for device {stack.device_tag} failed ({reason}) - "
+                         f"retrying in {breaker.delay}s")
+            details['retry_in'] = breaker.delay
+        else:
+            logger.info(f"Sensing stack for device {stack.device_tag}: {breaker.state} - {reason}")
+        self.dispatch_error('device', stack.device_tag, reason, **details)
+
+    def decrement_fail_counter(self, measurement_name):
+        if self.fail_counts.get(measurement_name, 0) > 0:
+            self.fail_counts[measurement_name] -= 1
+
+    def increment_fail_counter(self, measurement_name):
+        # only errors that are not tied to a sensing stack count - a measurement that keeps failing
+        # this way restarts the process
+        self.fail_counts[measurement_name] = self.fail_counts.get(measurement_name, 0) + 1
+        if self.fail_counts[measurement_name] >= 6:
+            logger.critical(f"Too many failed attempts in {measurement_name} - hard resetting")
 
             sys.exit(255)
 
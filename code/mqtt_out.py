@@ -3,15 +3,25 @@ import multiprocessing
 import logging
 import zmq
 import json
-import chevron
 import time
 import signal
-from urllib.parse import urljoin
+import threading
+import struct
+import core.outbound_queue
+import core.topic_template
+import core.metrics
+import core.profiling
 
 context = zmq.Context()
 logger = logging.getLogger("main.mqtt_out")
 
 terminate_flag = False
+profile_flag = False
+
+def profile_signal_handler(sig, _frame):
+    logger.info(f'Received {signal.Signals(sig).name}. Starting profiling.')
+    global profile_flag
+    profile_flag = True
 
 def graceful_signal_handler(sig, _frame):
     logger.info(f'Received {signal.Signals(sig).name}. Triggering graceful termination.')
@@ -23,20 +33,46 @@ class MQTTServiceWrapper(multiprocessing.Process):
     def __init__(self, config, zmq_conf):
         super().__init__()
 
+        self.service_module_name = config.get("service_module_name", "sensing_dc")
         mqtt_conf = config['mqtt']
         self.url = mqtt_conf['broker']
         self.port = int(mqtt_conf['port'])
 
         self.topic_base = mqtt_conf.get('topic_prefix',"")
+        self.topics = core.topic_template.TopicCache(self.topic_base, mqtt_conf.get('topic_cache_size', 256))
 
         mqtt_conf_reconnect = mqtt_conf.get('reconnect', {})
         self.initial = mqtt_conf_reconnect.get('initial', 5)
-        self.backoff = mqtt_conf_reconnect.get('backoff', 2)
         self.limit = mqtt_conf_reconnect.get('limit', 60)
+        if 'backoff' in mqtt_conf_reconnect:
+            # paho's network thread reconnects and always doubles the delay
+            logger.warning("mqtt reconnect.backoff is no longer used - the reconnect delay doubles up to reconnect.limit")
+
+        self.qos = mqtt_conf.get('qos', 0)
+        self.max_inflight = mqtt_conf.get('max_inflight', 100)
+
+        store_conf = mqtt_conf.get('store_and_forward', {})
+        self.store_enabled = store_conf.get('enabled', False)
+        self.store_path = store_conf.get('path', './data/mqtt_outbound_queue.sqlite')
+        self.store_max_messages = store_conf.get('max_messages', 100000)
+        self.drain_rate = store_conf.get('drain_rate', 100)  # messages per second
+
+        self.metrics_config = config.get('metrics', {})
+        self.metrics = core.metrics.create_metrics(self.metrics_config, "mqtt_out")
+        self.metrics_exporters = []
+        self.profiler = core.profiling.Profiler(config.get('profiling', {}), "mqtt_out")
 
         # declarations
         self.zmq_conf = zmq_conf
         self.zmq_in = None
+        self.queue = None
+        self.drain_allowance = 0
+        self.drain_timestamp = None
+
+        self.window = threading.Condition()
+        self.inflight = {}  # mid: time handed to the client
+        self.early_acks = {}
+        self.stats = PublishStats(histogram=self.metrics.histogram('publish') if self.metrics is not None else None)
 
     def do_connect(self):
         self.zmq_in = context.socket(self.zmq_conf['type'])
@@ -45,59 +81,206 @@ class MQTTServiceWrapper(multiprocessing.Process):
         else:
             self.zmq_in.connect(self.zmq_conf["address"])
 
-    def mqtt_connect(self, client, first_time=False):
-        timeout = self.initial
-        exceptions = True
-        while exceptions and terminate_flag is False:
-            try:
-                if first_time:
-                    client.connect(self.url, self.port, 60)
-                else:
-                    logger.error("Attempting to reconnect...")
-                    client.reconnect()
-                logger.info("Connected!")
-                time.sleep(self.initial)  # to give things time to settle
-                exceptions = False
-            except Exception:
-                logger.error(f"Unable to connect, retrying in {timeout} seconds")
-                time.sleep(timeout)
-                if timeout < self.limit:
-                    timeout = timeout * self.backoff
-                else:
-                    timeout = self.limit
-
-    def on_disconnect(self, client, _userdata, rc):
+    def on_connect(self, _client, _userdata, _flags, rc):
+        if rc == 0:
+            logger.info("Connected!")
+        else:
+            logger.error(f"Unable to connect (rc:{rc}), retrying")
+
+    def on_disconnect(self, _client, _userdata, rc):
         if rc != 0:
             logger.error(f"Unexpected MQTT disconnection (rc:{rc}), reconnecting...")
-            self.mqtt_connect(client)
+        if self.qos == 0:
+            # QoS 0 messages that were not sent before the disconnection are lost and will never be acknowledged
+            with self.window:
+                self.inflight.clear()
+                self.early_acks.clear()
+                self.window.notify_all()
+
+    def on_publish(self, _client, _userdata, mid):
+        # called from the network thread once a message has been sent (QoS 0) or acknowledged (QoS 1 & 2)
+        acked = time.monotonic()
+        with self.window:
+            received = self.inflight.pop(mid, None)
+            if received is None:  # acknowledged before publish() returned
+                self.early_acks[mid] = acked
+                return
+            self.window.notify()
+        self.stats.record(acked - received)
+
+    def receive(self):
+        try:
+            frames = self.zmq_in.recv_multipart(zmq.NOBLOCK)
+        except zmq.ZMQError:
+            return None
+
+        if len(frames) >= 2:
+            # multipart transport - the topic is already rendered (with the topic prefix) and the payload serialised
+            if len(frames) == 3 and self.metrics is not None:
+                self.metrics.observe('zmq', "", self.metrics.clock() - struct.unpack('!d', frames[2])[0])
+            topic = frames[0].decode()
+            logger.debug(f'pub topic:{topic} msg:{frames[1]}')
+            return topic, frames[1]
+
+        msg_json = json.loads(frames[0])
+        msg_topic = msg_json['topic']
+        msg_payload = msg_json['payload']
+        if 'sent' in msg_json and self.metrics is not None:
+            self.metrics.observe('zmq', "", self.metrics.clock() - msg_json['sent'])
+        topic = self.topics.render(msg_topic, msg_payload)
+        logger.debug(f'pub topic:{topic} msg:{msg_payload}')
+        return topic, json.dumps(msg_payload)
+
+    def publish(self, client, topic, payload):
+        if self.queue is not None and (len(self.queue) > 0 or not client.is_connected()):
+            # keep messages in order - while there is a backlog new messages join the back of it
+            self.queue.put(topic, payload)
+            return
+
+        if not self.send(client, topic, payload) and self.queue is not None:
+            self.queue.put(topic, payload)
+
+    def send(self, client, topic, payload):
+        received = time.monotonic()
+        info = client.publish(topic, payload, qos=self.qos)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS and not (self.qos > 0 and info.rc == mqtt.MQTT_ERR_NO_CONN):
+            # with QoS 1 & 2 paho keeps messages published while disconnected and sends them on reconnect
+            return False
+
+        with self.window:
+            acked = self.early_acks.pop(info.mid, None)
+            if acked is None:
+                self.inflight[info.mid] = received
+        if acked is not None:
+            self.stats.record(acked - received)
+        return True
+
+    def publish_metrics(self, client, snapshot):
+        self.publish(client, self.topics.prefix(f"metrics/{self.service_module_name}"), json.dumps(snapshot))
+
+    def window_available(self, timeout):
+        # blocks for up to timeout seconds while the in-flight window is full
+        with self.window:
+            return self.window.wait_for(lambda: len(self.inflight) < self.max_inflight, timeout)
+
+    def drain(self, client):
+        # publish stored messages at up to drain_rate messages per second
+        now = time.monotonic()
+        elapsed = now - self.drain_timestamp if self.drain_timestamp is not None else 0
+        self.drain_timestamp = now
+
+        if len(self.queue) == 0 or not client.is_connected():
+            self.drain_allowance = 0
+            return
+
+        self.drain_allowance = min(self.drain_allowance + elapsed * self.drain_rate, self.drain_rate)
+        batch = self.queue.peek(min(int(self.drain_allowance), self.max_inflight - len(self.inflight)))
+        last_sent = None
+        for message_id, topic, payload in batch:
+            if not self.send(client, topic, payload):
+                break
+            last_sent = message_id
+            self.drain_allowance -= 1
+
+        if last_sent is not None:
+            self.queue.remove_up_to(last_sent)
+            if len(self.queue) == 0:
+                logger.info("Outbound queue drained")
 
     def run(self):
+        global profile_flag
         signal.signal(signal.SIGINT, graceful_signal_handler)
         signal.signal(signal.SIGTERM, graceful_signal_handler)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)  # config reload is handled by measure
+        signal.signal(signal.SIGUSR1, profile_signal_handler)
         self.do_connect()
 
+        if self.store_enabled:
+            self.queue = core.outbound_queue.PersistentQueue(self.store_path, self.store_max_messages)
+
         client = mqtt.Client()
-        # client.on_connect = self.on_connect
+        client.on_connect = self.on_connect
         # client.on_message = self.on_message
         client.on_disconnect = self.on_disconnect
+        client.on_publish = self.on_publish
+        client.max_inflight_messages_set(self.max_inflight)
+        client.reconnect_delay_set(self.initial, self.limit)
 
         # self.client.tls_set('ca.cert.pem',tls_version=2)
         logger.info(f'connecting to {self.url}:{self.port}')
-        self.mqtt_connect(client, True)
+        client.connect_async(self.url, self.port, 60)
+        client.loop_start()  # network traffic, (re)connection and acknowledgements are handled on a background thread
 
+        # the Prometheus endpoint is served one port above measure's
+        self.metrics_exporters = core.metrics.create_exporters(
+            self.metrics, self.metrics_config, lambda snapshot: self.publish_metrics(client, snapshot), port_offset=1)
+        for exporter in self.metrics_exporters:
+            exporter.start()
 
         while terminate_flag is False:
-            while self.zmq_in.poll(50, zmq.POLLIN):
-                try:
-                    msg = self.zmq_in.recv(zmq.NOBLOCK)
-                    msg_json = json.loads(msg)
-                    msg_topic = msg_json['topic']
-                    msg_payload = msg_json['payload']
-                    topic = chevron.render(urljoin(self.topic_base, msg_topic), msg_payload)
-                    logger.info(f'pub topic:{topic} msg:{msg_payload}')
-                    client.publish(topic, json.dumps(msg_payload))
-                except zmq.ZMQError:
-                    pass
-            client.loop(0.05)
+            if profile_flag:
+                profile_flag = False
+                self.profiler.request()
+            self.profiler.poll()
+
+            if self.queue is None and not client.is_connected():
+                # without the store, messages are left in zmq until the connection returns
+                time.sleep(0.05)
+                continue
+
+            if self.window_available(0.05) and self.zmq_in.poll(50, zmq.POLLIN):
+                while len(self.inflight) < self.max_inflight:
+                    message = self.receive()
+                    if message is None:
+                        break
+                    self.publish(client, *message)
+
+            if self.queue is not None:
+                self.drain(client)
+            self.stats.report(len(self.inflight))
+            for exporter in self.metrics_exporters:
+                exporter.poll()
+
+        for exporter in self.metrics_exporters:
+            exporter.stop()
+        client.disconnect()
+        client.loop_stop()
+        if self.queue is not None:
+            self.queue.close()
         logger.info("Done")
 
+
+class PublishStats:
+    """Tracks the time from a message being handed to the client to it being sent (QoS 0) or acknowledged (QoS 1 & 2)"""
+    def __init__(self, interval=60, histogram=None):
+        self.interval = interval
+        self.histogram = histogram  # publish stage of core.metrics - recorded under the lock as on_publish is threaded
+        self.lock = threading.Lock()
+        self.last_report = time.monotonic()
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, latency):
+        with self.lock:
+            self.count += 1
+            self.total += latency
+            if latency > self.max:
+                self.max = latency
+            if self.histogram is not None:
+                self.histogram.observe(latency)
+
+    def report(self, inflight):
+        now = time.monotonic()
+        if now - self.last_report < self.interval:
+            return
+        with self.lock:
+            if self.count:
+                logger.info(f"published {self.count} messages in {now - self.last_report:.0f}s - "
+                            f"latency mean: {1000 * self.total / self.count:.1f}ms max: {1000 * self.max:.1f}ms - "
+                            f"in-flight: {inflight}")
+            self.reset()
+        self.last_report = now
@@ -0,0 +1,21 @@
+import pytest
+
+
+class FakeClock:
+    """A monotonic clock that only moves on when told to - pass it wherever a module takes a clock"""
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -0,0 +1,88 @@
+import array
+
+import pytest
+
+import core.device_modules.adc_ADS111X
+from conftest import FakeClock
+
+
+class LateClock(FakeClock):
+    """Time only moves on when the burst sleeps - by more than asked for the sleeps in late (index: extra seconds)"""
+    def __init__(self, late=None):
+        super().__init__()
+        self.late = dict(late or {})
+        self.sleeps = 0
+
+    def sleep(self, seconds):
+        self.advance(seconds + self.late.get(self.sleeps, 0))
+        self.sleeps += 1
+
+
+class FakeI2C:
+    def __init__(self, results, clock):
+        self.results = list(results)
+        self.clock = clock
+        self.writes = []
+        self.reads = []
+
+    def write_register(self, device_address, register, data):
+        self.writes.append((register, data))
+
+    def write(self, device_address, data):
+        self.writes.append(("pointer", data))
+
+    def read(self, device_address, num_bytes):
+        self.reads.append(self.clock())
+        return list(self.results.pop(0).to_bytes(2, 'big', signed=True))
+
+
+def make_adc(burst, results, late=None):
+    adc = core.device_modules.adc_ADS111X.ADS1115(
+        {'adc_channel': 1, 'gain': '4.096V', 'speed': '860SPS', 'burst': burst}, {'v_in': 'v'})
+    clock = LateClock(late)
+    adc.clock, adc.sleep = clock, clock.sleep
+    i2c = FakeI2C(results, clock)
+    adc.initialise(i2c)
+    return adc, i2c
+
+
+def test_burst_reads_block_in_continuous_mode():
+    codes = [0, 8192, 16384, -8192, -32768, 32767]
+    adc, i2c = make_adc({'samples': 6}, codes)
+    output = adc.sample()
+
+    assert isinstance(output['v'], array.array)
+    assert list(output['v']) == pytest.approx([code / 32768 * 4.096 for code in codes])
+    assert len(i2c.reads) == 6
+    # continuous mode, result register selected once, then powered down without starting a conversion
+    (register, start_config), pointer, (_register, stop_config) = i2c.writes
+    assert register == 0x01 and start_config[0] & 0b1 == 0 and start_config[0] >> 7 == 0
+    assert pointer == ("pointer", 0x00)
+    assert stop_config[0] & 0b1 == 1 and stop_config[0] >> 7 == 0
+    # paced at the configured speed
+    assert output['v_sample_rate'] == pytest.approx(860)
+    assert 'v_cycles' not in output
+
+
+def test_burst_of_whole_mains_cycles():
+    adc, i2c = make_adc({'cycles': 2, 'mains_frequency': 50}, [100] * 34)
+    assert adc.burst_samples == 34  # 2 cycles at 860 samples per second
+    output = adc.sample()
+    assert len(output['v']) == 34
+    assert output['v_cycles'] == pytest.approx(34 * 50 / output['v_sample_rate'])
+
+
+def test_late_read_skips_to_the_latest_result():
+    # the third sleep wakes 3.5 results late
+    adc, i2c = make_adc({'samples': 6}, range(6), late={2: 3.5 / 860})
+    output = adc.sample()
+    intervals = [b - a for a, b in zip(i2c.reads, i2c.reads[1:])]
+    # no result is read twice - the missed ones are skipped
+    assert intervals == pytest.approx([1 / 860, 4.5 / 860, 0.5 / 860, 1 / 860, 1 / 860])
+    assert output['v_sample_rate'] == pytest.approx(5 / (i2c.reads[-1] - i2c.reads[0]))
+
+
+def test_single_shot_without_burst():
+    adc = core.device_modules.adc_ADS111X.ADS1115({'adc_channel': 0}, {'v_in': 'v'})
+    assert adc.burst_samples is None
+    assert adc.make_config_bytes()[0] & 0b10000001 == 0b10000001
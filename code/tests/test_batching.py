@@ -0,0 +1,46 @@
+import core.batching
+from conftest import FakeClock
+
+
+def test_flush_on_size_row_layout():
+    batcher = core.batching.OutputBatcher({'size': 3}, FakeClock())
+    assert batcher.add("power/{{machine}}", {'machine': 'm1', 'current': 1.0}, 't0') == []
+    assert batcher.add("power/{{machine}}", {'machine': 'm1', 'current': 1.1}, 't1') == []
+    messages = batcher.add("power/{{machine}}", {'machine': 'm1', 'current': 1.2}, 't2')
+    assert messages == [{'topic': 'power/m1', 'payload': [{'machine': 'm1', 'current': 1.0},
+                                                          {'machine': 'm1', 'current': 1.1},
+                                                          {'machine': 'm1', 'current': 1.2}]}]
+    assert batcher.flush_all() == []
+
+
+def test_batches_are_kept_per_topic():
+    batcher = core.batching.OutputBatcher({'size': 2}, FakeClock())
+    assert batcher.add("power/{{machine}}", {'machine': 'm1'}, 't0') == []
+    assert batcher.add("power/{{machine}}", {'machine': 'm2'}, 't0') == []
+    assert batcher.add("power/{{machine}}", {'machine': 'm1'}, 't1')[0]['topic'] == 'power/m1'
+    assert batcher.flush_all() == [{'topic': 'power/m2', 'payload': [{'machine': 'm2'}]}]
+
+
+def test_flush_on_period(clock):
+    batcher = core.batching.OutputBatcher({'period': 5}, clock)
+    batcher.add("t", {'v': 1}, 't0')
+    assert batcher.next_due() == 5
+    clock.now = 4
+    batcher.add("t", {'v': 2}, 't1')
+    assert batcher.flush_due() == []
+    clock.now = 5
+    assert batcher.flush_due() == [{'topic': 't', 'payload': [{'v': 1}, {'v': 2}]}]
+    assert batcher.next_due() is None
+
+
+def test_column_layout():
+    batcher = core.batching.OutputBatcher({'size': 3, 'layout': 'column'}, FakeClock())
+    batcher.add("t", {'machine': 'm1', 'phase': {'a': 1, 'b': 2}}, 't0')
+    batcher.add("t", {'machine': 'm1', 'phase': {'a': 3}}, 't1')
+    messages = batcher.add("t", {'machine': 'm1', 'phase': {'a': 5, 'b': 6}, 'extra': True}, 't2')
+    assert messages[0]['payload'] == {
+        'machine': ['m1', 'm1', 'm1'],
+        'phase': {'a': [1, 3, 5], 'b': [2, None, 6]},
+        'extra': [None, None, True],
+        'timestamp': ['t0', 't1', 't2'],
+    }
@@ -0,0 +1,78 @@
+import array
+import math
+
+import numpy
+import pytest
+
+import core.blocks
+import core.calculation_modules.gen_amplifier as gen_amplifier
+import core.calculation_modules.gen_calibrate as gen_calibrate
+import core.calculation_modules.gen_current_clamp as gen_current_clamp
+import core.calculation_modules.gen_electrical as gen_electrical
+import core.calculation_modules.gen_pt_rtd as gen_pt_rtd
+import core.calculation_modules.gen_waveform as gen_waveform
+
+
+def sine(n_readings, readings_per_cycle, amplitude=1.0, offset=0.0):
+    return array.array('d', (offset + amplitude * math.sin(2 * math.pi * i / readings_per_cycle)
+                             for i in range(n_readings)))
+
+
+def test_as_block():
+    readings = array.array('d', [1.0, 2.0])
+    block = core.blocks.as_block(readings)
+    assert isinstance(block, numpy.ndarray)
+    readings[0] = 5.0
+    assert block[0] == 5.0  # a view, not a copy
+    assert list(core.blocks.as_block([1, 2])) == [1.0, 2.0]
+    assert core.blocks.as_block(1.5) == 1.5
+
+
+@pytest.mark.parametrize("module, variables_in, variable_out", [
+    (gen_amplifier.GenAmplifier({'gain': 4}, {'amp_input': 'in', 'amp_output': 'x'}), ['x'], 'in'),
+    (gen_calibrate.MultiplierOffset({'multiplier': 2, 'offset': 1}, {'raw_value': 'x', 'calibrated_value': 'y'}),
+     ['x'], 'y'),
+    (gen_calibrate.OffsetMultiplier({'multiplier': 2, 'offset': 1}, {'raw_value': 'x', 'calibrated_value': 'y'}),
+     ['x'], 'y'),
+    (gen_current_clamp.VoltageClamp({'nominal_current': 20}, {'voltage_out': 'x', 'current_in': 'i'}), ['x'], 'i'),
+    (gen_electrical.RMSToPeak({}, {'var_out': 'x', 'var_in': 'rms'}), ['x'], 'rms'),
+    (gen_electrical.PowerToCurrent({'phase_voltage': 230}, {'rms_current_out': 'x', 'power_in': 'p'}), ['x'], 'p'),
+    (gen_electrical.PowerToVoltageCurrent({'phases': 3}, {'rms_current_out': 'x', 'rms_phase_voltage_out': 'v',
+                                                          'power_in': 'p'}), ['x', 'v'], 'p'),
+    (gen_pt_rtd.PT_RTD({'nominal_resistance': 1000}, {'resistance': 'x', 'temperature': 't'}), ['x'], 't'),
+])
+def test_block_matches_single_values(module, variables_in, variable_out):
+    readings = [900.0, 1000.0, 1100.5, 1250.25]
+    inputs = {name: array.array('d', readings) for name in variables_in}
+    result = module.calculate(dict(inputs))[variable_out]
+
+    assert isinstance(result, numpy.ndarray)
+    expected = [module.calculate({name: reading for name in variables_in})[variable_out] for reading in readings]
+    assert list(result) == pytest.approx(expected)
+    # the input blocks are left as they were
+    assert all(list(block) == readings for block in inputs.values())
+
+
+def test_reductions_of_a_sine_wave():
+    block = sine(172, 17.2, amplitude=2.0)  # 10 cycles
+    variables = {'var_in': 'v', 'var_out': 'out'}
+    assert gen_waveform.TrueRMS({}, variables).calculate({'v': block})['out'] == pytest.approx(2 / math.sqrt(2))
+    assert gen_waveform.Mean({}, variables).calculate({'v': block})['out'] == pytest.approx(0, abs=1e-9)
+    assert gen_waveform.Peak({}, variables).calculate({'v': block})['out'] == pytest.approx(2, rel=1e-2)
+    crest = gen_waveform.CrestFactor({}, variables).calculate({'v': block})['out']
+    assert crest == pytest.approx(math.sqrt(2), rel=1e-2)
+    assert type(crest) is float
+
+
+def test_whole_cycles_and_dc_removal():
+    # 2.5 cycles with a DC offset - only the first 2 cycles are used when the block says how many it covers
+    block = sine(50, 20, amplitude=1.0, offset=3.0)
+    rms = gen_waveform.TrueRMS({'remove_dc': True}, {'var_in': 'v', 'var_out': 'rms'})
+    assert rms.calculate({'v': block, 'v_cycles': 2.5})['rms'] == pytest.approx(1 / math.sqrt(2))
+    assert rms.calculate({'v': block})['rms'] != pytest.approx(1 / math.sqrt(2))
+    assert len(gen_waveform.whole_cycles(numpy.zeros(50), 2.5)) == 40
+
+
+def test_base_reduction_can_not_be_configured():
+    with pytest.raises(TypeError):
+        gen_waveform.WaveformReduction({}, {'var_in': 'v', 'var_out': 'out'})
@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+
+import core.interface_modules.bus_scheduler as bus_scheduler
+import core.sensing_stack
+
+
+class BlockingDevice:
+    def __init__(self, duration):
+        self.duration = duration
+        self.threads = []
+
+    def sample(self):
+        self.threads.append(threading.current_thread().name)
+        time.sleep(self.duration)
+        return {"value": 1}
+
+
+class AsyncDevice:
+    async def sample(self):
+        await asyncio.sleep(0)
+        return {"value": 2}
+
+
+class FakePipeline:
+    def execute(self, sample):
+        return sample
+
+
+def make_stack(device, interface, buses, offload=True):
+    stack = core.sensing_stack.SensingStack({'device': 'device', 'pipeline': 'pipeline', 'offload': offload},
+                                            interface)
+    stack.initialise({'device': device}, {'pipeline': FakePipeline()}, buses)
+    return stack
+
+
+class RendezvousDevice(BlockingDevice):
+    # records its start and end, and waits for the device on the other bus to be running at the same time
+    def __init__(self, name, events, running, other_running):
+        super().__init__(0)
+        self.name = name
+        self.events = events
+        self.running = running
+        self.other_running = other_running
+        self.overlapped = None
+
+    def sample(self):
+        self.events.append(("start", self.name))
+        self.running.set()
+        self.overlapped = self.other_running.wait(timeout=5)
+        result = super().sample()
+        self.events.append(("end", self.name))
+        return result
+
+
+def test_blocking_devices_run_on_one_worker_per_bus():
+    buses = bus_scheduler.BusSchedulers()
+    events = []
+    i2c_running, one_wire_running = threading.Event(), threading.Event()
+    devices = [RendezvousDevice("i2c_a", events, i2c_running, one_wire_running),
+               RendezvousDevice("i2c_b", events, i2c_running, one_wire_running),
+               RendezvousDevice("one_wire", events, one_wire_running, i2c_running)]
+    stacks = [make_stack(devices[0], "i2c", buses), make_stack(devices[1], "i2c", buses),
+              make_stack(devices[2], "one_wire", buses)]
+
+    async def run():
+        return await asyncio.gather(*(stack.execute() for stack in stacks))
+
+    results = asyncio.run(run())
+    buses.shutdown()
+
+    assert results == [{"value": 1}] * 3
+    # the i2c devices take turns...
+    i2c_events = [event for event in events if event[1] != "one_wire"]
+    assert i2c_events in ([("start", "i2c_a"), ("end", "i2c_a"), ("start", "i2c_b"), ("end", "i2c_b")],
+                          [("start", "i2c_b"), ("end", "i2c_b"), ("start", "i2c_a"), ("end", "i2c_a")])
+    # ...and the one_wire device runs alongside them
+    assert all(device.overlapped for device in devices)
+    assert devices[0].threads == devices[1].threads != devices[2].threads
+    assert devices[0].threads[0] == "bus_i2c"
+
+
+def test_async_and_opted_out_devices_stay_on_the_loop():
+    buses = bus_scheduler.BusSchedulers()
+    blocking = BlockingDevice(0)
+    async_stack = make_stack(AsyncDevice(), "modbus", buses)
+    opted_out = make_stack(blocking, "gpio", buses, offload=False)
+
+    assert asyncio.run(async_stack.execute()) == {"value": 2}
+    assert asyncio.run(opted_out.execute()) == {"value": 1}
+    assert blocking.threads == [threading.main_thread().name]
+    assert buses.buses == {}
+
+
+def test_priority_order_and_stats():
+    bus = bus_scheduler.BusScheduler("i2c")
+    started = threading.Event()
+    release = threading.Event()
+    order = []
+
+    def hold():
+        started.set()
+        release.wait()
+
+    bus.submit(hold)
+    started.wait()
+    # queued while the bus is busy - started highest priority first, then in submission order
+    futures = [bus.submit(order.append, name, priority=priority)
+               for name, priority in (("sen55", 0), ("air", 0), ("digital_in", 5), ("cancelled", 9))]
+    futures[3].cancel()
+    release.set()
+    for future in futures[:3]:
+        future.result(timeout=1)
+    bus.shutdown()
+
+    assert order == ["digital_in", "sen55", "air"]
+    stats = bus.stats.snapshot()
+    assert stats['transactions'] == 4
+    assert stats['max_depth'] == 3
+    assert sum(stats['wait_histogram'].values()) == 4
+    assert 0 < stats['utilisation'] <= 1
+    assert bus.stats.wait_percentile_bound(1) >= stats['max_wait']
+
+
+def test_errors_are_raised_to_the_caller():
+    bus = bus_scheduler.BusScheduler("serial")
+
+    def fail():
+        raise ValueError("no response")
+
+    try:
+        asyncio.run(bus.run(fail))
+        assert False, "expected ValueError"
+    except ValueError as e:
+        assert str(e) == "no response"
+    assert asyncio.run(bus.run(sum, [1, 2])) == 3
+    bus.shutdown()
@@ -0,0 +1,69 @@
+import asyncio
+
+import core.circuit_breaker
+import core.sensing_stack
+
+
+class FlakyDevice:
+    def __init__(self, failures):
+        self.failures = failures
+        self.initialised = 0
+
+    def initialise(self, interface):
+        self.initialised += 1
+
+    async def sample(self):
+        if self.failures:
+            self.failures -= 1
+            raise IOError("no response")
+        return {"value": 1}
+
+
+class FakePipeline:
+    def execute(self, sample):
+        return sample
+
+
+def test_breaker_backs_off_exponentially(clock):
+    changes = []
+    breaker = core.circuit_breaker.CircuitBreaker({'initial': 1, 'backoff': 2, 'limit': 3}, clock,
+                                                  lambda b, reason: changes.append((b.state, reason)))
+    assert breaker.allow()
+
+    delays = []
+    for _ in range(4):
+        breaker.record_failure("failed")
+        delays.append(breaker.delay)
+        clock.now += breaker.delay - 0.1
+        assert not breaker.allow()
+        clock.now += 0.1
+        assert breaker.allow() and breaker.state == core.circuit_breaker.HALF_OPEN
+    assert delays == [1, 2, 3, 3]
+
+    breaker.record_success()
+    assert breaker.state == core.circuit_breaker.CLOSED and breaker.failures == 0
+    assert changes[:2] == [("open", "failed"), ("half_open", "retrying")]
+    assert changes[-1] == ("closed", "recovered")
+
+
+def test_stack_recovers_after_reinitialising_its_device(clock):
+    device = FlakyDevice(failures=2)
+    changes = []
+    stack = core.sensing_stack.SensingStack({'device': 'meter', 'pipeline': 'pipeline',
+                                             'circuit_breaker': {'initial': 5}}, 'serial')
+    stack.initialise({'meter': device}, {'pipeline': FakePipeline()}, interfaces={'serial': 'serial interface'},
+                     on_breaker_change=lambda s, b, reason: changes.append((s.device_tag, b.state)))
+    stack.breaker.clock = clock
+
+    assert asyncio.run(stack.execute()) is None  # fails - breaker opens for 5s
+    clock.now = 4
+    assert asyncio.run(stack.execute()) is None  # still open - device not touched
+    assert device.failures == 1 and device.initialised == 0
+    clock.now = 5
+    assert asyncio.run(stack.execute()) is None  # retried after reinitialising - fails again, open for 10s
+    assert device.initialised == 1
+    clock.now = 15
+    assert asyncio.run(stack.execute()) == {"value": 1}
+    assert device.initialised == 2
+    assert changes == [('meter', 'open'), ('meter', 'half_open'), ('meter', 'open'),
+                       ('meter', 'half_open'), ('meter', 'closed')]
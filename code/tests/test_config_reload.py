@@ -0,0 +1,219 @@
+import asyncio
+import copy
+import os
+
+import core.config_reload
+import core.device_modules.replay
+import main
+import measure
+import utilities.config_manager as config_manager
+
+CONFIG = {
+    'interface': {'dummy': {'module': 'testing', 'class': 'Dummy'}},
+    'device': {
+        'meter': {'module': 'testing', 'class': 'MockDeviceConstant', 'interface': 'dummy',
+                  'config': {'value': 230}, 'variables': {'variable': 'voltage'}},
+        'probe': {'module': 'testing', 'class': 'MockDeviceConstant', 'interface': 'dummy',
+                  'config': {'value': 21.5}, 'variables': {'variable': 'temperature'}},
+    },
+    'calculation': {
+        'phase': {'module': 'gen_constants', 'class': 'DefaultConstant',
+                  'config': {'value': 1}, 'variables': {'variable': 'phase'}},
+        'site': {'module': 'gen_constants', 'class': 'DefaultConstant',
+                 'config': {'value': 'A'}, 'variables': {'variable': 'site'}},
+    },
+    'pipelines': {'power': ['phase'], 'climate': ['site']},
+    'measurement': {
+        'power': {'module': 'gen_sample', 'class': 'SingleSample', 'config': {'period': 0.01},
+                  'sensing_stacks': [{'device': 'meter', 'pipeline': 'power'}]},
+        'climate': {'module': 'gen_sample', 'class': 'SingleSample', 'config': {'period': 0.01},
+                    'sensing_stacks': [{'device': 'probe', 'pipeline': 'climate'}]},
+    },
+    'output': {
+        'power': {'topic': 'power', 'measurement': 'power',
+                  'message_spec': {'voltage': '$.voltage', 'phase': '$.phase'}},
+        'climate': {'topic': 'climate', 'measurement': 'climate',
+                    'message_spec': {'temperature': '$.temperature', 'site': '$.site'}},
+    },
+}
+
+
+async def initialise(framework):
+    framework.load_modules()
+    framework.create_pipelines()
+    framework.create_sensing_stacks()
+    framework.create_output_templates()
+    await framework.initialise_interfaces()
+    framework.initialise_devices()
+    framework.initialise_pipelines()
+    framework.initialise_sensing_stacks()
+    framework.initialise_measurements()
+
+
+def test_changed_items():
+    old = {'a': {'x': 1}, 'b': {'x': 2}, 'c': {}}
+    new = {'a': {'x': 1}, 'b': {'x': 3}, 'd': {}}
+    assert core.config_reload.changed_items(old, new) == {'b', 'c', 'd'}
+
+
+def test_watcher_sees_modified_files(tmp_path):
+    path = tmp_path / "user_config.toml"
+    path.write_text("a = 1")
+    watcher = core.config_reload.ConfigWatcher([str(path), str(tmp_path / "missing.toml")])
+    assert not watcher.changed()
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+    assert watcher.changed()
+    assert not watcher.changed()
+
+
+def test_only_changed_items_are_rebuilt():
+    framework = measure.BuildingBlockFramework(copy.deepcopy(CONFIG), {})
+    asyncio.run(initialise(framework))
+    devices = dict(framework.devices)
+    pipelines = dict(framework.pipelines)
+    modules = dict(framework.measurement_modules)
+    templates = dict(framework.output_templates)
+
+    config = copy.deepcopy(CONFIG)
+    config['calculation']['site']['config']['value'] = 'B'
+    config['device']['meter']['config']['value'] = 240
+    config['output']['power']['message_spec']['current'] = '$.current'
+    framework.apply_config(config)
+
+    assert framework.devices['probe'] is devices['probe']
+    assert framework.devices['meter'] is not devices['meter']
+    assert framework.pipelines['power'] is pipelines['power']
+    assert framework.pipelines['climate'] is not pipelines['climate']
+    # measurement config is unchanged - the running modules keep going with re-pointed stacks
+    assert framework.measurement_modules == modules
+    assert framework.sensing_stacks['power'][0].device is framework.devices['meter']
+    assert framework.sensing_stacks['climate'][0].pipeline is framework.pipelines['climate']
+    assert framework.output_templates['climate'] is templates['climate']
+    assert framework.output_templates['power'] is not templates['power']
+
+    power = asyncio.run(framework.sensing_stacks['power'][0].execute())
+    climate = asyncio.run(framework.sensing_stacks['climate'][0].execute())
+    assert (power['voltage'], power['phase']) == (240, 1)
+    assert (climate['temperature'], climate['site']) == (21.5, 'B')
+
+
+def test_reload_while_running(monkeypatch):
+    framework = measure.BuildingBlockFramework(copy.deepcopy(CONFIG), {}, config_args={})
+    sent = []
+    framework.send = lambda output: sent.append((output['topic'], output['payload']))
+
+    new_config = copy.deepcopy(CONFIG)
+    new_config['measurement']['power']['config']['period'] = 0.02
+    new_config['device']['probe']['config']['value'] = 22.0
+    del new_config['measurement']['climate']
+    del new_config['output']['climate']
+    configs = [new_config, config_manager.ConfigError("invalid")]
+
+    def get_config(wait_on_error=True):
+        assert wait_on_error is False
+        config = configs.pop(0)
+        if isinstance(config, Exception):
+            raise config
+        return config
+
+    monkeypatch.setattr(config_manager, 'get_config', get_config)
+
+    async def run():
+        task = asyncio.create_task(framework.async_loop())
+        await asyncio.sleep(0.1)
+        old_power = framework.measurement_modules['power']
+        await framework.reload()
+        assert framework.measurement_modules['power'] is not old_power
+        sent.clear()
+        await framework.reload()  # invalid config - carries on as it was
+        await asyncio.sleep(0.1)
+        assert set(framework.measurement_tasks) == {'power'}  # the removed measurement's task has finished
+        monkeypatch.setattr(measure, 'terminate_flag', True)
+        await task
+
+    asyncio.run(run())
+
+    assert framework.config is new_config
+    assert framework.output_routes == {'power': ['power']}
+    assert sent and {topic for topic, _payload in sent} == {'power'}
+
+
+def test_failed_reload_changes_nothing(tmp_path, monkeypatch):
+    framework = measure.BuildingBlockFramework(copy.deepcopy(CONFIG), {})
+    asyncio.run(initialise(framework))
+    state = {name: dict(getattr(framework, name)) for name in
+             ['devices', 'pipelines', 'measurement_modules', 'sensing_stacks', 'output_templates', 'output_filters',
+              'output_batchers', 'output_routes']}
+    stacks = {name: list(stacks) for name, stacks in framework.sensing_stacks.items()}
+    old_config = framework.config
+
+    # the unchanged climate measurement still uses the removed probe
+    config = copy.deepcopy(CONFIG)
+    config['device']['meter']['config']['value'] = 240
+    config['device']['meter']['record'] = str(tmp_path / "meter.rec")
+    del config['device']['probe']
+    try:
+        framework.apply_config(config)
+        assert False, "expected KeyError"
+    except KeyError as e:
+        assert 'probe' in str(e)
+    assert not (tmp_path / "meter.rec").exists()
+
+    # fails after the recording device is built - its file is closed again
+    config = copy.deepcopy(CONFIG)
+    config['device']['meter']['record'] = str(tmp_path / "meter.rec")
+    config['device']['meter']['interface'] = 'missing'
+    closed = []
+    close = core.device_modules.replay.RecordingDevice.close
+    monkeypatch.setattr(core.device_modules.replay.RecordingDevice, 'close',
+                        lambda device: closed.append(device) or close(device))
+    try:
+        framework.apply_config(config)
+        assert False, "expected KeyError"
+    except KeyError:
+        pass
+    assert len(closed) == 1 and closed[0].writer.file.closed
+
+    assert framework.config is old_config
+    for name, value in state.items():
+        assert getattr(framework, name) == value
+    assert framework.sensing_stacks == stacks
+    assert framework.sensing_stacks['power'][0].device is framework.devices['meter']
+
+
+def test_restart_uses_the_current_config(monkeypatch):
+    bbs = main.create_building_blocks(CONFIG, {'arg_user_file': 'user_config.toml'})
+    new_config = copy.deepcopy(CONFIG)
+    configs = [new_config, config_manager.ConfigError("invalid")]
+
+    def get_config(arg_user_file=None, wait_on_error=True):
+        assert (arg_user_file, wait_on_error) == ('user_config.toml', False)
+        config = configs.pop(0)
+        if isinstance(config, Exception):
+            raise config
+        return config
+
+    monkeypatch.setattr(config_manager, 'get_config', get_config)
+    main.refresh_config(bbs['measure'])
+    main.refresh_config(bbs['measure'])  # invalid config - restarts with the last good one
+    main.refresh_config(bbs['wrapper'])
+    assert bbs['measure']['args'][0] is new_config
+    assert bbs['wrapper']['args'][0] is CONFIG
+    assert not configs
+
+
+def test_reload_updates_name_and_reload_settings():
+    framework = measure.BuildingBlockFramework(copy.deepcopy(CONFIG), {})
+    asyncio.run(initialise(framework))
+    sent = []
+    framework.send = lambda output: sent.append(output['topic'])
+
+    config = copy.deepcopy(CONFIG)
+    config['service_module_name'] = 'line_2'
+    config['reload'] = {'watch': True, 'interval': 10}
+    framework.apply_config(config)
+    assert framework.name == 'line_2'
+    assert framework.reload_config == {'watch': True, 'interval': 10}
+    framework.dispatch_error('device', 'meter', 'no response')
+    assert sent == ['error/line_2']
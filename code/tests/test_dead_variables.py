@@ -0,0 +1,96 @@
+import asyncio
+
+import core.dead_variables
+import core.output
+import core.pipeline
+import core.sensing_stack
+import core.calculation_modules.gen_calibrate as gen_calibrate
+import core.calculation_modules.gen_constants as gen_constants
+import core.calculation_modules.gen_electrical as gen_electrical
+import core.device_modules.multi_function_meter_HOBUT as meter_HOBUT
+
+
+class Modbus:
+    def __init__(self):
+        self.registers_read = []
+
+    def read_register(self, register, n_registers, slave_id):
+        self.registers_read.append(register)
+        return 1.0
+
+
+def make_calculations():
+    return {
+        'calibrate_i1': gen_calibrate.MultiplierOffset({'multiplier': 2}, {'raw_value': 'I1'}),
+        'peak_i1': gen_electrical.RMSToPeak({}, {'var_out': 'I1', 'var_in': 'I1_rms'}),
+        'power_i2': gen_electrical.PowerToVoltageCurrent({}, {'rms_current_out': 'I2', 'rms_phase_voltage_out': 'V2',
+                                                            'power_in': 'power_2'}),
+        'phase': gen_constants.DefaultConstant({'value': 3}, {'variable': 'phases'}),
+    }
+
+
+def make_stack(config, pipeline, modbus, device_tag='meter'):
+    meter = meter_HOBUT.HOBUT_850_LTHN({'slave_id': 1}, {name: name for name in ['I1', 'I2', 'I3', 'V1', 'V2', 'V3']})
+    meter.initialise(modbus)
+    stack = core.sensing_stack.SensingStack({'device': device_tag, 'pipeline': 'pipeline', 'offload': False,
+                                             'circuit_breaker': {'enabled': False}, **config})
+    stack.initialise({device_tag: meter}, {'pipeline': pipeline})
+    return stack
+
+
+def eliminate(stack, message_spec):
+    templates = {'out': core.output.compile_json_path_message(message_spec)}
+    core.dead_variables.eliminate({'measurement': [stack]}, {'measurement': ['out']}, templates)
+
+
+def test_unused_calculations_and_registers_are_skipped():
+    pipeline = core.pipeline.Pipeline(['calibrate_i1', 'peak_i1', 'power_i2', 'phase'])
+    pipeline.initialise(make_calculations())
+    modbus = Modbus()
+    stack = make_stack({}, pipeline, modbus)
+    assert asyncio.run(stack.execute()).keys() == {'I1', 'I2', 'I3', 'V1', 'V2', 'V3', 'I1_rms', 'power_2', 'phases'}
+
+    eliminate(stack, {'current': '$.I1_rms', 'phases': '$.phases'})
+    assert [type(step).__name__ for _index, step in pipeline.steps] == ['AffineChain', 'DefaultConstant']
+    modbus.registers_read.clear()
+    # the intermediate calibrated I1 is not set either
+    assert asyncio.run(stack.execute()) == {'I1': 1.0, 'I1_rms': 2.0 / 2 ** 0.5, 'phases': 3}
+    assert modbus.registers_read == [0x000C]
+
+    # every variable is used
+    eliminate(stack, {'all': '$.*'})
+    modbus.registers_read.clear()
+    assert len(asyncio.run(stack.execute())) == 9
+    assert len(modbus.registers_read) == 6
+
+
+def test_prefixed_stacks_sharing_a_pipeline():
+    pipeline = core.pipeline.Pipeline(['calibrate_i1', 'peak_i1', 'power_i2', 'phase'])
+    pipeline.initialise(make_calculations())
+    stacks = [make_stack({'prefix': 'a_'}, pipeline, Modbus(), 'meter_a'),
+              make_stack({'prefix': 'b_'}, pipeline, Modbus(), 'meter_b')]
+    templates = {'out': core.output.compile_json_path_message({'a': '$.a_power_2', 'b': '$.b_V1'})}
+    core.dead_variables.eliminate({'measurement': stacks}, {'measurement': ['out']}, templates)
+
+    assert [type(step).__name__ for _index, step in pipeline.steps] == ['PowerToVoltageCurrent']
+    # the pipeline, and so both meters, produce the variables used by either stack
+    assert asyncio.run(stacks[0].execute()) == {'a_I2': 1.0, 'a_V1': 1.0, 'a_V2': 1.0, 'a_power_2': 1.0}
+    assert asyncio.run(stacks[1].execute()) == {'b_I2': 1.0, 'b_V1': 1.0, 'b_V2': 1.0, 'b_power_2': 1.0}
+
+
+def test_modules_that_do_not_say_what_they_read_keep_everything():
+    class Opaque:
+        def calculate(self, var_dict):
+            return var_dict
+
+    calculations = {**make_calculations(), 'opaque': Opaque()}
+    contents = [calculations[name] for name in ['calibrate_i1', 'power_i2', 'opaque', 'phase']]
+    live_after, needed = core.pipeline.find_live_variables(contents, {'phases'})
+    assert needed is None
+    assert live_after[3] == {'phases'}
+    assert live_after[2] == {'phases'}
+    assert live_after[0] is None and live_after[1] is None
+
+    live_after, needed = core.pipeline.find_live_variables(contents[:2], {'power_2'})
+    assert live_after[0] is core.pipeline.DEAD
+    assert needed == {'power_2', 'I2', 'V2'}
@@ -0,0 +1,164 @@
+import array
+import asyncio
+import statistics
+
+import numpy
+import pytest
+
+import core.exceptions
+import core.sensing_stack
+from core.measurement_modules import gen_sample
+
+
+class FakeDevice:
+    def __init__(self, duration, values, events=None):
+        self.duration = duration
+        self.values = values
+        self.events = events if events is not None else []
+
+    async def sample(self):
+        name = next(iter(self.values))
+        self.events.append(("start", name))
+        await asyncio.sleep(self.duration)
+        self.events.append(("end", name))
+        return dict(self.values)
+
+
+class FakePipeline:
+    def execute(self, sample):
+        return sample
+
+
+def make_stack(interface, duration, values, timeout=None, events=None):
+    config = {'device': f"device_{interface}_{duration}", 'pipeline': 'pipeline'}
+    if timeout is not None:
+        config['timeout'] = timeout
+    stack = core.sensing_stack.SensingStack(config, interface)
+    stack.initialise({config['device']: FakeDevice(duration, values, events)}, {'pipeline': FakePipeline()})
+    return stack
+
+
+def test_concurrent_stacks_overlap_across_interfaces():
+    events = []
+    stacks = [make_stack("modbus", 0.1, {"a": 1, "shared": 1}, events=events),
+              make_stack("modbus", 0.1, {"b": 2}, events=events),
+              make_stack("one_wire", 0.15, {"c": 3, "shared": 3}, events=events),
+              make_stack("i2c", 0.05, {"d": 4}, events=events)]
+
+    sequential = gen_sample.MultiSampleMerged({"period": 1})
+    sequential.initialise(stacks)
+    _delay, sequential_dict = asyncio.run(sequential.loop())
+    assert events == [(event, name) for name in "abcd" for event in ("start", "end")]
+
+    events.clear()
+    concurrent = gen_sample.MultiSampleMerged({"period": 1, "concurrent": True})
+    concurrent.initialise(stacks)
+    _delay, concurrent_dict = asyncio.run(concurrent.loop())
+
+    # merged in stack order whichever mode is used
+    assert concurrent_dict == sequential_dict == {"a": 1, "b": 2, "c": 3, "d": 4, "shared": 3}
+    # one stack per interface starts straight away...
+    assert set(events[:3]) == {("start", "a"), ("start", "c"), ("start", "d")}
+    # ...while the two modbus stacks are still executed one after another
+    assert events.index(("end", "a")) < events.index(("start", "b"))
+
+
+def test_slow_stack_is_omitted_after_timeout(caplog):
+    events = []
+    stacks = [make_stack("modbus", 0.01, {"a": 1}, events=events),
+              make_stack("serial", 5, {"b": 2}, timeout=0.05, events=events),
+              make_stack("i2c", 0.01, {"c": 3}, events=events)]
+
+    module = gen_sample.MultiSampleMergedAvg({"period": 1, "n_samples": 1, "concurrent": True, "stack_timeout": 1})
+    module.initialise(stacks)
+    _delay, var_dict = asyncio.run(module.loop())
+    assert var_dict == {"a": 1, "c": 3}
+    # the slow stack was cancelled at its own timeout rather than the module's
+    assert ("start", "b") in events and ("end", "b") not in events
+    assert "device_serial_5 timed out after 0.05s" in caplog.text
+
+
+def test_sample_errors_are_raised():
+    class FailingDevice:
+        async def sample(self):
+            raise ValueError("no response")
+
+    failing = core.sensing_stack.SensingStack(
+        {'device': 'failing', 'pipeline': 'pipeline', 'circuit_breaker': {'enabled': False}}, "serial")
+    failing.initialise({'failing': FailingDevice()}, {'pipeline': FakePipeline()})
+    module = gen_sample.MultiSampleMerged({"period": 1, "concurrent": True})
+    module.initialise([make_stack("modbus", 0.01, {"a": 1}), failing])
+    try:
+        asyncio.run(module.loop())
+        assert False, "expected SampleError"
+    except core.exceptions.SampleError as e:
+        assert e.device == 'failing'
+
+    # with a circuit breaker (the default) the failing stack is left out and the others are still sampled
+    failing = core.sensing_stack.SensingStack({'device': 'failing', 'pipeline': 'pipeline'}, "serial")
+    failing.initialise({'failing': FailingDevice()}, {'pipeline': FakePipeline()})
+    module.initialise([make_stack("modbus", 0.01, {"a": 1}), failing])
+    assert asyncio.run(module.loop())[1] == {"a": 1}
+    assert failing.breaker.state == "open"
+
+
+def test_running_averages_match_statistics():
+    samples = [{"i": 1, "f": 0.1, "state": "on", "flag": True},
+               None,  # stack not sampled
+               {"i": 2, "f": 0.7, "state": "off", "flag": True},
+               {"i": 3, "f": 0.25, "state": "off"},
+               {"i": 4, "f": 1e6, "state": "on", "flag": True}]
+    averager = gen_sample.Averager(["min", "max", "std"])
+    for sample in samples:
+        averager.add(sample)
+    out = averager.result()
+
+    floats = [0.1, 0.7, 0.25, 1e6]
+    assert out["i"] == statistics.mean([1, 2, 3, 4]) == 2.5
+    assert out["f"] == pytest.approx(statistics.mean(floats))
+    assert out["f_std"] == pytest.approx(statistics.stdev(floats))
+    assert (out["f_min"], out["f_max"]) == (0.1, 1e6)
+    assert out["state"] == statistics.mode(["on", "off", "off", "on"]) == "on"  # first seen wins a tie
+    assert out["flag"] == statistics.mean([True, True, True]) == 1
+    assert "state_min" not in out
+    # integers stay integers when the mean is whole
+    averager.add({"i": 2})
+    averager.add({"i": 4})
+    assert averager.result() == {"i": 3, "i_min": 2, "i_max": 4, "i_std": pytest.approx(2 ** 0.5)}
+    assert averager.result() == {}
+
+
+def test_averaging_module_with_statistics():
+    class CountingDevice:
+        def __init__(self):
+            self.count = 0
+
+        def sample(self):
+            self.count += 1
+            return {"n": self.count}
+
+    stack = core.sensing_stack.SensingStack({'device': 'counter', 'pipeline': 'pipeline', 'offload': False})
+    stack.initialise({'counter': CountingDevice()}, {'pipeline': FakePipeline()})
+    module = gen_sample.SingleSampleAvg({"period": 0.01, "n_samples": 1000, "statistics": ["max"]})
+    module.initialise([stack])
+    outputs = [asyncio.run(module.loop())[1] for _i in range(2000)]
+    assert [out for out in outputs if out is not None] == [{"n": 500.5, "n_max": 1000}, {"n": 1500.5, "n_max": 2000}]
+    assert module.input_variables({"n_max", "timestamp"}) == {"n_max", "n", "timestamp"}
+
+
+def test_averages_of_mixed_values():
+    averager = gen_sample.Averager(["max"])
+    samples = [{"v": 1.5, "n": numpy.int64(2), "s": "on", "block": array.array('d', [1.0])},
+               {"v": None, "n": numpy.int64(4), "s": 1, "block": array.array('d', [2.0])},
+               {"v": "ERR", "n": numpy.float64(4.5), "s": "on", "block": array.array('d', [1.0])},
+               {"v": 2.5, "s": "off"}]
+    for sample in samples:
+        averager.add(sample)
+    out = averager.result()
+    # the numeric mean is kept when a non-numeric value turns up and None is skipped
+    assert out["v"] == 2.0 and out["v_max"] == 2.5
+    assert out["n"] == pytest.approx(3.5) and type(out["n_max"]) is float
+    assert out["s"] == "on" and "s_max" not in out
+    assert out["block"] == array.array('d', [1.0])
+    averager.add({"v": None})
+    assert averager.result() == {"v": None}
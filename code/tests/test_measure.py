@@ -0,0 +1,108 @@
+import asyncio
+
+import core.exceptions
+import measure
+
+CONFIG = {
+    'interface': {'dummy': {'module': 'testing', 'class': 'Dummy'}},
+    'device': {
+        'meter': {'module': 'testing', 'class': 'MockDeviceConstant', 'interface': 'dummy',
+                  'config': {'value': 230}, 'variables': {'variable': 'voltage'}},
+        'probe': {'module': 'testing', 'class': 'MockDeviceConstant', 'interface': 'dummy',
+                  'config': {'value': 21.5}, 'variables': {'variable': 'temperature'}},
+    },
+    'calculation': {},
+    'pipelines': {'none': []},
+    'measurement': {
+        'power': {'module': 'gen_sample', 'class': 'SingleSample', 'config': {'period': 0.01},
+                  'sensing_stacks': [{'device': 'meter', 'pipeline': 'none'}]},
+        'climate': {'module': 'gen_sample', 'class': 'SingleSample', 'config': {'period': 0.05},
+                    'sensing_stacks': [{'device': 'probe', 'pipeline': 'none'}]},
+    },
+    'output': {
+        'power': {'topic': 'power', 'measurement': 'power', 'message_spec': {'voltage': '$.voltage'}},
+        'climate': {'topic': 'climate', 'measurement': ['climate'], 'message_spec': {'temperature': '$.temperature'}},
+        'all': {'topic': 'all', 'message_spec': {'timestamp': '$.timestamp'}},
+    },
+}
+
+
+def test_single_measurement_is_named_measurement():
+    single = CONFIG['measurement']['power']
+    assert measure.get_measurement_configs(single) == {measure.DEFAULT_MEASUREMENT: single}
+    assert measure.get_measurement_configs(CONFIG['measurement']) is CONFIG['measurement']
+
+
+def test_named_measurements_run_concurrently(monkeypatch):
+    framework = measure.BuildingBlockFramework(CONFIG, {})
+    sent = []
+    framework.send = lambda output: sent.append((output['topic'], output['payload']))
+
+    async def run():
+        task = asyncio.create_task(framework.async_loop())
+        await asyncio.sleep(0.3)
+        monkeypatch.setattr(measure, 'terminate_flag', True)
+        await task
+
+    asyncio.run(run())
+
+    assert framework.output_routes == {'power': ['power', 'all'], 'climate': ['climate', 'all']}
+    topics = [topic for topic, _payload in sent]
+    assert {payload['voltage'] for topic, payload in sent if topic == 'power'} == {230}
+    assert {payload['temperature'] for topic, payload in sent if topic == 'climate'} == {21.5}
+    # each measurement keeps its own period
+    assert topics.count('power') > 2 * topics.count('climate') > 0
+    assert topics.count('all') == topics.count('power') + topics.count('climate')
+
+
+def test_shared_output_keeps_separate_state_per_measurement():
+    config = {**CONFIG, 'output': {
+        'changes': {'topic': 'changes', 'message_spec': {'voltage': '$.voltage', 'temperature': '$.temperature'},
+                    'report_by_exception': {'deadband': 1}},
+        'batched': {'topic': 'batched', 'message_spec': {'voltage': '$.voltage', 'temperature': '$.temperature'},
+                    'batch': {'size': 2, 'layout': 'column'}},
+    }}
+    framework = measure.BuildingBlockFramework(config, {})
+    framework.create_output_templates()
+    sent = []
+    framework.send = lambda output: sent.append((output['topic'], output['payload']))
+
+    for _cycle in range(3):
+        for measurement_name, var_dict in (('power', {'voltage': 230}), ('climate', {'temperature': 21.5})):
+            for message in framework.generate_output({**var_dict, 'timestamp': 't'}, measurement_name):
+                framework.dispatch(message)
+
+    # unchanged values are only reported once for each measurement
+    assert [payload for topic, payload in sent if topic == 'changes'] == [{'voltage': 230}, {'temperature': 21.5}]
+    # batches do not mix the rows of different measurements
+    assert [payload for topic, payload in sent if topic == 'batched'] == [
+        {'voltage': [230, 230], 'timestamp': ['t', 't']}, {'temperature': [21.5, 21.5], 'timestamp': ['t', 't']}]
+
+
+def test_stack_errors_only_pause_their_measurement():
+    class FailingModule:
+        def __init__(self, error):
+            self.error = error
+
+        async def loop(self):
+            raise self.error
+
+    framework = measure.BuildingBlockFramework(CONFIG, {})
+    framework.send = lambda output: None
+    sample_error = FailingModule(core.exceptions.SampleError("no response", 'meter'))
+    calculation_error = FailingModule(core.exceptions.CalculationError("bad value", 'phase'))
+    for _ in range(10):  # stack errors never restart the process
+        assert asyncio.run(framework.measurement_cycle('power', sample_error)) == 10
+        assert asyncio.run(framework.measurement_cycle('power', calculation_error)) == 10
+    assert framework.fail_counts == {}
+
+    unexpected = FailingModule(RuntimeError("bug"))
+    for _ in range(5):
+        assert asyncio.run(framework.measurement_cycle('power', unexpected)) == 10
+    assert asyncio.run(framework.measurement_cycle('climate', unexpected)) == 10
+    assert framework.fail_counts == {'power': 5, 'climate': 1}
+    try:
+        asyncio.run(framework.measurement_cycle('power', unexpected))
+        assert False, "expected SystemExit"
+    except SystemExit as e:
+        assert e.code == 255
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import struct
+
+import pytest
+
+import core.interface_modules.bus_scheduler as bus_scheduler
+import core.metrics
+import core.sensing_stack
+import mqtt_out
+from conftest import FakeClock
+
+
+class SlowDevice:
+    def __init__(self, clock):
+        self.clock = clock
+
+    def sample(self):
+        self.clock.now += 0.002
+        return {"value": 1}
+
+
+class SlowPipeline:
+    def __init__(self, clock):
+        self.clock = clock
+
+    def execute(self, sample):
+        self.clock.now += 0.0005
+        return sample
+
+
+class FakeSocket:
+    def __init__(self, messages):
+        self.messages = list(messages)
+
+    def recv_multipart(self, _flags=0):
+        return self.messages.pop(0)
+
+
+def test_histogram_percentiles():
+    histogram = core.metrics.Histogram()
+    for ms in range(1, 101):
+        histogram.observe(ms / 1000)
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 100
+    assert abs(snapshot['sum'] - 5.05) < 1e-9
+    assert snapshot['max'] == 0.1
+    # percentiles are the upper bound of their bucket - within ~12% above the true value
+    assert 0.05 <= snapshot['p50'] <= 0.05 * 1.13
+    assert 0.095 <= snapshot['p95'] <= 0.095 * 1.13
+    assert 0.099 <= snapshot['p99'] <= 0.1
+    assert core.metrics.Histogram().quantile(0.5) == 0
+
+
+def test_disabled_by_default():
+    assert core.metrics.create_metrics({}, "measure") is None
+    assert core.metrics.create_exporters(None, {'enabled': True}, print) == []
+
+    metrics = core.metrics.create_metrics({'enabled': True}, "measure")
+    exporters = core.metrics.create_exporters(metrics, {'prometheus_port': 9100}, print, port_offset=1)
+    assert [type(exporter) for exporter in exporters] == [core.metrics.MQTTExporter, core.metrics.PrometheusExporter]
+    assert exporters[1].port == 9101
+
+
+def test_sensing_stack_times_sample_and_pipeline(clock):
+    metrics = core.metrics.Metrics("measure", clock)
+    stack = core.sensing_stack.SensingStack({'device': 'meter', 'pipeline': 'calc', 'offload': False})
+    stack.initialise({'meter': SlowDevice(clock)}, {'calc': SlowPipeline(clock)}, metrics=metrics)
+
+    for _ in range(3):
+        asyncio.run(stack.execute())
+
+    stages = metrics.snapshot()['stages']
+    assert stages['sample']['meter']['count'] == 3
+    assert abs(stages['sample']['meter']['max'] - 0.002) < 1e-9
+    assert abs(stages['pipeline']['calc']['sum'] - 0.0015) < 1e-9
+
+
+def test_mqtt_exporter_publishes_each_interval(clock):
+    metrics = core.metrics.Metrics("mqtt_out", clock)
+    published = []
+    exporter = core.metrics.MQTTExporter(metrics, published.append, interval=10, clock=clock)
+
+    metrics.observe('zmq', "", 0.001)
+    exporter.poll()
+    clock.now = 10
+    exporter.poll()
+    exporter.poll()
+    assert len(published) == 1
+    assert published[0]['building_block'] == "mqtt_out"
+    assert published[0]['stages']['zmq']['']['count'] == 1
+
+
+def test_prometheus_text():
+    metrics = core.metrics.Metrics("measure")
+    metrics.observe('output', 'power "main"', 0.25)
+    text = metrics.prometheus_text()
+    labels = 'building_block="measure",stage="output",label="power \\"main\\""'
+    assert "# TYPE sensing_stage_latency_seconds summary" in text
+    assert f'sensing_stage_latency_seconds{{{labels},quantile="0.5"}} 0.25' in text
+    assert f'sensing_stage_latency_seconds_count{{{labels}}} 1' in text
+    assert f'sensing_stage_latency_seconds_max{{{labels}}} 0.25' in text
+
+
+def test_mqtt_out_times_zmq_hop():
+    config = {'mqtt': {'broker': 'localhost', 'port': 1883}, 'metrics': {'enabled': True}}
+    wrapper = mqtt_out.MQTTServiceWrapper(config, {})
+    wrapper.metrics.clock = FakeClock(5.0)
+    wrapper.zmq_in = FakeSocket([
+        [json.dumps({'topic': 't', 'payload': {'a': 1}, 'sent': 4.75}).encode()],
+        [b"t", b'{"a": 1}', struct.pack('!d', 4.5)],
+    ])
+
+    assert wrapper.receive() == ("t", '{"a": 1}')
+    assert wrapper.receive() == ("t", b'{"a": 1}')
+    zmq_stage = wrapper.metrics.histogram('zmq')
+    assert zmq_stage.count == 2
+    assert zmq_stage.max == 0.5
+
+
+def test_bus_statistics_are_exported(clock):
+    metrics = core.metrics.Metrics("measure")
+    buses = bus_scheduler.BusSchedulers(report_interval=10, metrics=metrics)
+    bus = buses.get("i2c")
+    bus.clock = bus.stats.clock = clock
+    bus.stats.last_report = clock()
+
+    def transaction():
+        clock.advance(2)
+
+    bus.submit(transaction).result(timeout=5)
+    bus.submit(transaction).result(timeout=5)
+    clock.advance(6)
+    buses.report()
+    buses.shutdown()
+
+    snapshot = metrics.snapshot()
+    assert snapshot['stages']['bus_wait']['i2c']['count'] == 2
+    assert snapshot['gauges']['bus_utilisation'] == {'i2c': pytest.approx(0.4)}
+    assert snapshot['gauges']['bus_queue_depth_max'] == {'i2c': 0}
+    text = metrics.prometheus_text()
+    assert "# TYPE sensing_bus_utilisation gauge" in text
+    assert 'sensing_bus_utilisation{building_block="measure",label="i2c"} 0.4' in text
@@ -0,0 +1,148 @@
+import html
+import json
+
+import paho.mqtt.client as mqtt
+import zmq
+
+import core.outbound_queue
+import measure
+import mqtt_out
+
+
+class FakeInfo:
+    def __init__(self, rc, mid=0):
+        self.rc = rc
+        self.mid = mid
+
+
+class FakeClient:
+    def __init__(self):
+        self.connected = True
+        self.published = []
+
+    def is_connected(self):
+        return self.connected
+
+    def publish(self, topic, payload, qos=0):
+        if not self.connected:
+            return FakeInfo(mqtt.MQTT_ERR_NO_CONN)
+        self.published.append((topic, payload))
+        return FakeInfo(mqtt.MQTT_ERR_SUCCESS, len(self.published))
+
+
+class FakeSocket:
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.sent = []
+
+    def send_multipart(self, frames):
+        self.sent.append(frames)
+
+    def recv_multipart(self, _flags=0):
+        if not self.messages:
+            raise zmq.Again()
+        return self.messages.pop(0)
+
+
+def make_wrapper(tmp_path, drain_rate=2, max_inflight=100):
+    config = {'mqtt': {'broker': 'localhost', 'port': 1883, 'max_inflight': max_inflight,
+                       'store_and_forward': {'enabled': True, 'drain_rate': drain_rate}}}
+    wrapper = mqtt_out.MQTTServiceWrapper(config, {})
+    wrapper.queue = core.outbound_queue.PersistentQueue(str(tmp_path / "queue.sqlite"))
+    return wrapper
+
+
+def test_store_while_disconnected_then_drain_in_order(tmp_path):
+    wrapper = make_wrapper(tmp_path)
+    client = FakeClient()
+
+    wrapper.publish(client, "t", "0")
+    client.connected = False
+    wrapper.publish(client, "t", "1")
+    wrapper.publish(client, "t", "2")
+    client.connected = True
+    # backlog exists so new messages are stored behind it
+    wrapper.publish(client, "t", "3")
+    assert client.published == [("t", "0")]
+    assert len(wrapper.queue) == 3
+
+    wrapper.drain(client)
+    wrapper.drain_timestamp -= 1  # one second of drain allowance
+    wrapper.drain(client)
+    assert client.published == [("t", "0"), ("t", "1"), ("t", "2")]
+    wrapper.drain_timestamp -= 1
+    wrapper.drain(client)
+    assert client.published == [("t", "0"), ("t", "1"), ("t", "2"), ("t", "3")]
+    assert len(wrapper.queue) == 0
+
+    wrapper.publish(client, "t", "4")
+    assert client.published[-1] == ("t", "4")
+
+
+def test_inflight_window_and_latency(tmp_path):
+    wrapper = make_wrapper(tmp_path, drain_rate=100, max_inflight=2)
+    client = FakeClient()
+
+    assert wrapper.send(client, "t", "0")
+    assert wrapper.send(client, "t", "1")
+    assert not wrapper.window_available(0)
+    wrapper.on_publish(client, None, 1)
+    assert wrapper.window_available(0)
+    assert wrapper.stats.count == 1
+
+    # acknowledgements can arrive on the network thread before send() has recorded the message
+    wrapper.on_publish(client, None, 3)
+    assert wrapper.send(client, "t", "2")
+    assert wrapper.stats.count == 2
+    assert list(wrapper.inflight) == [2]
+
+    # drain only fills the free part of the window
+    client.connected = False
+    for i in range(5):
+        wrapper.publish(client, "t", f"q{i}")
+    client.connected = True
+    wrapper.drain(client)
+    wrapper.drain_timestamp -= 1
+    wrapper.drain(client)
+    assert client.published[-1] == ("t", "q0")
+    assert len(wrapper.queue) == 4
+
+
+def test_receive_json_and_multipart():
+    config = {'mqtt': {'broker': 'localhost', 'port': 1883, 'topic_prefix': 'site/'}}
+    wrapper = mqtt_out.MQTTServiceWrapper(config, {})
+    payload = {"machine": "Machine_1", "current": 1.5}
+    wrapper.zmq_in = FakeSocket([
+        [json.dumps({'topic': 'power/{{machine}}', 'payload': payload}).encode()],
+        [b'site/power/Machine_1', b'{"machine":"Machine_1","current":1.5}'],
+    ])
+
+    assert wrapper.receive() == ('site/power/Machine_1', json.dumps(payload))
+    # multipart topics (prefixed by measure) and payloads are published as they are
+    assert wrapper.receive() == ('site/power/Machine_1', b'{"machine":"Machine_1","current":1.5}')
+    assert wrapper.receive() is None
+
+
+def test_transport_modes_publish_to_the_same_topic():
+    config = {'interface': {}, 'device': {}, 'calculation': {}, 'pipelines': {}, 'measurement': {}, 'output': {},
+              'mqtt': {'broker': 'localhost', 'port': 1883, 'topic_prefix': 'site/'},
+              'transport': {'mode': 'multipart'}}
+    framework = measure.BuildingBlockFramework(config, {})
+    framework.zmq_out = FakeSocket([])
+    wrapper = mqtt_out.MQTTServiceWrapper(config, {})
+
+    for machine in ["line:1", "/line_1", "http://line_1"]:
+        payload = {"machine": machine}
+        framework.send({'topic': 'power/{{machine}}', 'payload': payload})
+        wrapper.zmq_in = FakeSocket([framework.zmq_out.sent.pop(),
+                                     [json.dumps({'topic': 'power/{{machine}}', 'payload': payload}).encode()]])
+        multipart_topic, _payload = wrapper.receive()
+        json_topic, _payload = wrapper.receive()
+        assert multipart_topic == json_topic == f"site/power/{html.escape(machine)}"
+
+
+def test_reconnect_backoff_is_ignored_with_a_warning(caplog):
+    config = {'mqtt': {'broker': 'localhost', 'port': 1883, 'reconnect': {'initial': 1, 'backoff': 3, 'limit': 30}}}
+    wrapper = mqtt_out.MQTTServiceWrapper(config, {})
+    assert (wrapper.initial, wrapper.limit) == (1, 30)
+    assert "reconnect.backoff is no longer used" in caplog.text
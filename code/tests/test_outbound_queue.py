@@ -0,0 +1,34 @@
+import core.outbound_queue
+
+
+def test_queue_is_oldest_first(tmp_path):
+    queue = core.outbound_queue.PersistentQueue(str(tmp_path / "queue.sqlite"))
+    for i in range(5):
+        queue.put(f"topic/{i}", f"{i}")
+    assert len(queue) == 5
+
+    batch = queue.peek(3)
+    assert [(topic, payload) for _id, topic, payload in batch] == [("topic/0", "0"), ("topic/1", "1"), ("topic/2", "2")]
+    queue.remove_up_to(batch[-1][0])
+    assert len(queue) == 2
+    assert [payload for _id, _topic, payload in queue.peek(10)] == ["3", "4"]
+
+
+def test_queue_evicts_oldest(tmp_path):
+    queue = core.outbound_queue.PersistentQueue(str(tmp_path / "queue.sqlite"), max_messages=3)
+    queue.put_many([("t", f"{i}") for i in range(5)])
+    queue.put("t", "5")
+    assert len(queue) == 3
+    assert [payload for _id, _topic, payload in queue.peek(10)] == ["3", "4", "5"]
+
+
+def test_queue_survives_reopen(tmp_path):
+    path = str(tmp_path / "data" / "queue.sqlite")
+    queue = core.outbound_queue.PersistentQueue(path)
+    queue.put("t", b"\x00binary")
+    queue.put("t", "text")
+    queue.close()
+
+    reopened = core.outbound_queue.PersistentQueue(path)
+    assert len(reopened) == 2
+    assert [payload for _id, _topic, payload in reopened.peek(10)] == [b"\x00binary", "text"]
@@ -0,0 +1,95 @@
+import core.output
+
+
+DATASET = {
+    "timestamp": "2024-01-01T00:00:00+00:00",
+    "machine": "Machine_1",
+    "current_rms": 12.5,
+    "phase": "single",
+    "flag": None,
+    "nested": {"a": {"b": 1}, "list": [10, 20, 30]},
+}
+
+
+def check_template(spec, dataset=DATASET):
+    expected = core.output.generate_json_path_message(dataset, spec)
+    template = core.output.compile_json_path_message(spec)
+    assert template.render(dataset) == expected
+    # templates are reused, so a second render must give the same result
+    assert template.render(dataset) == expected
+    return template
+
+
+def test_template_simple_paths():
+    template = check_template({"timestamp": "$.timestamp", "current": "$.current_rms", "machine": "$.machine"})
+    assert template.variables == {"timestamp", "current_rms", "machine"}
+
+
+def test_template_constants_and_nesting():
+    check_template({
+        "a.b.c": "$.current_rms",
+        "a": {"b": {"d": "#text"}},
+        "x": [{"y": "=1"}, {"y": "=1.5"}, "=true", "=false", "=null"],
+        "z": "$.nested.a",
+    })
+
+
+def test_template_missing_values_are_dropped():
+    check_template({"present": "$.machine", "missing": "$.not_there", "deep.missing": "$.nested.nope"})
+    check_template({"flag": "$.flag"})
+    assert core.output.compile_json_path_message({"missing": "$.not_there"}).render(DATASET) is None
+
+
+def test_template_complex_jsonpath():
+    template = check_template({"first": "$.nested.list[0]", "all": "$..b"})
+    assert template.variables is None
+
+
+def test_template_root_jsonpath():
+    template = check_template({"all": "$", "machine": "$.machine"})
+    assert template.render(DATASET)["all"] == DATASET
+    assert template.variables is None
+
+
+def test_template_unique_dataset():
+    template = core.output.compile_json_path_message({"value": "$.v"})
+    assert template.render({"v": 1}) == {"value": 1}
+    assert template.render({"v": 2}) == {"value": 2}
+
+
+def test_flat_tree_round_trip():
+    trees = [
+        {"a": {"b": {"c": 1, "d": "abc"}}, "e": True},
+        {"x": [{"y": 1, "z": [1, 2, {"w": None}]}, {"y": 2}], "v": None},
+        [{"a": 1}, [2, 3], "s"],
+        {"ch": [{"v": i, "i": [i, i * 2]} for i in range(16)]},
+    ]
+    for tree in trees:
+        assert core.output.from_flat_tree(core.output.to_flat_tree(tree)) == tree
+
+
+def test_from_flat_tree_merges_paths():
+    flat = {"a.b": 1, "c": 2, "a.d.[0]": 3, "a.d.[1].e": 4, "a.d.[1].f": 5}
+    assert core.output.from_flat_tree(flat) == {"a": {"b": 1, "d": [3, {"e": 4, "f": 5}]}, "c": 2}
+    assert core.output.from_flat_tree({}) is None
+    # a new array takes its first entry whatever the index
+    assert core.output.from_flat_tree({"a.[1]": 5}) == {"a": [5]}
+    assert core.output.from_flat_tree({"a.[2].b": 5}) == {"a": [{"b": 5}]}
+
+
+def test_from_flat_tree_conflicting_paths():
+    for flat in ({"a": 1, "a.b": 2}, {"a.b": 1, "a": 2}, {"a.[0]": 1, "a.[2]": 2}, {"a.[0]": 1, "a.b": 2}):
+        try:
+            core.output.from_flat_tree(flat)
+            assert False, f"expected failure for {flat}"
+        except Exception as e:
+            assert str(e) == "Something went Badly wrong"
+
+
+def test_from_flat_tree_deep_paths():
+    # scaling with depth is measured by benchmarks/bench_output.py
+    prefix = ".".join(f"l{d}" for d in range(80))
+    tree = core.output.from_flat_tree({f"{prefix}.ch.[{i}]": i for i in range(20)})
+    for d in range(80):
+        tree = tree[f"l{d}"]
+    assert tree == {"ch": list(range(20))}
@@ -0,0 +1,90 @@
+import array
+
+import numpy
+import pytest
+
+import core.pipeline
+import core.calculation_modules.gen_amplifier as gen_amplifier
+import core.calculation_modules.gen_calibrate as gen_calibrate
+import core.calculation_modules.gen_current_clamp as gen_current_clamp
+import core.calculation_modules.gen_electrical as gen_electrical
+import core.calculation_modules.gen_pt_rtd as gen_pt_rtd
+
+
+def make_calculations():
+    return {
+        'amplifier': gen_amplifier.GenAmplifier({'gain': 3}, {'amp_input': 'v_clamp', 'amp_output': 'v_adc'}),
+        'clamp': gen_current_clamp.VoltageClamp({'nominal_current': 20}, {'voltage_out': 'v_clamp',
+                                                                          'current_in': 'current'}),
+        'calibrate': gen_calibrate.OffsetMultiplier({'multiplier': 1.05, 'offset': -0.02}, {'raw_value': 'current'}),
+        'rms': gen_electrical.RMSToPeak({}, {'var_out': 'current', 'var_in': 'current_rms'}),
+        'power': gen_electrical.PowerToCurrent({'phase_voltage': 230, 'phases': 3},
+                                               {'rms_current_out': 'current_rms', 'power_in': 'power'}),
+        'rtd': gen_pt_rtd.PT_RTD({}, {'resistance': 'current', 'temperature': 'temperature'}),
+        'no_gain': gen_amplifier.GenAmplifier({}, {'amp_input': 'x', 'amp_output': 'v_adc'}),
+    }
+
+
+def execute_step_by_step(calculations, spec, sample):
+    variables = dict(sample)
+    for name in spec:
+        variables = calculations[name].calculate(variables)
+    return variables
+
+
+def make_pipeline(spec):
+    pipeline = core.pipeline.Pipeline(spec)
+    pipeline.initialise(make_calculations())
+    return pipeline
+
+
+@pytest.mark.parametrize("spec", [
+    ['amplifier', 'clamp', 'calibrate', 'rms', 'power'],
+    ['amplifier', 'clamp', 'rtd', 'calibrate', 'rms', 'power'],
+])
+def test_fused_pipeline_matches_step_by_step(spec):
+    pipeline = make_pipeline(spec)
+    for sample in ({'v_adc': 0.41}, {'v_adc': array.array('d', [0.1, 0.2, -0.3])}):
+        fused = pipeline.execute(sample)
+        expected = execute_step_by_step(make_calculations(), spec, sample)
+        assert fused.keys() == expected.keys()
+        for name, value in expected.items():
+            assert numpy.asarray(fused[name]) == pytest.approx(numpy.asarray(value))
+
+
+def test_runs_of_affine_modules_are_folded():
+    pipeline = make_pipeline(['amplifier', 'clamp', 'rtd', 'calibrate', 'rms', 'power'])
+    kinds = [type(step).__name__ for _index, step in pipeline.steps]
+    assert kinds == ['AffineChain', 'PT_RTD', 'AffineChain']
+    assert [index for index, _step in pipeline.steps] == [0, 2, 3]
+
+    chain = pipeline.steps[2][1]
+    terms = {variable: (source, a, b) for variable, source, a, b in chain.terms}
+    # power = 3 * 230 * (current * 1.05 - 0.021) / sqrt(2)
+    assert terms['power'][0] == 'current'
+    assert terms['power'][1] == pytest.approx(3 * 230 * 1.05 / 2 ** 0.5)
+    assert terms['power'][2] == pytest.approx(3 * 230 * -0.021 / 2 ** 0.5)
+
+
+def test_missing_input_and_invalid_config_fall_back_to_step_by_step():
+    pipeline = make_pipeline(['amplifier', 'clamp', 'calibrate'])
+    assert pipeline.execute({'other': 1}) == {'other': 1}
+    assert pipeline.execute({'v_adc': None}) == {'v_adc': None}
+
+    # no gain - not folded, so it logs its error when executed as it always has
+    pipeline = make_pipeline(['no_gain', 'clamp', 'calibrate'])
+    assert [type(step).__name__ for _index, step in pipeline.steps] == ['GenAmplifier', 'AffineChain']
+
+
+class ReturnsNewDict:
+    def calculate(self, var_dict):
+        return {'doubled': var_dict['v_adc'] * 2}
+
+
+def test_blackboard_is_updated_in_place():
+    pipeline = core.pipeline.Pipeline(['new_dict', 'amplifier'])
+    calculations = make_calculations()
+    pipeline.initialise({**calculations, 'new_dict': ReturnsNewDict()})
+    sample = {'v_adc': 0.375}
+    assert pipeline.execute(sample) == {'v_adc': 0.375, 'doubled': 0.75, 'v_clamp': 0.125}
+    assert sample == {'v_adc': 0.375}
@@ -0,0 +1,63 @@
+import pstats
+import time
+
+import core.profiling
+
+
+def wait_for_file(profiler, timeout=5):
+    end = time.monotonic() + timeout
+    while profiler.running and time.monotonic() < end:
+        time.sleep(0.01)
+    return profiler.last_file
+
+
+def busy_work():
+    return sum(i * i for i in range(20000))
+
+
+def test_sample_mode_writes_folded_stacks(tmp_path):
+    profiler = core.profiling.Profiler({'duration': 0.2, 'interval': 0.005, 'path': str(tmp_path)}, "measure")
+    profiler.request()
+    profiler.poll()
+    end = time.monotonic() + 0.2
+    while time.monotonic() < end:
+        busy_work()
+
+    file_name = wait_for_file(profiler)
+    assert file_name.startswith(str(tmp_path / "measure-")) and file_name.endswith(".folded")
+    with open(file_name) as f:
+        lines = f.read().splitlines()
+    stacks = dict(line.rsplit(" ", 1) for line in lines)
+    assert any(stack.startswith("main;") and "test_profiling.py:busy_work" in stack for stack in stacks)
+    assert not any(stack.startswith("profiler;") for stack in stacks)
+    assert all(int(count) > 0 for count in stacks.values())
+
+
+def test_cprofile_mode_stops_after_duration(tmp_path, clock):
+    profiler = core.profiling.Profiler({'mode': 'cprofile', 'duration': 10, 'path': str(tmp_path)}, "mqtt_out",
+                                       clock)
+    profiler.request()
+    profiler.poll()
+    busy_work()
+    profiler.request()  # ignored while running
+    profiler.poll()
+    clock.now = 9
+    profiler.poll()
+    assert profiler.profile is not None
+
+    clock.now = 10
+    profiler.poll()
+    assert profiler.profile is None
+    file_name = wait_for_file(profiler)
+    assert file_name.endswith(".prof")
+    functions = {name for _file, _line, name in pstats.Stats(file_name).stats}
+    assert "busy_work" in functions
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_disabled_ignores_requests_but_on_start_captures():
+    profiler = core.profiling.Profiler({'enabled': False}, "measure")
+    profiler.request()
+    assert not profiler.requested
+
+    assert core.profiling.Profiler({'on_start': True}, "measure").requested
@@ -0,0 +1,169 @@
+import array
+import asyncio
+import datetime
+import logging
+
+import pytest
+
+import core.device_modules.replay as replay
+import measure
+from conftest import FakeClock
+
+
+class CountingDevice:
+    def __init__(self):
+        self.count = 0
+
+    def initialise(self, interface):
+        pass
+
+    def sample(self):
+        self.count += 1
+        return {'count': self.count, 'voltage': 230.0 + self.count, 'on': self.count % 2 == 0}
+
+
+class AsyncDevice:
+    def initialise(self, interface):
+        pass
+
+    async def sample(self):
+        return {'value': 1.5}
+
+
+def write_recording(path, samples):
+    writer = replay.RecordWriter(str(path))
+    for timestamp, sample in samples:
+        writer.write(timestamp, sample)
+    writer.close()
+
+
+def make_replay(path, clock=None, **config):
+    device = replay.ReplayDevice({'path': str(path), **config}, {})
+    if clock is not None:
+        device.clock = clock
+    device.initialise(None)
+    return device
+
+
+def test_round_trip_keeps_types_and_mixed_samples(tmp_path):
+    path = tmp_path / "meter.rec"
+    samples = [(100.0, {'count': 1, 'voltage': 231.5, 'on': True}),
+               (101.0, {'count': 2, 'voltage': 232.5, 'on': False}),
+               (102.0, {'status': "fault", 'voltage': None}),
+               (103.0, {'count': 3, 'current': 1.25})]
+    write_recording(path, samples)
+    # appending in a later session writes its own schema
+    write_recording(path, [(104.0, {'count': 4, 'current': 1.5})])
+
+    records = list(replay.read_records(str(path)))
+    assert records == samples + [(104.0, {'count': 4, 'current': 1.5})]
+    assert type(records[0][1]['count']) is int and type(records[0][1]['on']) is bool
+
+
+def test_cut_off_record_ends_the_file(tmp_path):
+    path = tmp_path / "meter.rec"
+    write_recording(path, [(float(t), {'value': float(t)}) for t in range(3)])
+    with open(path, "r+b") as f:
+        f.truncate(path.stat().st_size - 3)
+    assert [t for t, _sample in replay.read_records(str(path))] == [0.0, 1.0]
+
+
+def test_recording_device_wraps_sync_and_async_samples(tmp_path):
+    device = replay.RecordingDevice(CountingDevice(), str(tmp_path / "sync.rec"))
+    assert device.sample() == {'count': 1, 'voltage': 231.0, 'on': False}
+    device.sample()
+    device.close()
+    assert [sample['count'] for _t, sample in replay.read_records(str(tmp_path / "sync.rec"))] == [1, 2]
+
+    device = replay.RecordingDevice(AsyncDevice(), str(tmp_path / "async.rec"))
+    assert asyncio.run(device.sample()) == {'value': 1.5}
+    device.close()
+    assert [sample for _t, sample in replay.read_records(str(tmp_path / "async.rec"))] == [{'value': 1.5}]
+
+
+def test_recording_blocks_and_unrecordable_samples(tmp_path, caplog):
+    class BlockDevice:
+        def __init__(self):
+            self.variables = None
+
+        def require_variables(self, variables):
+            self.variables = variables
+
+        def sample(self):
+            return {'v_in': array.array('d', [0.5, -0.5]), 'sample_rate': 860.0, 'other': object()}
+
+    wrapped = BlockDevice()
+    device = replay.RecordingDevice(wrapped, str(tmp_path / "burst.rec"))
+    device.require_variables({'v_in'})
+    assert wrapped.variables == {'v_in'}
+
+    device.sample()  # not recordable - the error is logged once only
+    device.sample()
+    wrapped.sample = lambda: {'v_in': array.array('d', [0.5, -0.5]), 'sample_rate': 860.0}
+    device.sample()
+    device.close()
+    errors = [record for record in caplog.records if record.levelno == logging.ERROR]
+    assert len(errors) == 1 and errors[0].exc_info is None and "object" in errors[0].getMessage()
+    assert device.failures == 2
+
+    [(_t, sample)] = replay.read_records(str(tmp_path / "burst.rec"))
+    assert sample == {'v_in': array.array('d', [0.5, -0.5]), 'sample_rate': 860.0}
+    device = replay.RecordingDevice(CountingDevice(), str(tmp_path / "meter.rec"))
+    assert not hasattr(device, 'require_variables')
+    device.close()
+
+
+def test_replay_in_real_time_and_faster(tmp_path, clock):
+    path = tmp_path / "meter.rec"
+    write_recording(path, [(1000.0 + t, {'value': t}) for t in range(10)])
+
+    device = make_replay(path, clock)
+    assert device.sample() == {'value': 0}
+    clock.now = 0.5
+    assert device.sample() == {'value': 0}
+    clock.now = 3
+    assert device.sample() == {'value': 3}
+
+    clock = FakeClock()
+    device = make_replay(path, clock, speed=4)
+    device.sample()
+    clock.now = 1
+    assert device.sample() == {'value': 4}
+
+
+def test_replay_as_fast_as_possible_loops(tmp_path):
+    path = tmp_path / "meter.rec"
+    write_recording(path, [(1000.0 + t, {'value': t}) for t in range(3)])
+
+    device = make_replay(path, speed=0, timestamp=True)
+    samples = [device.sample() for _ in range(5)]
+    assert [sample['value'] for sample in samples] == [0, 1, 2, 0, 1]
+    # later passes carry on from the end of the recording
+    times = [datetime.datetime.fromisoformat(sample['timestamp']).timestamp() for sample in samples]
+    assert times == pytest.approx([1000, 1001, 1002, 1003, 1004])
+
+    device = make_replay(path, speed=0, loop=False)
+    for _ in range(3):
+        device.sample()
+    with pytest.raises(EOFError):
+        device.sample()
+
+
+def test_measure_records_devices_with_record_set(tmp_path):
+    path = str(tmp_path / "meter.rec")
+    config = {
+        'interface': {'dummy': {'module': 'testing', 'class': 'Dummy'}},
+        'device': {'meter': {'module': 'testing', 'class': 'MockDeviceConstant', 'interface': 'dummy',
+                             'config': {'value': 230}, 'variables': {'variable': 'voltage'}, 'record': path}},
+        'calculation': {},
+        'pipelines': {'none': []},
+        'measurement': {'module': 'gen_sample', 'class': 'SingleSample', 'config': {'period': 1},
+                        'sensing_stacks': [{'device': 'meter', 'pipeline': 'none'}]},
+        'output': {},
+    }
+    framework = measure.BuildingBlockFramework(config, {})
+    framework.load_modules()
+    assert isinstance(framework.devices['meter'], replay.RecordingDevice)
+    framework.devices['meter'].sample()
+    framework.devices['meter'].close()
+    assert [sample for _t, sample in replay.read_records(path)] == [{'voltage': 230}]
@@ -0,0 +1,59 @@
+import array
+
+import numpy
+
+import core.report_by_exception
+from conftest import FakeClock
+
+
+def test_absolute_deadband():
+    rbe = core.report_by_exception.ReportByException({'deadband': 0.5}, {'timestamp', 'temperature'}, FakeClock())
+    assert rbe.should_publish({'timestamp': 't0', 'temperature': 20.0})
+    assert not rbe.should_publish({'timestamp': 't1', 'temperature': 20.4})
+    assert not rbe.should_publish({'timestamp': 't2', 'temperature': 19.6})
+    assert rbe.should_publish({'timestamp': 't3', 'temperature': 20.6})
+    # compared against the last sent value, not the last sample
+    assert not rbe.should_publish({'timestamp': 't4', 'temperature': 20.2})
+
+
+def test_percent_and_per_variable_deadband():
+    config = {'deadband_percent': 10, 'variables': {'power': {'deadband': 50}}}
+    rbe = core.report_by_exception.ReportByException(config, None, FakeClock())
+    assert rbe.should_publish({'current': 10.0, 'power': 1000})
+    assert not rbe.should_publish({'current': 10.9, 'power': 1049})
+    assert rbe.should_publish({'current': 11.1, 'power': 1000})
+    # power uses the larger of 50 and 10% of 1000
+    assert not rbe.should_publish({'current': 11.1, 'power': 1099})
+    assert rbe.should_publish({'current': 11.1, 'power': 1101})
+
+
+def test_non_numeric_and_changed_variables():
+    rbe = core.report_by_exception.ReportByException({'deadband': 100}, None, FakeClock())
+    assert rbe.should_publish({'state': 'idle', 'running': False})
+    assert not rbe.should_publish({'state': 'idle', 'running': False})
+    assert rbe.should_publish({'state': 'busy', 'running': False})
+    assert rbe.should_publish({'state': 'busy', 'running': True})
+    assert rbe.should_publish({'state': 'busy', 'running': True, 'extra': 1})
+
+
+def test_heartbeat(clock):
+    rbe = core.report_by_exception.ReportByException({'heartbeat': 60}, {'temperature'}, clock)
+    assert rbe.should_publish({'temperature': 20.0})
+    clock.now = 59
+    assert not rbe.should_publish({'temperature': 20.0})
+    clock.now = 60
+    assert rbe.should_publish({'temperature': 20.0})
+    clock.now = 90
+    assert not rbe.should_publish({'temperature': 20.0})
+
+
+def test_numpy_values_and_blocks():
+    rbe = core.report_by_exception.ReportByException({'deadband': 0.5}, None, FakeClock())
+    assert rbe.should_publish({'power': numpy.float64(10.0), 'samples': array.array('d', [1.0])})
+    assert not rbe.should_publish({'power': numpy.float64(10.2), 'samples': array.array('d', [1.0])})
+    assert rbe.should_publish({'power': numpy.int64(11), 'samples': array.array('d', [1.0])})
+    assert rbe.should_publish({'power': numpy.int64(11), 'samples': array.array('d', [2.0])})
+    # numpy arrays can not be compared to a single True or False - always a change
+    block = numpy.array([1.0, 2.0])
+    assert rbe.should_publish({'power': numpy.int64(11), 'samples': array.array('d', [2.0]), 'block': block})
+    assert rbe.should_publish({'power': numpy.int64(11), 'samples': array.array('d', [2.0]), 'block': block})
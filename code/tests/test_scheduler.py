@@ -0,0 +1,80 @@
+import asyncio
+import random
+
+import core.scheduler
+from core.measurement_modules import gen_sample
+from conftest import FakeClock
+
+
+def test_long_run_stays_aligned():
+    clock = FakeClock(1000.0)
+    scheduler = core.scheduler.DeadlineScheduler(1.0, clock=clock)
+    random.seed(1)
+    starts = []
+    for _ in range(100000):
+        scheduler.start()
+        starts.append(clock())
+        clock.advance(random.uniform(0, 0.6))  # sample time varies from cycle to cycle
+        clock.advance(scheduler.next_delay() + random.uniform(0, 0.005))  # asyncio.sleep oversleeps a little
+
+    anchor = starts[0]
+    assert max(abs(start - (anchor + k)) for k, start in enumerate(starts)) <= 0.005
+    assert scheduler.stats.overruns == 0
+    assert 0 < scheduler.stats.mean_lateness() <= 0.005
+    assert 0 < scheduler.stats.jitter() <= 0.005
+
+
+def test_skip_policy_keeps_to_the_grid():
+    clock = FakeClock(0)
+    scheduler = core.scheduler.DeadlineScheduler(1.0, "skip", clock=clock)
+    scheduler.start()
+    clock.advance(3.5)  # deadlines 1, 2 and 3 pass during the cycle
+    assert scheduler.next_delay() == 0.5
+    assert (scheduler.stats.overruns, scheduler.stats.missed) == (1, 3)
+    clock.advance(0.5)
+    scheduler.start()
+    clock.advance(0.1)
+    assert abs(scheduler.next_delay() - 0.9) < 1e-9
+    assert scheduler.stats.max_lateness == 0
+
+
+def test_catch_up_policy_runs_missed_cycles():
+    clock = FakeClock(0)
+    scheduler = core.scheduler.DeadlineScheduler(1.0, "catch_up", clock=clock)
+    scheduler.start()
+    clock.advance(3.5)
+    delays = [scheduler.next_delay()]
+    for _ in range(4):
+        scheduler.start()
+        clock.advance(0.1)
+        delays.append(scheduler.next_delay())
+        clock.advance(delays[-1])
+    # cycles for deadlines 1, 2 and 3 run straight away, then back on time for deadline 4
+    assert [round(delay, 6) for delay in delays] == [0, 0, 0, 0.2, 0.9]
+    assert (scheduler.stats.overruns, scheduler.stats.missed) == (1, 3)
+
+    clock.advance(50)  # t = 55
+    scheduler.start()
+    assert scheduler.next_delay() == 0
+    # only the last max_catch_up (10) missed deadlines, 46 to 55, are run late
+    assert scheduler.cycle == 46
+
+
+def test_measurement_module_uses_deadlines():
+    class Stack:
+        async def execute(self):
+            clock.advance(0.3)
+            return {"value": 1}
+
+    clock = FakeClock(0)
+    module = gen_sample.SingleSampleAvg({"period": 10, "n_samples": 5})
+    module.scheduler = core.scheduler.DeadlineScheduler(module.full_period / module.n_samples, clock=clock)
+    module.initialise([Stack()])
+
+    outputs = []
+    for _ in range(10):
+        delay, out = asyncio.run(module.loop())
+        outputs.append(out)
+        clock.advance(delay)
+    assert clock() == 20
+    assert outputs == [None] * 4 + [{"value": 1}] + [None] * 4 + [{"value": 1}]
@@ -0,0 +1,32 @@
+import asyncio
+
+import core.sensing_stack
+
+
+class Device:
+    def initialise(self, interface):
+        pass
+
+    def sample(self):
+        return {'voltage': 230.0, 'machine': "from device"}
+
+
+class Pipeline:
+    def execute(self, sample):
+        return {**sample}
+
+
+def execute(config):
+    stack = core.sensing_stack.SensingStack({'device': 'meter', 'pipeline': 'none', 'offload': False, **config})
+    stack.initialise({'meter': Device()}, {'none': Pipeline()})
+    return asyncio.run(stack.execute())
+
+
+def test_constants_and_prefix():
+    constants = {'machine': "Machine_1", 'phase': "three"}
+    assert execute({}) == {'voltage': 230.0, 'machine': "from device"}
+    # values from the pipeline take precedence over constants
+    assert execute({'constants': constants}) == {'voltage': 230.0, 'machine': "from device", 'phase': "three"}
+    assert execute({'prefix': "l1_"}) == {'l1_voltage': 230.0, 'l1_machine': "from device"}
+    assert execute({'constants': constants, 'prefix': "l1_"}) == \
+        {'l1_voltage': 230.0, 'l1_machine': "from device", 'l1_phase': "three"}
@@ -0,0 +1,37 @@
+import json
+
+import core.serialisation
+
+PAYLOAD = {"timestamp": "2024-01-01T00:00:00+00:00", "machine": "Machine_1", "current": 12.345,
+           "phases": [1, 2, 3], "flag": True, "none": None, "nested": {"é": "ü"}}
+
+
+def test_json_matches_json_transport():
+    serialise = core.serialisation.get_serialiser("json")
+    assert serialise(PAYLOAD) == json.dumps(PAYLOAD).encode()
+
+
+def test_serialisers_round_trip():
+    for name in core.serialisation.SERIALISERS:
+        serialise = core.serialisation.get_serialiser(name)
+        data = serialise(PAYLOAD)
+        assert isinstance(data, bytes)
+        if serialise is core.serialisation.msgpack_dumps:
+            assert core.serialisation.msgpack.unpackb(data) == PAYLOAD
+        else:
+            assert json.loads(data) == PAYLOAD
+
+
+def test_orjson_falls_back_for_unsupported_payloads():
+    if core.serialisation.orjson is None:
+        return
+    payload = {"big": 2 ** 70, 1: "non string key"}
+    assert core.serialisation.orjson_dumps(payload) == json.dumps(payload).encode()
+
+
+def test_unknown_or_missing_serialiser_uses_json(monkeypatch):
+    assert core.serialisation.get_serialiser("pickle") is core.serialisation.json_dumps
+    monkeypatch.setattr(core.serialisation, "orjson", None)
+    monkeypatch.setattr(core.serialisation, "msgpack", None)
+    for name in core.serialisation.SERIALISERS:
+        assert core.serialisation.get_serialiser(name) is core.serialisation.json_dumps
@@ -0,0 +1,56 @@
+from urllib.parse import urljoin
+
+import chevron
+
+import core.topic_template
+
+PAYLOAD = {"machine": "Machine_1", "phase": "single", "zero": 0, "none": None, "flag": False,
+           "html": "a&b<c>\"d\"", "nested": {"line": 3}, "list": ["x", "y"]}
+
+TOPICS = [
+    "power_monitoring/Machine_1",
+    "power_monitoring/{{machine}}/{{phase}}",
+    "{{zero}}/{{none}}/{{flag}}/{{missing}}",
+    "{{html}}/{{{html}}}/{{&html}}",
+    "{{nested.line}}/{{list.1}}/{{ machine }}",
+    "{{#flag}}on{{/flag}}{{^flag}}off{{/flag}}/{{machine}}",
+]
+
+
+def test_topics_match_chevron():
+    for base in ("", "site/"):
+        cache = core.topic_template.TopicCache(base)
+        for topic in TOPICS:
+            expected = chevron.render(urljoin(base, topic), PAYLOAD)
+            assert cache.render(topic, PAYLOAD) == expected
+            assert cache.render(topic, PAYLOAD) == expected
+
+
+def test_topic_kinds_and_variables():
+    cache = core.topic_template.TopicCache()
+    literal = cache.compile("power_monitoring/Machine_1")
+    assert isinstance(literal, core.topic_template.LiteralTopic)
+    compiled = cache.compile("power_monitoring/{{machine}}/{{phase}}")
+    assert isinstance(compiled, core.topic_template.CompiledTopic)
+    assert compiled.variables == ("machine", "phase")
+    assert isinstance(cache.compile("{{#flag}}on{{/flag}}"), core.topic_template.ChevronTopic)
+    assert cache.render("{{machine}}", ["not", "a", "dict"]) == ""
+
+
+def test_cache_is_bounded():
+    cache = core.topic_template.TopicCache(max_size=4)
+    for i in range(10):
+        assert cache.render(f"topic/{i}/{{{{machine}}}}", PAYLOAD) == f"topic/{i}/Machine_1"
+    assert cache.compile.cache_info().currsize == 4
+
+
+def test_lookup_and_escaping_match_chevron():
+    class Meter:
+        serial = "M&1"
+
+    payload = {"quote": "it's \"on\" & <off>", "empty": "", "empty_list": [], "float": 0.0, "number": 12.5,
+               "nested": {"list": [{"v": 1}], "none": None}, "meter": Meter(), "true": True}
+    for key in ["quote", "empty", "empty_list", "float", "number", "nested.list.0.v", "nested.none", "nested.nope",
+                "nested.list.5", "meter.serial", "true", "quote.x"]:
+        for topic in (f"t/{{{{{key}}}}}", f"t/{{{{{{{key}}}}}}}"):
+            assert core.topic_template.TopicCache().render(topic, payload) == chevron.render(topic, payload), topic
@@ -13,40 +13,65 @@ import time
 logger = logging.getLogger("config")
 
 
-def get_config(arg_module_file=None, arg_user_file=None):
+class ConfigError(Exception):
+    pass
+
+
+# At start up an invalid or missing config file is reported and the service module goes to sleep (see load_config).
+# When reloading a running service module (wait_on_error=False) a ConfigError is raised instead, so that the module
+# can carry on with the config it already has.
+def get_config(arg_module_file=None, arg_user_file=None, wait_on_error=True):
     user_config_file, user_config_src = select_file(
         arg_user_file, "USER_CONFIG_FILE", "./user_config/user_config.toml"
     )
 
-    user_config = load_config(user_config_file, user_config_src)
-    user_config_specified_module_config_file = user_config.get(
-        "module_config_file", None)
+    user_config = load_config(user_config_file, user_config_src, wait_on_error)
 
-    other_module_config_sources = [
-        (user_config_specified_module_config_file, "user config")]
-    module_config_file, module_config_src = select_file(
-        arg_module_file,
-        "MODULE_CONFIG_FILE",
-        "./module_config/module_config.toml",
-        other_sources=other_module_config_sources,
-    )
+    module_config_file, module_config_src = select_module_config_file(arg_module_file, user_config)
 
-    module_config = load_config(module_config_file, module_config_src)
+    module_config = load_config(module_config_file, module_config_src, wait_on_error)
 
     with open("./config_schema.json", "rb") as f:
         schema = json.load(f)
 
-    do_validate(module_config, schema, "module")
+    do_validate(module_config, schema, "module", wait_on_error)
 
     combined_config = combine(module_config, user_config)
     env_var_overwrite(combined_config)
 
-    do_validate(combined_config, schema, "combined")
+    do_validate(combined_config, schema, "combined", wait_on_error)
 
     logger.info(f"Final Config: {combined_config}")
     return combined_config
 
 
+def get_config_files(arg_module_file=None, arg_user_file=None):
+    """Returns the paths of the user and module config files that get_config would load"""
+    user_config_file, user_config_src = select_file(
+        arg_user_file, "USER_CONFIG_FILE", "./user_config/user_config.toml"
+    )
+    try:
+        user_config = load_config(user_config_file, user_config_src, wait_on_error=False)
+    except ConfigError:
+        user_config = {}
+    module_config_file, _module_config_src = select_module_config_file(arg_module_file, user_config)
+    return [user_config_file, module_config_file]
+
+
+def select_module_config_file(arg_module_file, user_config):
+    user_config_specified_module_config_file = user_config.get(
+        "module_config_file", None)
+
+    other_module_config_sources = [
+        (user_config_specified_module_config_file, "user config")]
+    return select_file(
+        arg_module_file,
+        "MODULE_CONFIG_FILE",
+        "./module_config/module_config.toml",
+        other_sources=other_module_config_sources,
+    )
+
+
 def select_file(arg_file, env_var, default, other_sources=[]):
     config_file = (default, "default")
     
@@ -65,13 +90,17 @@ def select_file(arg_file, env_var, default, other_sources=[]):
     return config_file
 
 
-def load_config(filename, src):
+def load_config(filename, src, wait_on_error=True):
     try:
         with open(filename, "rb") as f:
             config = tomllib.load(f)
         logger.info(f'Loaded config file "{filename}" specified in {src}')
         return config
-    except FileNotFoundError:
+    except (FileNotFoundError, tomllib.TOMLDecodeError) as e:
+        if not wait_on_error:
+            raise ConfigError(f'Unable to load config file "{filename}" specified by {src}: {e}')
+        if isinstance(e, tomllib.TOMLDecodeError):
+            raise
         logger.critical(
             f'Config File Not Found - unable to load config file "{filename}" specified by {src}.')
         logger.critical("Unable to start solution - please specify a valid config file or make sure the service module can access the file specified")
@@ -80,11 +109,13 @@ def load_config(filename, src):
             time.sleep(36000)        
 
 
-def do_validate(config, schema, label=""):
+def do_validate(config, schema, label="", wait_on_error=True):
     try:
         jsonschema.validate(instance=config, schema=schema,
                             format_checker=jsonschema.Draft202012Validator.FORMAT_CHECKER)
     except jsonschema.ValidationError as v_err:
+        if not wait_on_error:
+            raise ConfigError(f"CONFIG ERROR on {label} - {v_err.json_path} >> {v_err.message}")
         logger.critical(
             f"CONFIG ERROR on {label} - {v_err.json_path} >> {v_err.message}")
         logger.critical("Config File is not valid -- unable to start the solution -- please correct the issues flagged above and try again.")